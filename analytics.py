@@ -0,0 +1,595 @@
+# analytics.py
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+from db import decode_tags, strategy_label
+
+# --- محاسبه PnL و R:R ---
+def calculate_pnl_and_rr(trade_data):
+    entry = trade_data.get("entry_price", 0)
+    exit_p = trade_data.get("exit_price", 0)
+    qty = trade_data.get("qty", 0)
+    side = (trade_data.get("side") or "").lower()
+    risk = trade_data.get("risk") or 0  # ریسک ثبت‌نشده (None) یعنی R:R صفر
+    leverage = trade_data.get("leverage", 1.0)
+    trade_type = trade_data.get("trade_type", "spot")
+
+    if side == "buy":
+        pnl = (exit_p - entry) * qty * (leverage if trade_type == "futures" else 1)
+    elif side == "sell":
+        pnl = (entry - exit_p) * qty * (leverage if trade_type == "futures" else 1)
+    else:
+        return 0, 0
+
+    rr = pnl / risk if risk > 0 else 0
+    return round(pnl, 2), round(rr, 2)
+
+# --- نسخه دسته‌ای (برداری) با کارمزد و فاندینگ ---
+# نرخ کارمزد maker/taker به صورت کسری از ارزش معامله
+FEE_SCHEDULES = {
+    "none": {"maker": 0.0, "taker": 0.0},
+    "binance_spot": {"maker": 0.001, "taker": 0.001},
+    "binance_futures": {"maker": 0.0002, "taker": 0.0005},
+    "bybit_futures": {"maker": 0.0002, "taker": 0.00055},
+}
+
+def fee_rates(schedule="none", entry="taker", exit="taker"):
+    """(نرخ کارمزد ورود، نرخ کارمزد خروج) برای یک جدول کارمزد و نوع سفارش‌ها"""
+    fees = FEE_SCHEDULES[schedule]
+    return fees[entry], fees[exit]
+
+def calculate_pnl_and_rr_df(df, entry_fee=0.0, exit_fee=0.0, funding_rate=0.0):
+    """معادل calculate_pnl_and_rr روی ستون‌های df؛ خروجی: (آرایه pnl، آرایه rr).
+
+    entry_fee و exit_fee نرخ کارمزد روی ارزش ورود/خروج هستند و funding_rate
+    نرخ کل فاندینگ روی ارزش ورود (فقط futures) با علامت صرافی: نرخ مثبت را
+    long می‌پردازد و short دریافت می‌کند، نرخ منفی برعکس. هر سه می‌توانند عدد یا
+    آرایه هم‌طول df باشند؛ با مقدار صفر خروجی دقیقاً همان نسخه تکی است.
+    """
+    entry = df["entry_price"].to_numpy(dtype="float64", na_value=np.nan)
+    exit_p = df["exit_price"].to_numpy(dtype="float64", na_value=np.nan)
+    qty = df["qty"].to_numpy(dtype="float64", na_value=np.nan)
+    risk = df["risk"].to_numpy(dtype="float64", na_value=np.nan)
+    leverage = df["leverage"].to_numpy(dtype="float64", na_value=np.nan)
+    futures = (df["trade_type"] == "futures").to_numpy()
+    side = df["side"].fillna("").str.lower().to_numpy()
+
+    multiplier = np.where(futures, leverage, 1.0)
+    direction = np.select([side == "buy", side == "sell"], [1.0, -1.0], 0.0)
+    pnl = direction * (exit_p - entry) * qty * multiplier
+
+    entry_notional = entry * qty * multiplier
+    costs = entry_notional * entry_fee + exit_p * qty * multiplier * exit_fee
+    # فاندینگ در جهت پوزیشن: برای short با نرخ مثبت هزینه منفی (دریافتی) است
+    costs = costs + np.where(futures, direction * entry_notional * funding_rate, 0.0)
+    pnl = np.where(direction != 0, pnl - costs, 0.0)
+    # ردیف‌های ناقص (مثلاً قیمت NULL) مثل جهت نامعتبر صفر می‌شوند
+    pnl = np.where(np.isfinite(pnl), pnl, 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rr = np.where(risk > 0, pnl / risk, 0.0)
+    return _round_like_python(pnl), _round_like_python(rr)
+
+def _round_like_python(values, ndigits=2):
+    """np.round(values, ndigits) با همان نتیجه round پایتون.
+
+    np.round مقدار را در 10**ndigits ضرب می‌کند و خطای این ضرب گاهی مقدار
+    نزدیک مرز .5 را به سمت دیگر می‌برد (9.555 -> 9.56 به جای 9.55). فقط همین
+    مقادیر نادر با round پایتون دوباره گرد می‌شوند.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+# ================================
+# 🔍 تشخیص الگوی رفتاری
+# ================================
+
+def learn_user_pattern(trades, lookback=5):
+    if len(trades) < 3:
+        return None
+    recent = trades[:lookback]
+    
+    symbols = [t['symbol'] for t in recent]
+    sides = [t['side'] for t in recent]
+    types = [t['trade_type'] for t in recent]
+    leverages = [t['leverage'] for t in recent]
+    contexts = [t.get('market_context') or 'not_set' for t in recent]
+    tags = [tag for t in recent for tag in t.get('psychological_tags', [])]
+
+    return {
+        'common_symbols': set(symbols),
+        'common_side': max(set(sides), key=sides.count),
+        'common_type': max(set(types), key=types.count),
+        'avg_leverage': sum(leverages) / len(leverages),
+        'common_contexts': set(contexts),
+        'common_tags': set(tags),
+    }
+
+def check_deviation(new_trade, pattern):
+    if not pattern:
+        return 0.0
+    score = 0
+    total = 0
+
+    total += 1
+    if new_trade['symbol'] not in pattern['common_symbols']:
+        score += 1
+
+    total += 1
+    if new_trade['side'] != pattern['common_side']:
+        score += 1
+
+    total += 1
+    if new_trade['trade_type'] != pattern['common_type']:
+        score += 1
+
+    total += 1
+    if abs(new_trade['leverage'] - pattern['avg_leverage']) > pattern['avg_leverage'] * 0.8:
+        score += 1
+
+    total += 1
+    current_ctx = new_trade.get('market_context') or 'not_set'
+    if current_ctx not in pattern['common_contexts']:
+        score += 1
+
+    total += 1
+    new_tags = set(new_trade.get('psychological_tags', []))
+    if not (new_tags & pattern['common_tags']):
+        score += 1
+
+    return score / total
+
+# ================================
+# 🚀 تکامل رفتاری (Behavioral Evolution)
+# ================================
+
+def analyze_evolution(trades):
+    if len(trades) < 8:
+        return None
+        
+    mid = len(trades) // 2
+    early = trades[mid:]   # اول دوره
+    recent = trades[:mid]  # آخر دوره
+    
+    def get_behavioral_score(trade_list):
+        score = 0
+        for t in trade_list:
+            tags = t.get('psychological_tags', [])
+            hour = t.get('trade_hour')
+            if hour is None:
+                hour = datetime.fromisoformat(t['trade_date']).hour
+            if 'revenge' in tags or 'انتقام' in tags:
+                score += 2
+            if 'FOMO' in tags or 'fomo' in tags or 'هیجان' in tags:
+                score += 1.5
+            if 'fear' in tags or 'ترس' in tags:
+                score += 1
+            if 2 <= hour <= 5:
+                score += 1
+        return score / len(trade_list) if trade_list else 0
+
+    early_score = get_behavioral_score(early)
+    recent_score = get_behavioral_score(recent)
+    
+    if early_score == 0:
+        improvement = 100.0
+    else:
+        improvement = ((early_score - recent_score) / early_score) * 100
+
+    return {
+        "improvement": improvement,
+        "early_avg_rr": avg(t['rr_calculated'] for t in early if t['profit_or_loss'] > 0),
+        "recent_avg_rr": avg(t['rr_calculated'] for t in recent if t['profit_or_loss'] > 0),
+        "trend": "improving" if improvement > 15 else "needs_attention"
+    }
+
+# --- میانگین ---
+def avg(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else 0.0
+
+# ================================
+# 📊 تحلیل عملکرد بر اساس استراتژی
+# ================================
+
+def analyze_strategy_performance(trades, strategy_names=None):
+    """تحلیل عملکرد معاملات بر اساس استراتژی؛ strategy_names: id -> نام (load_strategy_names)"""
+    if len(trades) == 0:
+        return []
+
+    strategy_data = {}
+    for t in trades:
+        sid = t.get('strategy_id') or 'no_strategy'
+        name = strategy_label(t['strategy_id'], (strategy_names or {}).get(t['strategy_id']))
+        
+        if sid not in strategy_data:
+            strategy_data[sid] = {
+                "name": name,
+                "pnl": 0,
+                "rr_sum": 0,
+                "count": 0,
+                "wins": 0,
+                "losses": 0
+            }
+        
+        strategy_data[sid]["pnl"] += t["profit_or_loss"]
+        strategy_data[sid]["rr_sum"] += t["rr_calculated"]
+        strategy_data[sid]["count"] += 1
+        if t["profit_or_loss"] > 0:
+            strategy_data[sid]["wins"] += 1
+        else:
+            strategy_data[sid]["losses"] += 1
+
+    results = []
+    for sid, data in strategy_data.items():
+        avg_rr = data["rr_sum"] / data["count"] if data["count"] > 0 else 0
+        win_rate = data["wins"] / data["count"] if data["count"] > 0 else 0
+        
+        results.append({
+            "strategy_name": data["name"],
+            "total_pnl": round(data["pnl"], 2),
+            "avg_rr": round(avg_rr, 2),
+            "win_rate": round(win_rate, 2),
+            "trade_count": data["count"],
+            "wins": data["wins"],
+            "losses": data["losses"]
+        })
+    
+    return sorted(results, key=lambda x: x["total_pnl"], reverse=True)
+
+# ================================
+# 🔀 تشخیص تغییر استراتژی
+# ================================
+
+def detect_strategy_change(trades):
+    """آیا کاربر استراتژی خودش رو تغییر داده؟"""
+    if len(trades) < 5:
+        return None
+        
+    first = trades[-5:]  # اول دوره
+    last = trades[:5]   # آخر دوره
+    
+    first_strategies = [t.get('strategy_id') for t in first if t.get('strategy_id')]
+    last_strategies = [t.get('strategy_id') for t in last if t.get('strategy_id')]
+    
+    if not first_strategies or not last_strategies:
+        return None
+        
+    first_mode = max(set(first_strategies), key=first_strategies.count)
+    last_mode = max(set(last_strategies), key=last_strategies.count)
+    
+    if first_mode != last_mode:
+        return {
+            "changed": True,
+            "from": f"Strategy {first_mode}",
+            "to": f"Strategy {last_mode}"
+        }
+    return {"changed": False}
+
+# ================================
+# 🔤 لیست نمادهای اخیر
+# ================================
+
+def get_recent_symbols(trades, limit=10):
+    """لیست نمادهای اخیر را برمی‌گرداند"""
+    symbols = [t['symbol'] for t in trades if t['symbol']]
+    seen = set()
+    unique = []
+    for s in symbols:
+        if s not in seen:
+            seen.add(s)
+            unique.append(s)
+    return unique[:limit]
+
+# ================================
+# ⚡ نسخه برداری تحلیل‌ها (روی DataFrame)
+# ================================
+
+def _tag_values(df, fn, dtype="float64"):
+    """fn را روی هر ترکیب یکتای برچسب‌ها اجرا و نتیجه را به همه ردیف‌ها پخش می‌کند"""
+    cat = df["tags_json"].cat
+    values = np.empty(len(cat.categories) + 1, dtype=dtype)
+    for i, raw in enumerate(cat.categories):
+        values[i] = fn(decode_tags(raw))
+    values[-1] = fn([])
+    return values[cat.codes.to_numpy()]
+
+def _mode(series):
+    counts = series.value_counts()
+    return min(counts.index[counts == counts.max()])
+
+def learn_user_pattern_df(df, lookback=5):
+    """معادل learn_user_pattern روی خروجی load_trades_frame"""
+    if len(df) < 3:
+        return None
+    recent = df.head(lookback)
+    contexts = recent["market_context"].fillna("").replace("", "not_set")
+    tags = {tag for tag_list in recent["psychological_tags"] for tag in tag_list}
+
+    return {
+        'common_symbols': set(recent["symbol"]),
+        'common_side': _mode(recent["side"]),
+        'common_type': _mode(recent["trade_type"]),
+        'avg_leverage': float(recent["leverage"].sum() / len(recent)),
+        'common_contexts': set(contexts),
+        'common_tags': tags,
+    }
+
+def _behavioral_tag_score(tags):
+    score = 0
+    if 'revenge' in tags or 'انتقام' in tags:
+        score += 2
+    if 'FOMO' in tags or 'fomo' in tags or 'هیجان' in tags:
+        score += 1.5
+    if 'fear' in tags or 'ترس' in tags:
+        score += 1
+    return score
+
+def analyze_evolution_df(df):
+    """معادل analyze_evolution روی خروجی load_trades_frame"""
+    n = len(df)
+    if n < 8:
+        return None
+
+    mid = n // 2
+    hours = df["trade_hour"].to_numpy(dtype="float64", na_value=np.nan)
+    scores = _tag_values(df, _behavioral_tag_score) + ((hours >= 2) & (hours <= 5))
+    recent_score = scores[:mid].sum() / mid if mid else 0
+    early_score = scores[mid:].sum() / (n - mid)
+
+    if early_score == 0:
+        improvement = 100.0
+    else:
+        improvement = ((early_score - recent_score) / early_score) * 100
+
+    pnl = df["profit_or_loss"].to_numpy()
+    rr = df["rr_calculated"].to_numpy()
+    winning_rr = np.where((pnl > 0) & ~np.isnan(rr), rr, np.nan)
+
+    def avg_of(values):
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if len(values) else 0.0
+
+    return {
+        "improvement": float(improvement),
+        "early_avg_rr": avg_of(winning_rr[mid:]),
+        "recent_avg_rr": avg_of(winning_rr[:mid]),
+        "trend": "improving" if improvement > 15 else "needs_attention"
+    }
+
+def analyze_strategy_performance_df(df, strategy_names=None):
+    """معادل analyze_strategy_performance روی خروجی load_trades_frame"""
+    if len(df) == 0:
+        return []
+
+    key = df["strategy_id"].fillna(0).to_numpy(dtype="int64")
+    pnl = df["profit_or_loss"].to_numpy()
+    grouped = pd.DataFrame({
+        "key": key,
+        "pnl": pnl,
+        "rr": df["rr_calculated"].to_numpy(),
+        "win": pnl > 0,
+    }).groupby("key", sort=False).agg(
+        pnl=("pnl", "sum"), rr_sum=("rr", "sum"), count=("pnl", "size"), wins=("win", "sum")
+    )
+
+    results = []
+    for sid, row in zip(grouped.index, grouped.itertuples(index=False)):
+        count = int(row.count)
+        wins = int(row.wins)
+        results.append({
+            "strategy_name": strategy_label(sid, (strategy_names or {}).get(sid)),
+            "total_pnl": round(float(row.pnl), 2),
+            "avg_rr": round(float(row.rr_sum) / count, 2),
+            "win_rate": round(wins / count, 2),
+            "trade_count": count,
+            "wins": wins,
+            "losses": count - wins
+        })
+
+    return sorted(results, key=lambda x: x["total_pnl"], reverse=True)
+
+def detect_strategy_change_df(df):
+    """معادل detect_strategy_change روی خروجی load_trades_frame"""
+    if len(df) < 5:
+        return None
+
+    first = df["strategy_id"].iloc[-5:]
+    last = df["strategy_id"].iloc[:5]
+    first = first[first.fillna(0) != 0]
+    last = last[last.fillna(0) != 0]
+
+    if first.empty or last.empty:
+        return None
+
+    first_mode = int(_mode(first))
+    last_mode = int(_mode(last))
+
+    if first_mode != last_mode:
+        return {
+            "changed": True,
+            "from": f"Strategy {first_mode}",
+            "to": f"Strategy {last_mode}"
+        }
+    return {"changed": False}
+
+def get_recent_symbols_df(df, limit=10):
+    """معادل get_recent_symbols روی خروجی load_trades_frame"""
+    symbols = df["symbol"]
+    symbols = symbols[symbols.notna() & (symbols != "")]
+    return symbols.drop_duplicates().head(limit).tolist()
+
+def summarize_trades_df(df, strategy_names=None):
+    """همان خروجی load_trade_summary ولی برای یک بازه فیلترشده از معاملات"""
+    pnl = df["profit_or_loss"].to_numpy()
+    trade_count = len(df)
+    wins = int((pnl > 0).sum())
+    return {
+        "total_pnl": float(np.nansum(pnl)),
+        "trade_count": trade_count,
+        "wins": wins,
+        "losses": trade_count - wins,
+        "win_rate": wins / trade_count if trade_count else 0,
+        "strategies": analyze_strategy_performance_df(df, strategy_names)
+    }
+
+# ================================
+# 🧭 امتیاز انحراف برای کل تاریخچه
+# ================================
+
+def _prev_counts(codes, n_categories, lookback):
+    """برای هر ردیف، تعداد هر دسته در lookback ردیف قبلی (آرایه n×k)"""
+    n = len(codes)
+    onehot = np.zeros((n + 1, n_categories), dtype=np.int32)
+    onehot[np.arange(1, n + 1), codes] = 1
+    cum = onehot.cumsum(axis=0)
+    idx = np.arange(n)
+    return cum[idx] - cum[np.maximum(idx - lookback, 0)]
+
+def _seen_recently(codes, lookback):
+    """آیا مقدار هر ردیف در lookback ردیف قبلی تکرار شده است"""
+    seen = np.zeros(len(codes), dtype=bool)
+    for k in range(1, lookback + 1):
+        seen[k:] |= codes[k:] == codes[:-k]
+    return seen
+
+def _shared_tag_pairs(combos, left, right):
+    """آیا ترکیب برچسب left[i] و right[i] (اندیس در combos) برچسب مشترک دارند.
+
+    هر جفت یکتا یک بار بررسی می‌شود: برچسب‌های ترکیب چپ در کلیدهای مرتب
+    (ترکیب، برچسب) ترکیب راست با searchsorted جستجو می‌شوند.
+    """
+    vocab = {tag: i for i, tag in enumerate(set().union(*combos))}
+    n_vocab = max(len(vocab), 1)
+    sizes = np.array([len(tags) for tags in combos], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    flat = np.array([vocab[tag] for tags in combos for tag in tags], dtype=np.int64)
+    members = np.sort(np.repeat(np.arange(len(combos), dtype=np.int64), sizes) * n_vocab + flat)
+    if not len(members):
+        return np.zeros(len(left), dtype=bool)
+
+    pairs, inverse = np.unique(left * len(combos) + right, return_inverse=True)
+    a, b = np.divmod(pairs, len(combos))
+    counts = sizes[a]
+    pair_idx = np.repeat(np.arange(len(pairs)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    query = b[pair_idx] * n_vocab + flat[offsets[a][pair_idx] + within]
+    found = members[np.minimum(np.searchsorted(members, query), len(members) - 1)] == query
+    return (np.bincount(pair_idx[found], minlength=len(pairs)) > 0)[inverse.ravel()]
+
+def score_deviation_df(df, lookback=5):
+    """check_deviation برای همه معاملات در یک گذر: هر معامله با الگوی lookback
+    معامله قبل از خودش (learn_user_pattern_df) مقایسه می‌شود.
+
+    خروجی هم‌ترتیب df است؛ برای معاملاتی که کمتر از ۳ معامله قبلی دارند NaN.
+    """
+    n = len(df)
+    if n == 0:
+        return np.empty(0)
+    chrono = df.iloc[::-1]
+
+    symbol_codes = pd.factorize(chrono["symbol"])[0]
+    contexts = chrono["market_context"].fillna("").replace("", "not_set")
+    context_codes = pd.factorize(contexts)[0]
+    score = (~_seen_recently(symbol_codes, lookback)).astype("float64")
+    score += ~_seen_recently(context_codes, lookback)
+
+    # جهت و نوع: مقایسه با پرتکرارترین مقدار (در تساوی کوچک‌ترین، چون factorize مرتب است)
+    for column in ("side", "trade_type"):
+        codes, uniques = pd.factorize(chrono[column].fillna(""), sort=True)
+        mode = _prev_counts(codes, len(uniques), lookback).argmax(axis=1)
+        score += codes != mode
+
+    leverage = chrono["leverage"].to_numpy(dtype="float64", na_value=np.nan)
+    cum = np.concatenate([[0.0], np.nancumsum(leverage)])
+    idx = np.arange(n)
+    start = np.maximum(idx - lookback, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg = (cum[idx] - cum[start]) / (idx - start)
+    score += np.abs(leverage - avg) > avg * 0.8
+
+    # برچسب‌ها: اشتراک فقط برای جفت ترکیب‌هایی حساب می‌شود که واقعاً در پنجره
+    # کنار هم آمده‌اند؛ حافظه O(n·lookback) است، نه مربع تعداد ترکیب‌های یکتا
+    cat = chrono["tags_json"].cat
+    combos = [list(set(decode_tags(raw))) for raw in cat.categories] + [[]]
+    tag_codes = cat.codes.to_numpy().astype(np.int64)
+    tag_codes[tag_codes < 0] = len(combos) - 1
+    shared = np.zeros(n, dtype=bool)
+    lags = range(1, min(lookback, n - 1) + 1)
+    if len(lags):
+        pair_shared = _shared_tag_pairs(
+            combos,
+            np.concatenate([tag_codes[k:] for k in lags]),
+            np.concatenate([tag_codes[:-k] for k in lags]),
+        )
+        start = 0
+        for k in lags:
+            shared[k:] |= pair_shared[start:start + n - k]
+            start += n - k
+    score += ~shared
+
+    result = score / 6
+    result[:3] = np.nan
+    return result[::-1]
+
+def deviation_outcomes_df(df, scores):
+    """نتیجه معاملات به تفکیک تعداد عامل‌های انحراف (۰ تا ۶)"""
+    valid = ~np.isnan(scores)
+    frame = pd.DataFrame({
+        "deviating_factors": np.rint(scores[valid] * 6).astype(int),
+        "pnl": df["profit_or_loss"].to_numpy()[valid],
+        "rr": df["rr_calculated"].to_numpy()[valid],
+    })
+    grouped = frame.groupby("deviating_factors")
+    return pd.DataFrame({
+        "trades": grouped.size(),
+        "win_rate": grouped["pnl"].apply(lambda s: (s > 0).mean()),
+        "avg_pnl": grouped["pnl"].mean(),
+        "avg_rr": grouped["rr"].mean(),
+    }).reset_index()
+
+# ================================
+# 📉 کاهش نقاط نمودار (LTTB)
+# ================================
+
+def lttb_indices(x, y, threshold):
+    """اندیس نقاط انتخابی Largest-Triangle-Three-Buckets؛ شکل سری (قله‌ها و
+    دره‌ها) حفظ می‌شود و حداکثر threshold نقطه می‌ماند. اولین و آخرین نقطه همیشه هستند."""
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold-2 سطل بین نقطه اول و آخر
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # مساحت مثلث (نقطه قبلی، هر نقطه این سطل، میانگین سطل بعد)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def downsample_series(df, x, y, max_points):
+    """ردیف‌های df را با LTTB روی ستون‌های x و y به حداکثر max_points کاهش می‌دهد"""
+    if len(df) <= max_points:
+        return df
+    xs = df[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xs = xs.astype("int64")
+    return df.iloc[lttb_indices(xs, df[y], max_points)]
@@ -1,12 +1,32 @@
 # app.py
 import streamlit as st
-import sqlite3
-import json
-from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+import logging
 import plotly.express as px
+import numpy as np
 import pandas as pd
+import tempfile
+import time
+
+from db import (
+    DEFAULT_USER, JournalPool, MAX_OPEN_JOURNALS, connect_db, save_trade, save_strategy,
+    load_recent_symbols, load_strategies, load_symbols,
+    load_pnl_buckets, load_rollup_summary, load_rule_stats, load_tag_stats, load_tags,
+    load_trades_frame, query_trades, search_trades, PNL_BUCKETS,
+)
+from analytics import (
+    FEE_SCHEDULES, calculate_pnl_and_rr, check_deviation, learn_user_pattern_df,
+    analyze_evolution_df, detect_strategy_change_df, summarize_trades_df,
+    downsample_series, score_deviation_df, deviation_outcomes_df,
+)
+from exporter import EXPORT_FORMATS, PARQUET_MISSING, export_trades, format_available
+from i18n import LANGUAGES, is_rtl, shape_rtl, translator
+from importer import CSV_FORMATS, import_trades_csv
+from montecarlo import MIN_SAMPLES, outcome_samples, simulate
+from whatif import PRESET_SCENARIOS, compare_scenarios
+from profiler import RerunProfiler
+from profiles import ProfileEngine
+from reports import ReportWorker, build_report
+from risk import RiskEngine, equity_curve_df, risk_metrics_df
 
 # --- session_state ---
 if 'pre_trade_data' not in st.session_state:
@@ -18,459 +38,99 @@ if 'exit_conditions' not in st.session_state:
 
 # --- پشتیبانی از فارسی ---
 def fa(text):
-    try:
-        reshaped = arabic_reshaper.reshape(str(text))
-        return get_display(reshaped)
-    except:
-        return str(text)
+    return shape_rtl(str(text))
 
 def html_rtl(text):
-    try:
-        reshaped = arabic_reshaper.reshape(str(text))
-        display = get_display(reshaped)
-    except:
-        display = str(text)
-    return f'<div dir="rtl" style="font-family: Tahoma, sans-serif; font-size: 16px; text-align: right;">{display}</div>'
-
-# --- اتصال به دیتابیس ---
-def connect_db():
-    return sqlite3.connect('journal.db')
-
-def create_tables(conn):
-    cur = conn.cursor()
-    cur.executescript("""
-        CREATE TABLE IF NOT EXISTS trades (
-            id INTEGER PRIMARY KEY,
-            symbol TEXT,
-            entry_price REAL,
-            exit_price REAL,
-            side TEXT,
-            qty REAL,
-            risk REAL,
-            trade_type TEXT,
-            leverage REAL,
-            psychological_tags TEXT,
-            market_context TEXT,
-            strategy_id INTEGER,
-            profit_or_loss REAL,
-            rr_calculated REAL,
-            trade_date TEXT,
-            strategy_compliance_rate REAL,
-            strategy_missing_rules TEXT
-        );
-        CREATE TABLE IF NOT EXISTS strategies (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE,
-            description TEXT,
-            entry_rules TEXT,
-            exit_rules TEXT,
-            created_at TEXT
-        );
-    """)
-    conn.commit()
-
-# --- محاسبه PnL و R:R ---
-def calculate_pnl_and_rr(trade_data):
-    entry = trade_data.get("entry_price", 0)
-    exit_p = trade_data.get("exit_price", 0)
-    qty = trade_data.get("qty", 0)
-    side = (trade_data.get("side") or "").lower()
-    risk = trade_data.get("risk", 0)
-    leverage = trade_data.get("leverage", 1.0)
-    trade_type = trade_data.get("trade_type", "spot")
-
-    if side == "buy":
-        pnl = (exit_p - entry) * qty * (leverage if trade_type == "futures" else 1)
-    elif side == "sell":
-        pnl = (entry - exit_p) * qty * (leverage if trade_type == "futures" else 1)
-    else:
-        return 0, 0
-
-    rr = pnl / risk if risk > 0 else 0
-    return round(pnl, 2), round(rr, 2)
-
-# --- بارگذاری معاملات ---
-def load_trades(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM trades ORDER BY trade_date DESC")
-    rows = cur.fetchall()
-    trades = []
-    for r in rows:
-        trade = {
-            "id": r[0], "symbol": r[1], "entry_price": r[2], "exit_price": r[3],
-            "side": r[4], "qty": r[5], "risk": r[6], "trade_type": r[7],
-            "leverage": r[8], "market_context": r[10],
-            "profit_or_loss": r[12], "rr_calculated": r[13], "trade_date": r[14],
-            "strategy_id": r[11],
-            "strategy_compliance_rate": r[15],
-            "strategy_missing_rules": r[16]
-        }
-        try:
-            trade["psychological_tags"] = json.loads(r[9]) if r[9] else []
-        except:
-            trade["psychological_tags"] = []
-        trades.append(trade)
-    return trades
-
-# --- ذخیره معامله ---
-def save_trade(conn, data):
-    tags_json = json.dumps(data.get("psychological_tags", []), ensure_ascii=False)
-    missing_json = json.dumps(data.get("strategy_missing_rules", []), ensure_ascii=False)
-    date = data.get("trade_date") or datetime.now().isoformat()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO trades (symbol, entry_price, exit_price, side, qty, risk,
-                            trade_type, leverage, psychological_tags,
-                            market_context, strategy_id, profit_or_loss,
-                            rr_calculated, trade_date, strategy_compliance_rate,
-                            strategy_missing_rules)
-        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-    """, (
-        data["symbol"], data["entry_price"], data["exit_price"], data["side"],
-        data["qty"], data["risk"], data["trade_type"], data["leverage"],
-        tags_json, data.get("market_context"), data.get("strategy_id"),
-        data["profit_or_loss"], data["rr_calculated"], date,
-        data.get("strategy_compliance_rate"),
-        missing_json
-    ))
-    conn.commit()
-
-# --- بارگذاری استراتژی‌ها ---
-def load_strategies(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM strategies ORDER BY name")
-    rows = cur.fetchall()
-    strategies = []
-    for r in rows:
-        try:
-            entry_rules = json.loads(r[3]) if r[3] else []
-            exit_rules = json.loads(r[4]) if r[4] else []
-        except:
-            entry_rules = []
-            exit_rules = []
-        strategies.append({
-            "id": r[0],
-            "name": r[1],
-            "description": r[2],
-            "entry_rules": entry_rules,
-            "exit_rules": exit_rules,
-            "created_at": r[5]
-        })
-    return strategies
-
-# --- ذخیره استراتژی ---
-def save_strategy(conn, strategy_data):
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            INSERT INTO strategies (name, description, entry_rules, exit_rules, created_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            strategy_data['name'],
-            strategy_data['description'],
-            json.dumps(strategy_data['entry_rules'], ensure_ascii=False),
-            json.dumps(strategy_data['exit_rules'], ensure_ascii=False),
-            datetime.now().isoformat()
-        ))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False  # اسم تکراری
-
-# ================================
-# 🔍 تشخیص الگوی رفتاری
-# ================================
-
-def learn_user_pattern(trades, lookback=5):
-    if len(trades) < 3:
-        return None
-    recent = trades[:lookback]
-    
-    symbols = [t['symbol'] for t in recent]
-    sides = [t['side'] for t in recent]
-    types = [t['trade_type'] for t in recent]
-    leverages = [t['leverage'] for t in recent]
-    contexts = [t.get('market_context') or 'not_set' for t in recent]
-    tags = [tag for t in recent for tag in t.get('psychological_tags', [])]
-
-    return {
-        'common_symbols': set(symbols),
-        'common_side': max(set(sides), key=sides.count),
-        'common_type': max(set(types), key=types.count),
-        'avg_leverage': sum(leverages) / len(leverages),
-        'common_contexts': set(contexts),
-        'common_tags': set(tags),
-    }
-
-def check_deviation(new_trade, pattern):
-    if not pattern:
-        return 0.0
-    score = 0
-    total = 0
-
-    total += 1
-    if new_trade['symbol'] not in pattern['common_symbols']:
-        score += 1
-
-    total += 1
-    if new_trade['side'] != pattern['common_side']:
-        score += 1
-
-    total += 1
-    if new_trade['trade_type'] != pattern['common_type']:
-        score += 1
-
-    total += 1
-    if abs(new_trade['leverage'] - pattern['avg_leverage']) > pattern['avg_leverage'] * 0.8:
-        score += 1
-
-    total += 1
-    current_ctx = new_trade.get('market_context') or 'not_set'
-    if current_ctx not in pattern['common_contexts']:
-        score += 1
-
-    total += 1
-    new_tags = set(new_trade.get('psychological_tags', []))
-    if not (new_tags & pattern['common_tags']):
-        score += 1
-
-    return score / total
-
-# ================================
-# 🚀 تکامل رفتاری (Behavioral Evolution)
-# ================================
-
-def analyze_evolution(trades):
-    if len(trades) < 8:
-        return None
-        
-    mid = len(trades) // 2
-    early = trades[mid:]   # اول دوره
-    recent = trades[:mid]  # آخر دوره
-    
-    def get_behavioral_score(trade_list):
-        score = 0
-        for t in trade_list:
-            tags = t.get('psychological_tags', [])
-            hour = datetime.fromisoformat(t['trade_date']).hour
-            if 'revenge' in tags or 'انتقام' in tags:
-                score += 2
-            if 'FOMO' in tags or 'fomo' in tags or 'هیجان' in tags:
-                score += 1.5
-            if 'fear' in tags or 'ترس' in tags:
-                score += 1
-            if 2 <= hour <= 5:
-                score += 1
-        return score / len(trade_list) if trade_list else 0
-
-    early_score = get_behavioral_score(early)
-    recent_score = get_behavioral_score(recent)
-    
-    if early_score == 0:
-        improvement = 100.0
-    else:
-        improvement = ((early_score - recent_score) / early_score) * 100
-
-    return {
-        "improvement": improvement,
-        "early_avg_rr": avg(t['rr_calculated'] for t in early if t['profit_or_loss'] > 0),
-        "recent_avg_rr": avg(t['rr_calculated'] for t in recent if t['profit_or_loss'] > 0),
-        "trend": "improving" if improvement > 15 else "needs_attention"
-    }
-
-# --- میانگین ---
-def avg(values):
-    values = [v for v in values if v is not None]
-    return sum(values) / len(values) if values else 0.0
-
-# ================================
-# 📊 تحلیل عملکرد بر اساس استراتژی
-# ================================
-
-def analyze_strategy_performance(trades):
-    """تحلیل عملکرد معاملات بر اساس استراتژی"""
-    if len(trades) == 0:
-        return []
-
-    strategy_data = {}
-    for t in trades:
-        sid = t.get('strategy_id') or 'no_strategy'
-        name = f"Strategy {t['strategy_id']}" if t['strategy_id'] else "No Strategy"
-        
-        if sid not in strategy_data:
-            strategy_data[sid] = {
-                "name": name,
-                "pnl": 0,
-                "rr_sum": 0,
-                "count": 0,
-                "wins": 0,
-                "losses": 0
-            }
-        
-        strategy_data[sid]["pnl"] += t["profit_or_loss"]
-        strategy_data[sid]["rr_sum"] += t["rr_calculated"]
-        strategy_data[sid]["count"] += 1
-        if t["profit_or_loss"] > 0:
-            strategy_data[sid]["wins"] += 1
-        else:
-            strategy_data[sid]["losses"] += 1
-
-    results = []
-    for sid, data in strategy_data.items():
-        avg_rr = data["rr_sum"] / data["count"] if data["count"] > 0 else 0
-        win_rate = data["wins"] / data["count"] if data["count"] > 0 else 0
-        
-        results.append({
-            "strategy_name": data["name"],
-            "total_pnl": round(data["pnl"], 2),
-            "avg_rr": round(avg_rr, 2),
-            "win_rate": round(win_rate, 2),
-            "trade_count": data["count"],
-            "wins": data["wins"],
-            "losses": data["losses"]
-        })
-    
-    return sorted(results, key=lambda x: x["total_pnl"], reverse=True)
-
-# ================================
-# 🔀 تشخیص تغییر استراتژی
-# ================================
-
-def detect_strategy_change(trades):
-    """آیا کاربر استراتژی خودش رو تغییر داده؟"""
-    if len(trades) < 5:
-        return None
-        
-    first = trades[-5:]  # اول دوره
-    last = trades[:5]   # آخر دوره
-    
-    first_strategies = [t.get('strategy_id') for t in first if t.get('strategy_id')]
-    last_strategies = [t.get('strategy_id') for t in last if t.get('strategy_id')]
-    
-    if not first_strategies or not last_strategies:
-        return None
-        
-    first_mode = max(set(first_strategies), key=first_strategies.count)
-    last_mode = max(set(last_strategies), key=last_strategies.count)
-    
-    if first_mode != last_mode:
-        return {
-            "changed": True,
-            "from": f"Strategy {first_mode}",
-            "to": f"Strategy {last_mode}"
-        }
-    return {"changed": False}
-
-# ================================
-# 🔤 لیست نمادهای اخیر
-# ================================
-
-def get_recent_symbols(trades, limit=10):
-    """لیست نمادهای اخیر را برمی‌گرداند"""
-    symbols = [t['symbol'] for t in trades if t['symbol']]
-    seen = set()
-    unique = []
-    for s in symbols:
-        if s not in seen:
-            seen.add(s)
-            unique.append(s)
-    return unique[:limit]
+    return f'<div dir="rtl" style="font-family: Tahoma, sans-serif; font-size: 16px; text-align: right;">{shape_rtl(str(text))}</div>'
 
 # ================================
 # 🎨 UI اصلی
 # ================================
 
+@st.cache_resource
+def get_journals():
+    """ژورنال هر کاربر (اتصال + کش) در یک LRU مشترک بین همه sessionها"""
+    return JournalPool()
+
+@st.cache_resource(max_entries=MAX_OPEN_JOURNALS)
+def get_profile_engine(journal_path):
+    """پنجره‌های لغزان الگوی رفتاری هر ژورنال؛ با sync فقط معاملات تازه اضافه می‌شوند"""
+    return ProfileEngine()
+
+@st.cache_resource(max_entries=MAX_OPEN_JOURNALS)
+def get_risk_engine(journal_path):
+    """وضعیت شاخص‌های ریسک هر ژورنال؛ با sync فقط معاملات تازه اضافه می‌شوند"""
+    return RiskEngine()
+
+@st.cache_resource(max_entries=MAX_OPEN_JOURNALS)
+def get_report_worker(journal_path):
+    """آخرین گزارش بدون فیلتر هر ژورنال؛ بعد از هر تغییر در پس‌زمینه دوباره ساخته می‌شود"""
+    profile_engine, risk_engine = get_profile_engine(journal_path), get_risk_engine(journal_path)
+    return ReportWorker(journal_path, lambda c: build_report(c, profile_engine, risk_engine))
+
+@st.cache_resource
+def get_profiler():
+    perf_logger = logging.getLogger("journal.perf")
+    if not perf_logger.handlers:
+        perf_logger.addHandler(logging.StreamHandler())
+        perf_logger.setLevel(logging.INFO)
+    return RerunProfiler()
+
+# سقف نقاط هر سری در نمودارها
+CHART_MAX_POINTS = 500
+# فاصله بررسی آماده شدن گزارش تازه (ثانیه)
+REPORT_POLL_SECONDS = 2
+# seed ثابت: هر rerun همان نتیجه شبیه‌سازی را نشان می‌دهد
+MONTE_CARLO_SEED = 0
+SEARCH_PAGE_SIZE = 20
+
+def format_ratio(value):
+    """نسبت‌هایی که ممکن است تعریف‌نشده (None) یا بی‌نهایت باشند"""
+    if value is None:
+        return "—"
+    return "∞" if value == float("inf") else f"{value:.2f}"
+
+BUCKET_LABELS = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+
 st.set_page_config(page_title="Smart Trading Journal", layout="centered")
+perf_run = get_profiler().new_run()
+
+def auth_configured():
+    """ورود با st.login فقط وقتی فعال است که بخش [auth] در secrets.toml تنظیم شده باشد"""
+    try:
+        return "auth" in st.secrets
+    except FileNotFoundError:
+        return False
 
 # --- تنظیمات در sidebar ---
 with st.sidebar:
     st.header("⚙️ Settings")
-    language = st.selectbox("Language", ["English", "فارسی"], index=0)
-    user_name = st.text_input("Your Name" if language == "English" else "نام شما", "Trader")
+    language = st.selectbox("Language", LANGUAGES, index=0)
+    if auth_configured():
+        # ژورنال به هویت ورود (sub) گره می‌خورد، نه به نامی که کاربر تایپ می‌کند
+        if not st.user.is_logged_in:
+            st.button("🔑 " + translator(language)("Log in"), on_click=st.login)
+            st.info(translator(language)("Log in to open your journal."))
+            st.stop()
+        user_name = st.user.get("name") or st.user.get("email") or DEFAULT_USER
+        identity = st.user.get("sub") or st.user.get("email")
+        st.button(translator(language)("Log out"), on_click=st.logout)
+    else:
+        user_name = st.text_input(translator(language)("Your Name"), DEFAULT_USER)
+        identity = None
+        st.caption(translator(language)(
+            "Journals are separated by name only, without a password: "
+            "anyone who enters the same name opens the same journal."
+        ))
     currency = st.selectbox("Currency", ["$", "€", "ت"], index=0)
+    show_performance = st.checkbox("⏱️ Performance", value=False)
 
-# --- ترجمه متن‌ها ---
-if language == "English":
-    def t(text): return text
-    user_greeting = f"Hi, {user_name}!"
-else:
-    def t(text):
-        translations = {
-            "Hi, {name}!": f"سلام، {user_name}!",
-            "Smart Trading Journal": "دفترچه معاملات هوشمند",
-            "Check before you trade, not after you lose": "قبل از ورود هشدار بگیر، نه بعد از ضرر",
-            "Pre-Trade Check": "بررسی قبل از ورود",
-            "Record Trade": "ثبت معامله",
-            "Smart Report": "گزارش هوشمند",
-            "Define Strategy": "تعریف استراتژی",
-            "Are you sure you want to enter?": "آیا واقعاً می‌خواهی وارد شوی؟",
-            "Record New Trade": "ثبت معامله جدید",
-            "Record Trade": "ثبت معامله",
-            "Total PnL": "سود کل",
-            "Win Rate": "درصد برنده",
-            "Your Behavioral Pattern": "الگوی رفتاری شما",
-            "Common Symbols": "نمادهای معمول",
-            "Preferred Side": "جهت ترجیحی",
-            "Common Type": "نوع معامله",
-            "Avg Leverage": "لوریج متوسط",
-            "Preferred Context": "محیط بازار ترجیحی",
-            "Common Emotions": "احساسات رایج",
-            "Recent Trades": "معاملات اخیر",
-            "Please fill in required fields.": "لطفاً فیلدهای ضروری را پر کنید.",
-            "Trade recorded!": "معامله ثبت شد!",
-            "PnL": "سود/ضرر",
-            "R:R": "R:R",
-            "Symbol": "نماد",
-            "Entry Price": "قیمت ورود",
-            "Exit Price": "قیمت خروج",
-            "Side": "جهت",
-            "Quantity": "حجم",
-            "Risk ($)": "ریسک ($)",
-            "Trade Type": "نوع معامله",
-            "Leverage": "لوریج",
-            "Psychological Tags (comma-separated)": "برچسب‌های روانی (با کاما)",
-            "Market Context": "محیط بازار",
-            "Strategy ID (optional)": "شناسه استراتژی (اختیاری)",
-            "Using": "استفاده از",
-            "No Strategy": "بدون استراتژی",
-            "Behavioral Evolution": "تکامل رفتاری",
-            "Improvement": "بهبود",
-            "Early Avg R:R": "میانگین R:R اولیه",
-            "Recent Avg R:R": "میانگین R:R اخیر",
-            "Great progress!": "پیشرفت عالی!",
-            "Keep going!": "ادامه بده!",
-            "Data saved! Go to 'Record Trade' to finalize.": "داده ذخیره شد! به 'ثبت معامله' برو تا کاملش کنی.",
-            "✅ Data saved!": "✅ داده ذخیره شد!",
-            "Strategy Name": "نام استراتژی",
-            "Description": "توضیحات",
-            "Entry Rules": "قوانین ورود",
-            "Exit Rules": "قوانین خروج",
-            "Condition": "شرط",
-            "Required": "الزامی",
-            "Save Strategy": "ذخیره استراتژی",
-            "Strategy saved successfully!": "استراتژی با موفقیت ذخیره شد!",
-            "Select Strategy": "انتخاب استراتیجی",
-            "Strategy Compliance": "وفاداری به استراتژی",
-            "Rule": "قانون",
-            "Met": "اجرا شد",
-            "Other": "سایر",
-            "Enter Symbol": "نام نماد را وارد کنید",
-            "Performance by Strategy": "عملکرد بر اساس استراتژی",
-            "Total PnL": "سود کل",
-            "Avg R:R": "میانگین R:R",
-            "Win Rate": "درصد برنده",
-            "You changed strategy": "استراتژی تو عوض شد",
-            "The new strategy is performing better!": "استراتژی جدید عملکرد بهتری داره!",
-            "The new strategy needs adjustment.": "استراتژی جدید نیاز به اصلاح داره.",
-            "This strategy name already exists.": "این نام استراتژی قبلاً وجود دارد.",
-            "Update Strategy": "به‌روزرسانی استراتژی",
-            "Strategy updated successfully!": "استراتژی با موفقیت به‌روزرسانی شد!"
-        }
-        return translations.get(text, text)
-    user_greeting = t(f"Hi, {user_name}!")
-
-# --- CSS برای RTL فارسی ---
-if language == "فارسی":
+# --- ترجمه متن‌ها (کاتالوگ‌ها یک بار در i18n بارگذاری شده‌اند) ---
+t = translator(language)
+user_greeting = t("Hi, {name}!").format(name=user_name)
+
+# --- CSS برای زبان‌های راست‌به‌چپ ---
+if is_rtl(language):
     st.markdown("""
     <style>
         body { direction: rtl; text-align: right; }
@@ -485,28 +145,84 @@ else:
     st.title("🧠 Smart Trading Journal")
     st.caption("Check before you trade, not after you lose")
 
-conn = connect_db()
-create_tables(conn)
-trades = load_trades(conn)
-strategies = load_strategies(conn)
-recent_symbols = get_recent_symbols(trades)
-pattern = learn_user_pattern(trades)
-evolution = analyze_evolution(trades)
-strategy_perf = analyze_strategy_performance(trades)
-strategy_change = detect_strategy_change(trades)
+with perf_run.stage("connect"):
+    journal = get_journals().get(user_name, identity)
+    # خواندن‌ها از اتصال همین thread؛ journal.conn فقط برای نوشتن است
+    conn = journal.reader()
+    query_cache = journal.cache
+
+# --- داده‌های هر صفحه به صورت تنبل ---
+# هر بارگذار فقط وقتی صدا زده می‌شود که صفحه‌ی فعلی آن را لازم داشته باشد؛
+# get برای دسترسی به داده‌های وابسته است.
+PAGE_LOADERS = {
+    "strategies": lambda get: query_cache.get("strategies", load_strategies, conn),
+    "strategy_names": lambda get: [s['name'] for s in get("strategies")],
+    "recent_symbols": lambda get: query_cache.get("recent_symbols", load_recent_symbols, conn),
+    "pattern": lambda get: get_profile_engine(journal.path).sync(conn).pattern(),
+}
+
+PAGES = {
+    "Pre-Trade Check": ["recent_symbols", "pattern"],
+    "Record Trade": ["recent_symbols", "strategies"],
+    "Define Strategy": ["strategy_names"],
+    # گزارش بدون فیلتر از get_report_worker، با فیلتر مستقیم در همان rerun
+    "Smart Report": ["strategies"],
+}
+
+def load_page_data(names):
+    """فقط داده‌های اعلام‌شده‌ی صفحه (و وابستگی‌هایشان) را بارگذاری و زمان‌سنجی می‌کند"""
+    data = {}
+
+    def get(name):
+        if name not in data:
+            with perf_run.stage(name) as stage:
+                data[name] = PAGE_LOADERS[name](get)
+                if isinstance(data[name], (list, pd.DataFrame)):
+                    stage.rows = len(data[name])
+        return data[name]
+
+    for name in names:
+        get(name)
+    return data
+
+# --- تازگی گزارش پس‌زمینه ---
+def report_freshness_text(report, stale, failed=False):
+    age = max(int(time.time() - report.built_at), 0)
+    text = t("Updated {age}s ago (built in {seconds:.1f}s)").format(age=age, seconds=report.seconds)
+    if stale and failed:
+        return f"⚠️ {text} · {t('Refresh failed')}"
+    return f"⏳ {text} · {t('Refreshing…')}" if stale else f"🟢 {text}"
+
+@st.fragment(run_every=REPORT_POLL_SECONDS)
+def report_refresh_status(worker, shown):
+    """تا آماده شدن گزارش تازه هر چند ثانیه بررسی و بعد کل صفحه دوباره اجرا می‌شود"""
+    report, stale = worker.get(wait=0)
+    if report is not shown:
+        st.rerun()
+    error = worker.error if stale else None
+    st.caption(report_freshness_text(report, stale, error is not None))
+    if error is not None:
+        # نسخه قبلی نشان داده می‌شود؛ ساخت بعد از RETRY_SECONDS یا commit بعدی دوباره امتحان می‌شود
+        st.error(t("Could not refresh the report: {error}").format(error=error))
 
 # --- منو ---
 menu = st.radio(
     "",
-    [t("Pre-Trade Check"), t("Record Trade"), t("Define Strategy"), t("Smart Report")],
+    [t(p) for p in PAGES],
     horizontal=True,
     label_visibility="collapsed"
 )
+page = next(p for p in PAGES if t(p) == menu)
+perf_run.page = page
+page_data = load_page_data(PAGES[page])
 
 # ================================
 # ۱. بررسی قبل از ورود
 # ================================
-if menu == t("Pre-Trade Check"):
+if page == "Pre-Trade Check":
+    recent_symbols = page_data["recent_symbols"]
+    pattern = page_data["pattern"]
+
     if language == "فارسی":
         st.subheader(html_rtl("⚠️ آیا واقعاً می‌خواهی وارد شوی؟"))
     else:
@@ -566,10 +282,24 @@ if menu == t("Pre-Trade Check"):
                 else:
                     st.success("✅ Data saved! Go to 'Record Trade' to finalize.")
 
+                # مقایسه با الگوی رفتاری معاملات اخیر
+                if pattern:
+                    deviation = check_deviation(st.session_state.pre_trade_data, pattern)
+                    if deviation > 0.5:
+                        if language == "فارسی":
+                            st.warning(html_rtl(f"⚠️ این معامله با الگوی رفتاری تو فرق دارد ({deviation:.0%})"))
+                        else:
+                            st.warning(f"⚠️ This trade deviates from your usual pattern ({deviation:.0%})")
+                    else:
+                        st.info(f"🧭 {t('Deviation from your pattern')}: {deviation:.0%}")
+
 # ================================
 # ۲. ثبت معامله
 # ================================
-elif menu == t("Record Trade"):
+elif page == "Record Trade":
+    recent_symbols = page_data["recent_symbols"]
+    strategies = page_data["strategies"]
+
     if language == "فارسی":
         st.subheader(html_rtl("📝 ثبت معامله جدید"))
     else:
@@ -685,17 +415,48 @@ elif menu == t("Record Trade"):
 
                     st.success(f"✅ {t('Strategy Compliance')}: {compliance_rate:.0%}")
 
-                save_trade(conn, data)
+                save_trade(journal.conn, data)
+                get_profile_engine(journal.path).sync(conn)
+                get_risk_engine(journal.path).sync(conn)
+                get_report_worker(journal.path).get(wait=0)  # ساخت گزارش تازه از همین حالا
                 st.session_state.pre_trade_data = {}
                 if language == "فارسی":
                     st.success(html_rtl(f"✅ معامله ثبت شد! | {t('PnL')}: {pnl}{currency} | {t('R:R')}: {rr}"))
                 else:
                     st.success(f"✅ {t('Trade recorded!')} | {t('PnL')}: {pnl}{currency} | {t('R:R')}: {rr}")
 
+    # --- ورود دسته‌ای از CSV صرافی ---
+    with st.expander("📥 " + t("Import trades from CSV")):
+        csv_format = st.selectbox(t("Format"), sorted(CSV_FORMATS), index=sorted(CSV_FORMATS).index("binance"))
+        column_map = {}
+        if csv_format == "generic":
+            for field, column in CSV_FORMATS["generic"]["columns"].items():
+                column_map[field] = st.text_input(f"{field} ←", value=column, key=f"csv_col_{field}")
+        uploaded = st.file_uploader(t("CSV file"), type=["csv"])
+
+        if uploaded is not None and st.button(t("Import")):
+            bar = st.progress(0.0)
+
+            def show_progress(imported, skipped, fraction):
+                bar.progress(fraction or 0.0, text=f"{imported} {t('imported')}, {skipped} {t('skipped')}")
+
+            try:
+                result = import_trades_csv(
+                    journal.conn, uploaded, csv_format, column_map,
+                    total_bytes=uploaded.size, progress=show_progress
+                )
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                get_report_worker(journal.path).get(wait=0)
+                st.success(f"✅ {result['imported']} {t('imported')}, {result['skipped']} {t('skipped')}")
+
 # ================================
 # ۳. تعریف استراتژی
 # ================================
-elif menu == t("Define Strategy"):
+elif page == "Define Strategy":
+    strategy_names = page_data["strategy_names"]
+
     if language == "فارسی":
         st.subheader(html_rtl("➕ تعریف استراتژی"))
     else:
@@ -772,7 +533,7 @@ elif menu == t("Define Strategy"):
         
         if not name or not entry_rules:
             st.error(t("Please fill in required fields."))
-        elif name in [s['name'] for s in strategies]:
+        elif name in strategy_names:
             st.error(t("This strategy name already exists."))
         else:
             strategy_data = {
@@ -781,7 +542,7 @@ elif menu == t("Define Strategy"):
                 "entry_rules": entry_rules,
                 "exit_rules": exit_rules
             }
-            success = save_strategy(conn, strategy_data)
+            success = save_strategy(journal.conn, strategy_data)
             if success:
                 st.success(t("Strategy saved successfully!"))
                 st.session_state.entry_conditions = [{"condition": "", "required": True}]
@@ -793,26 +554,249 @@ elif menu == t("Define Strategy"):
 # ================================
 # ۴. گزارش هوشمند
 # ================================
-elif menu == t("Smart Report"):
-    if len(trades) == 0:
+elif page == "Smart Report":
+    strategies = page_data["strategies"]
+
+    # --- فیلتر بازه گزارش ---
+    with st.expander("🔎 " + t("Filters")):
+        date_range = st.date_input(t("Date Range"), value=())
+        symbol_filter = st.selectbox(t("Symbol"), [t("All")] + query_cache.get("symbols", load_symbols, conn))
+        strategy_options = {t("All"): None, t("No Strategy"): 0}
+        strategy_options.update({s['name']: s['id'] for s in strategies})
+        strategy_filter = st.selectbox(t("Select Strategy"), list(strategy_options))
+        tag_filter = st.selectbox(t("Emotion"), [t("All")] + query_cache.get("tags", load_tags, conn))
+
+    filters = {
+        "start_date": date_range[0] if len(date_range) > 0 else None,
+        "end_date": date_range[1] if len(date_range) > 1 else None,
+        "symbol": None if symbol_filter == t("All") else symbol_filter,
+        "strategy_id": strategy_options[strategy_filter],
+        "tag": None if tag_filter == t("All") else tag_filter,
+    }
+
+    # --- خروجی فایل (همان فیلترها) ---
+    with st.expander("📤 " + t("Export")):
+        export_format = st.selectbox(t("Format"), EXPORT_FORMATS, key="export_format")
+
+        def build_export(fmt=export_format, filters=dict(filters)):
+            # فقط با کلیک دانلود اجرا می‌شود؛ با اتصال جدا و روی فایل موقت روی دیسک
+            export_conn = connect_db(journal.path)
+            try:
+                out = tempfile.TemporaryFile()
+                export_trades(export_conn, out, fmt, **filters)
+            finally:
+                export_conn.close()
+            out.seek(0)
+            return out
+
+        # data تنبل بعد از کلیک اجرا می‌شود و خطایش به صفحه نمی‌رسد؛ وابستگی از قبل بررسی می‌شود
+        if not format_available(export_format):
+            st.error(t(PARQUET_MISSING))
+        else:
+            st.download_button(
+                "⬇️ " + t("Download"),
+                data=build_export,
+                file_name=f"trades.{export_format}",
+                mime="text/csv" if export_format == "csv" else "application/octet-stream",
+            )
+    if any(v is not None for v in filters.values()):
+        # فقط همان بازه‌ای که نمایش داده می‌شود بارگذاری و تحلیل می‌شود
+        with perf_run.stage("load_trades_filtered") as stage:
+            trades_df = query_cache.get(
+                ("trades_frame", tuple(filters.items())),
+                lambda c: load_trades_frame(c, **filters),
+                conn
+            )
+            stage.rows = len(trades_df)
+        with perf_run.stage("summary_filtered"):
+            if filters["tag"]:
+                summary = summarize_trades_df(trades_df, {s['id']: s['name'] for s in strategies})
+            else:
+                # از جدول rollup، بدون تجمیع دوباره ردیف‌های خام
+                rollup_filters = {k: v for k, v in filters.items() if k != "tag"}
+                summary = query_cache.get(
+                    ("rollup_summary", tuple(rollup_filters.items())),
+                    lambda c: load_rollup_summary(c, **rollup_filters),
+                    conn
+                )
+        with perf_run.stage("analytics_filtered"):
+            strategy_perf = summary["strategies"]
+            pattern = learn_user_pattern_df(trades_df)
+            evolution = analyze_evolution_df(trades_df)
+            strategy_change = detect_strategy_change_df(trades_df)
+            deviation_outcomes = deviation_outcomes_df(trades_df, score_deviation_df(trades_df))
+            risk_stats = risk_metrics_df(trades_df)
+            equity_curve = equity_curve_df(trades_df)
+        report = None
+    else:
+        # آخرین گزارش ساخته‌شده، حتی اگر کمی قدیمی باشد؛ ساخت دوباره در پس‌زمینه
+        report_worker = get_report_worker(journal.path)
+        with perf_run.stage("report_snapshot") as stage:
+            report, report_stale = report_worker.get()
+            stage.rows = len(report.data["trades_df"])
+        report_data = report.data
+        trades_df = report_data["trades_df"]
+        summary = report_data["summary"]
+        strategy_perf = summary["strategies"]
+        pattern = report_data["pattern"]
+        evolution = report_data["evolution"]
+        strategy_change = report_data["strategy_change"]
+        deviation_outcomes = report_data["deviation_outcomes"]
+        risk_stats = report_data["risk"]
+        equity_curve = report_data["equity_curve"]
+
+    if report is not None:
+        if report_stale:
+            report_refresh_status(report_worker, report)
+        else:
+            st.caption(report_freshness_text(report, False))
+
+    if summary["trade_count"] == 0:
         if language == "فارسی":
             st.info(html_rtl("📭 هنوز معامله‌ای ثبت نشده."))
         else:
             st.info("📭 No trades recorded yet.")
     else:
         if language == "فارسی":
-            st.subheader(html_rtl(f"📊 گزارش — {len(trades)} معامله"))
+            st.subheader(html_rtl(f"📊 گزارش — {summary['trade_count']} معامله"))
         else:
-            st.subheader(f"📊 Report — {len(trades)} Trades")
-        
-        total_pnl = sum(t['profit_or_loss'] for t in trades)
-        wins = [t for t in trades if t['profit_or_loss'] > 0]
-        win_rate = len(wins) / len(trades) if trades else 0
+            st.subheader(f"📊 Report — {summary['trade_count']} Trades")
         
         col1, col2 = st.columns(2)
-        col1.metric(t("Total PnL"), f"{total_pnl:.2f} {currency}")
-        col2.metric(t("Win Rate"), f"{win_rate:.1%}")
-        
+        col1.metric(t("Total PnL"), f"{summary['total_pnl']:.2f} {currency}")
+        col2.metric(t("Win Rate"), f"{summary['win_rate']:.1%}")
+
+        # --- شاخص‌های ریسک ---
+        if risk_stats:
+            st.markdown("### 🛡️ " + t("Risk"))
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric(t("Max Drawdown"), f"{risk_stats['max_drawdown']:.2f} {currency}",
+                        f"{risk_stats['max_drawdown_days']:.0f} {t('days')}", delta_color="off")
+            col2.metric(t("Expectancy"), f"{risk_stats['expectancy']:.2f} {currency}",
+                        f"{risk_stats['expectancy_r']:.2f} R", delta_color="off")
+            col3.metric(t("Profit Factor"), format_ratio(risk_stats['profit_factor']))
+            col4.metric(t("Sharpe / Sortino"),
+                        f"{format_ratio(risk_stats['sharpe'])} / {format_ratio(risk_stats['sortino'])}")
+            st.caption(
+                f"{t('Longest win streak')}: {risk_stats['longest_win_streak']} · "
+                f"{t('Longest loss streak')}: {risk_stats['longest_loss_streak']} · "
+                f"{t('Current drawdown')}: {risk_stats['current_drawdown']:.2f} {currency}"
+            )
+            with perf_run.stage("chart_drawdown") as stage:
+                points = downsample_series(equity_curve, "trade_time", "drawdown", CHART_MAX_POINTS)
+                stage.rows = len(points)
+                fig = px.area(points, x="trade_time", y="drawdown", title=t("Drawdown"))
+                st.plotly_chart(fig, use_container_width=True)
+
+        # --- شبیه‌سازی مونت‌کارلو روی نتایج همین گزارش ---
+        with st.expander("🎲 " + t("Monte Carlo Simulation")):
+            col1, col2, col3 = st.columns(3)
+            mc_strategy = col1.selectbox(t("Select Strategy"), list(strategy_options), key="mc_strategy")
+            mc_kind = col2.radio(t("Resample"), ["R", "PnL"], horizontal=True, key="mc_kind")
+            if mc_kind == "R":
+                mc_risk = col3.number_input(t("Risk per trade (%)"), 0.1, 100.0, 1.0, step=0.1) / 100
+                mc_equity = 1.0
+            else:
+                mc_risk = None
+                mc_equity = col3.number_input(t("Starting equity"), 1.0, value=10000.0, step=1000.0)
+            col1, col2, col3 = st.columns(3)
+            mc_trades = int(col1.number_input(t("Trades ahead"), 10, 5000, 200, step=10))
+            mc_paths = int(col2.number_input(t("Paths"), 1000, 100000, 10000, step=1000))
+            mc_ruin = col3.number_input(t("Ruin at loss (%)"), 1.0, 100.0, 50.0, step=5.0) / 100
+
+            samples = outcome_samples(trades_df, strategy_options[mc_strategy], mc_kind.lower())
+            if len(samples) < MIN_SAMPLES:
+                st.info(t("Not enough trades to simulate."))
+            elif st.checkbox(t("Run simulation"), key="mc_run"):
+                with perf_run.stage("monte_carlo") as stage:
+                    params = (mc_strategy, mc_kind, mc_risk, mc_equity, mc_trades, mc_paths, mc_ruin)
+                    result = query_cache.get(
+                        # نمونه‌های گزارش بدون فیلتر ممکن است از نسخه قبلی دیتابیس باشند
+                        ("monte_carlo", tuple(filters.items()), report.version if report else None,
+                         params),
+                        lambda c: simulate(
+                            samples, mc_paths, mc_trades, mc_risk or 0.0, mc_kind.lower(),
+                            mc_equity, mc_ruin, seed=MONTE_CARLO_SEED
+                        ),
+                        conn
+                    )
+                    stage.rows = mc_paths * mc_trades
+
+                def equity_text(value):
+                    if mc_kind == "R":
+                        return f"{value - 1:+.1%}"
+                    return f"{value:.2f} {currency}"
+
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric(t("Risk of ruin"), f"{result['risk_of_ruin']:.2%}")
+                col2.metric(t("Median final equity"), equity_text(result['final_equity'][50]),
+                            f"p5 {equity_text(result['final_equity'][5])}", delta_color="off")
+                col3.metric(t("Median max drawdown"), f"{result['max_drawdown'][50]:.1%}")
+                col4.metric(t("Max drawdown (p95)"), f"{result['max_drawdown'][95]:.1%}")
+                st.caption(t("{samples} trades resampled into {paths} paths").format(
+                    samples=result['samples'], paths=result['paths']))
+
+                bands = downsample_series(result["bands"], "trade", "p50", CHART_MAX_POINTS)
+                fig = px.line(bands, x="trade", y=["p5", "p25", "p50", "p75", "p95"],
+                              title=t("Equity percentiles"))
+                st.plotly_chart(fig, use_container_width=True)
+                # فقط شمارش هر بازه به مرورگر می‌رود، نه همه مسیرها
+                counts, edges = np.histogram(result["max_drawdowns"], bins=50)
+                fig = px.bar(x=edges[:-1], y=counts, labels={"x": t("Max Drawdown"), "y": t("Paths")},
+                             title=t("Max drawdown distribution"))
+                st.plotly_chart(fig, use_container_width=True)
+
+        # --- «اگر...»: بازپخش همین معاملات با فیلترها و تغییرهای دیگر ---
+        with st.expander("🔁 " + t("What-if Replay")):
+            presets = st.multiselect(
+                t("Scenarios"), list(PRESET_SCENARIOS), default=list(PRESET_SCENARIOS),
+                format_func=lambda key: t(PRESET_SCENARIOS[key]["name"]), key="whatif_presets"
+            )
+            scenarios = [PRESET_SCENARIOS[key] for key in presets]
+            st.markdown("**" + t("Custom scenario") + "**")
+            col1, col2 = st.columns(2)
+            skip_tags = col1.multiselect(t("Skip trades tagged"), query_cache.get("tags", load_tags, conn),
+                                         key="whatif_skip_tags")
+            min_compliance = col2.slider(t("Minimum compliance"), 0.0, 1.0, 0.0, step=0.25,
+                                         key="whatif_compliance")
+            col1, col2, col3 = st.columns(3)
+            max_leverage = col1.number_input(t("Max leverage (0 = no cap)"), 0.0, 125.0, 0.0,
+                                             step=1.0, key="whatif_leverage")
+            qty_scale = col2.number_input(t("Position size ×"), 0.1, 10.0, 1.0, step=0.1,
+                                          key="whatif_qty")
+            fees = col3.selectbox(t("Fees"), list(FEE_SCHEDULES), key="whatif_fees")
+            custom = {
+                "name": "Custom",
+                "skip_tags": skip_tags,
+                "min_compliance": min_compliance or None,
+                "max_leverage": max_leverage or None,
+                "qty_scale": qty_scale,
+                "fees": fees,
+            }
+            if skip_tags or min_compliance or max_leverage or qty_scale != 1 or fees != "none":
+                scenarios.append(custom)
+
+            with perf_run.stage("whatif") as stage:
+                comparison = query_cache.get(
+                    # گزارش بدون فیلتر ممکن است از نسخه قبلی دیتابیس باشد
+                    ("whatif", tuple(filters.items()), report.version if report else None,
+                     repr(scenarios)),
+                    lambda c: compare_scenarios(trades_df, scenarios),
+                    conn
+                )
+                stage.rows = len(trades_df) * len(scenarios)
+            comparison = comparison.assign(scenario=comparison["scenario"].map(t))
+            st.dataframe(
+                comparison.rename(columns={
+                    "scenario": t("Scenario"), "trades": t("Trades"), "skipped": t("Skipped"),
+                    "total_pnl": t("Total PnL"), "pnl_change": t("PnL vs actual"),
+                    "win_rate": t("Win Rate"), "avg_rr": t("Avg R:R"), "expectancy": t("Expectancy"),
+                    "profit_factor": t("Profit Factor"), "max_drawdown": t("Max Drawdown"),
+                    "sharpe": t("Sharpe"),
+                }),
+                hide_index=True,
+            )
+
         if pattern:
             if language == "فارسی":
                 st.markdown(html_rtl("### 🧠 الگوی رفتاری شما"), unsafe_allow_html=True)
@@ -856,6 +840,57 @@ elif menu == t("Smart Report"):
                 else:
                     st.info("Keep going! Consistency leads to results.")
 
+        # --- انحراف از الگو در برابر نتیجه ---
+        if len(deviation_outcomes):
+            st.markdown("### 🧭 " + t("Deviation vs Outcome"))
+            st.dataframe(
+                deviation_outcomes.rename(columns={
+                    "deviating_factors": t("Deviating factors"), "trades": t("Trades"),
+                    "win_rate": t("Win Rate"), "avg_pnl": t("Avg PnL"), "avg_rr": t("Avg R:R"),
+                }),
+                hide_index=True, use_container_width=True
+            )
+
+        # --- نتیجه معاملات به تفکیک برچسب احساسی (GROUP BY روی trade_tags) ---
+        with perf_run.stage("tag_stats") as stage:
+            tag_stats = report_data["tag_stats"] if report else query_cache.get(
+                ("tag_stats", tuple(filters.items())),
+                lambda c: load_tag_stats(c, **filters),
+                conn
+            )
+            stage.rows = len(tag_stats)
+        if len(tag_stats):
+            st.markdown("### 🏷️ " + t("Performance by Emotion"))
+            st.dataframe(
+                tag_stats.rename(columns={
+                    "tag": t("Emotion"), "trades": t("Trades"), "win_rate": t("Win Rate"),
+                    "total_pnl": t("Total PnL"), "avg_pnl": t("Avg PnL"), "avg_rr": t("Avg R:R"),
+                }),
+                hide_index=True, use_container_width=True
+            )
+
+        # --- رعایت هر قانون استراتژی در برابر نتیجه ---
+        with perf_run.stage("rule_stats") as stage:
+            rule_stats = report_data["rule_stats"] if report else query_cache.get(
+                ("rule_stats", tuple(filters.items())),
+                lambda c: load_rule_stats(c, **filters),
+                conn
+            )
+            stage.rows = len(rule_stats)
+        if len(rule_stats):
+            st.markdown("### 📏 " + t("Rule Compliance"))
+            for name, rules in rule_stats.groupby("strategy_name", sort=False):
+                st.caption(name)
+                st.dataframe(
+                    rules.drop(columns=["strategy_id", "strategy_name"]).rename(columns={
+                        "rule": t("Condition"), "required": t("Required"), "trades": t("Trades"),
+                        "hit_rate": t("Hit Rate"),
+                        "met_avg_pnl": t("Avg PnL (met)"), "skipped_avg_pnl": t("Avg PnL (skipped)"),
+                        "met_avg_rr": t("Avg R:R (met)"), "skipped_avg_rr": t("Avg R:R (skipped)"),
+                    }),
+                    hide_index=True, use_container_width=True
+                )
+
         # --- تحلیل عملکرد بر اساس استراتژی ---
         if strategy_perf:
             st.markdown("### 📊 " + t("Performance by Strategy"))
@@ -872,46 +907,131 @@ elif menu == t("Smart Report"):
                         st.warning("⚠️ Needs improvement")
 
         # --- نمودار PnL Over Time ---
-        if len(trades) > 1:
+        if summary["trade_count"] > 1:
             st.markdown("### 📈 PnL Over Time")
-            df = pd.DataFrame(trades)
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.date
-            fig = px.line(df, x='trade_date', y='profit_or_loss', 
-                         title='Daily PnL Trend')
-            st.plotly_chart(fig, use_container_width=True)
+            col1, col2 = st.columns(2)
+            bucket = col1.radio(
+                t("Group by"), list(PNL_BUCKETS), horizontal=True,
+                format_func=lambda b: t(BUCKET_LABELS[b])
+            )
+            cumulative = col2.checkbox(t("Cumulative equity"))
+            with perf_run.stage("chart_pnl") as stage:
+                # تجمیع در SQLite و کاهش نقاط با LTTB؛ فقط همین نقاط به مرورگر می‌رود
+                series = query_cache.get(
+                    ("pnl_buckets", bucket, tuple(filters.items())),
+                    lambda c: load_pnl_buckets(c, bucket, **filters),
+                    conn
+                )
+                y = "equity" if cumulative else "pnl"
+                points = downsample_series(series, "bucket", y, CHART_MAX_POINTS)
+                stage.rows = len(points)
+                fig = px.line(points, x='bucket', y=y,
+                             title='Equity Curve' if cumulative else f'{BUCKET_LABELS[bucket]} PnL Trend')
+                st.plotly_chart(fig, use_container_width=True)
 
         # --- نمودار Win/Loss ---
-        wins = [t for t in trades if t['profit_or_loss'] > 0]
-        losses = [t for t in trades if t['profit_or_loss'] <= 0]
         st.markdown("### 🎯 Win vs Loss")
-        fig2 = px.pie(
-            names=[t("Wins"), t("Losses")], 
-            values=[len(wins), len(losses)],
-            hole=0.4,
-            title=f"Win Rate: {len(wins)/len(trades):.1%}",
-            color_discrete_sequence=["#2CA02C", "#D62728"]
-        )
-        st.plotly_chart(fig2, use_container_width=True)
+        with perf_run.stage("chart_win_loss"):
+            fig2 = px.pie(
+                names=[t("Wins"), t("Losses")], 
+                values=[summary["wins"], summary["losses"]],
+                hole=0.4,
+                title=f"Win Rate: {summary['win_rate']:.1%}",
+                color_discrete_sequence=["#2CA02C", "#D62728"]
+            )
+            st.plotly_chart(fig2, use_container_width=True)
 
         # --- تشخیص تغییر استراتژی ---
         if strategy_change and strategy_change['changed']:
             st.info(f"🔄 {t('You changed strategy')} from {strategy_change['from']} to {strategy_change['to']}")
             
-            first_period = trades[-len(trades)//2:]
-            last_period = trades[:len(trades)//2]
-            first_pnl = sum(t['profit_or_loss'] for t in first_period)
-            last_pnl = sum(t['profit_or_loss'] for t in last_period)
+            pnl_series = trades_df['profit_or_loss']
+            first_pnl = pnl_series.iloc[-len(pnl_series)//2:].sum()
+            last_pnl = pnl_series.iloc[:len(pnl_series)//2].sum()
             
             if last_pnl > first_pnl:
                 st.success(t("The new strategy is performing better!"))
             else:
                 st.warning(t("The new strategy needs adjustment."))
 
+        # --- جستجوی متنی در نماد، زمینه بازار و برچسب‌ها ---
+        if language == "فارسی":
+            st.markdown(html_rtl("### 🔎 جستجو در معاملات"), unsafe_allow_html=True)
+        else:
+            st.write("### 🔎 Search Trades")
+        search_text = st.text_input(
+            t("Search"), key="trade_search", placeholder=t("e.g. news or CPI, fomo, BTC"),
+            label_visibility="collapsed"
+        ).strip()
+        if search_text:
+            # صفحه‌بندی با offset، چون ترتیب رتبه‌ای cursor پایداری ندارد
+            search_key = (journal.path, search_text, tuple(filters.items()))
+            if st.session_state.get("trade_search_key") != search_key:
+                st.session_state.trade_search_key = search_key
+                st.session_state.trade_search_page = 0
+            search_page = st.session_state.trade_search_page
+            with perf_run.stage("search_trades") as stage:
+                results, total = query_cache.get(
+                    ("search_trades", search_key, search_page),
+                    lambda c: search_trades(c, search_text, offset=search_page * SEARCH_PAGE_SIZE,
+                                            limit=SEARCH_PAGE_SIZE, **filters),
+                    conn
+                )
+                stage.rows = len(results)
+            if not results:
+                st.info(t("No matching trades."))
+            else:
+                pages = -(-total // SEARCH_PAGE_SIZE)
+                st.caption(f"{total} {t('matches')} — {t('Page')} {search_page + 1}/{pages}")
+                st.dataframe(pd.DataFrame([{
+                    t("Date"): trade["trade_date"],
+                    t("Symbol"): trade["symbol"],
+                    t("Side"): trade["side"],
+                    t("PnL"): trade["profit_or_loss"],
+                    t("R:R"): trade["rr_calculated"],
+                    t("Emotions"): ", ".join(trade["psychological_tags"]),
+                    t("Market Context"): trade["market_context"],
+                } for trade in results]), hide_index=True)
+
+                def turn_search_page(step):
+                    st.session_state.trade_search_page += step
+
+                col1, col2 = st.columns(2)
+                col1.button("⬅️ " + t("Previous"), key="search_prev", disabled=search_page == 0,
+                            on_click=turn_search_page, args=(-1,))
+                col2.button(t("Next") + " ➡️", key="search_next", disabled=search_page + 1 >= pages,
+                            on_click=turn_search_page, args=(1,))
+
         # --- معاملات اخیر ---
         if language == "فارسی":
             st.markdown(html_rtl("### 📜 معاملات اخیر"), unsafe_allow_html=True)
         else:
             st.write("### 📜 Recent Trades")
-        for t in trades[:10]:
-            tags = ", ".join(t['psychological_tags'])
-            st.text(f"{t['symbol']} | {t['side'].upper()} | PnL: {t['profit_or_loss']}$ | R:R: {t['rr_calculated']:.2f} | [{tags}]")
+
+        # صفحه‌بندی keyset: پشته cursor صفحه‌های دیده‌شده در session
+        page_key = (journal.path, tuple(filters.items()))
+        if st.session_state.get("recent_trades_filters") != page_key:
+            st.session_state.recent_trades_filters = page_key
+            st.session_state.recent_trades_cursors = [None]
+        cursors = st.session_state.recent_trades_cursors
+        with perf_run.stage("query_trades_page") as stage:
+            rows, next_cursor = query_trades(conn, before=cursors[-1], limit=10, **filters)
+            stage.rows = len(rows)
+
+        for trade in rows:
+            tags = ", ".join(trade['psychological_tags'])
+            st.text(f"{trade['symbol']} | {trade['side'].upper()} | PnL: {trade['profit_or_loss']}$ | R:R: {trade['rr_calculated']:.2f} | [{tags}]")
+
+        col1, col2 = st.columns(2)
+        col1.button("⬅️ " + t("Newer"), disabled=len(cursors) == 1, on_click=cursors.pop)
+        col2.button(t("Older") + " ➡️", disabled=next_cursor is None,
+                    on_click=cursors.append, args=(next_cursor,))
+
+# ================================
+# ⏱️ پنل عملکرد
+# ================================
+perf_run.finish()
+if show_performance:
+    with st.sidebar:
+        st.markdown("### ⏱️ Performance")
+        st.dataframe(pd.DataFrame(get_profiler().stats(perf_run)), hide_index=True)
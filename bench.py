@@ -0,0 +1,516 @@
+# bench.py
+"""ژورنال مصنوعی و بنچمارک تابع‌های تحلیلی
+
+    python bench.py generate --trades 100000 --db synthetic.db
+    python bench.py run --sizes 1000 10000 100000 --out bench_results.json
+    python bench.py run --sizes 100000 --compare old_results.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import (
+    QueryCache, connect_db, create_tables, decode_tags, save_trades, save_strategy,
+    load_trades, load_trades_frame, load_strategies, load_trade_summary,
+    load_tag_stats, load_rule_stats, load_pnl_buckets, load_rollup_summary, PNL_BUCKETS,
+    normalize_search_text, search_trades,
+)
+from analytics import (
+    calculate_pnl_and_rr, learn_user_pattern, check_deviation, analyze_evolution,
+    analyze_strategy_performance, detect_strategy_change, get_recent_symbols,
+    learn_user_pattern_df, analyze_evolution_df, analyze_strategy_performance_df,
+    detect_strategy_change_df, get_recent_symbols_df, calculate_pnl_and_rr_df,
+    score_deviation_df,
+)
+from montecarlo import outcome_samples, simulate
+from profiles import ProfileEngine
+from reports import ReportWorker, build_report
+from risk import RiskEngine, RiskState, risk_metrics_df
+from whatif import PRESET_SCENARIOS, Replay
+
+# --- ژورنال مصنوعی ---
+# نماد -> (قیمت پایه، وزن انتخاب)
+SYMBOLS = {
+    "BTCUSDT": (60000, 30), "ETHUSDT": (3000, 25), "SOLUSDT": (150, 12),
+    "XRPUSDT": (0.6, 8), "ADAUSDT": (0.45, 6), "BNBUSDT": (550, 6),
+    "DOGEUSDT": (0.15, 5), "DOTUSDT": (7, 4), "LINKUSDT": (15, 4),
+}
+TAGS = ["patience", "FOMO", "fear", "greed", "revenge", "calm",
+        "هیجان", "ترس", "انتقام", "صبر"]
+CONTEXTS = ["trending", "ranging", "news", "breakout", "روند", ""]
+STRATEGIES = [
+    ("Breakout", ["Volume spike", "Close above range", "HTF trend aligned"]),
+    ("Mean Reversion", ["RSI extreme", "Touch of band", "No news"]),
+    ("Trend Pullback", ["EMA stack", "Pullback to EMA", "Bullish candle"]),
+    ("News Fade", ["Spike > 2 ATR", "Rejection wick"]),
+    ("Scalp", ["Spread tight", "Order book imbalance"]),
+]
+
+def generate_trades(n, seed=42, start=datetime(2020, 1, 1), strategy_ids=None):
+    """n معامله مصنوعی (به ترتیب زمانی) با نماد، برچسب، استراتژی و زمان واقعی‌نما"""
+    rng = random.Random(seed)
+    symbols = list(SYMBOLS)
+    weights = [SYMBOLS[s][1] for s in symbols]
+    strategy_ids = strategy_ids or []
+    rules = {sid: STRATEGIES[i % len(STRATEGIES)][1] for i, sid in enumerate(strategy_ids)}
+    prices = {s: float(SYMBOLS[s][0]) for s in symbols}
+
+    # به طور میانگین ۱۰ معامله در روز با فاصله‌های تصادفی
+    step = timedelta(days=1) / 10
+    trade_time = start
+    for _ in range(n):
+        trade_time += step * rng.expovariate(1.0)
+
+        symbol = rng.choices(symbols, weights)[0]
+        prices[symbol] *= math.exp(rng.gauss(0, 0.01))
+        entry = prices[symbol]
+        exit_p = entry * math.exp(rng.gauss(0.0005, 0.02))
+        futures = rng.random() < 0.6
+        leverage = float(rng.choice([2, 3, 5, 10, 20])) if futures else 1.0
+        qty = round(rng.uniform(100, 5000) / entry, 6)
+
+        trade = {
+            "symbol": symbol,
+            "entry_price": round(entry, 6),
+            "exit_price": round(exit_p, 6),
+            "side": "buy" if rng.random() < 0.55 else "sell",
+            "qty": qty,
+            "risk": round(entry * qty * rng.uniform(0.005, 0.03), 2),
+            "trade_type": "futures" if futures else "spot",
+            "leverage": leverage,
+            "psychological_tags": rng.sample(TAGS, rng.choice([0, 0, 1, 1, 2])),
+            "market_context": rng.choice(CONTEXTS) or None,
+            "strategy_id": rng.choice(strategy_ids) if strategy_ids and rng.random() < 0.8 else None,
+            "trade_date": trade_time.isoformat(),
+        }
+        if trade["strategy_id"]:
+            strategy_rules = rules[trade["strategy_id"]]
+            missing = [r for r in strategy_rules if rng.random() < 0.25]
+            trade["strategy_compliance_rate"] = 1 - len(missing) / len(strategy_rules)
+            trade["strategy_missing_rules"] = missing
+        trade["profit_or_loss"], trade["rr_calculated"] = calculate_pnl_and_rr(trade)
+        yield trade
+
+def fill_journal(conn, n, seed=42, batch_size=20000):
+    """جدول‌ها را می‌سازد و n معامله مصنوعی (به‌همراه استراتژی‌ها) در آن می‌ریزد"""
+    create_tables(conn)
+    for name, entry_rules in STRATEGIES:
+        save_strategy(conn, {
+            "name": name,
+            "description": "synthetic",
+            "entry_rules": [{"condition": r, "required": True} for r in entry_rules],
+            "exit_rules": [],
+        })
+    strategy_ids = [s["id"] for s in load_strategies(conn)]
+
+    batch = []
+    for trade in generate_trades(n, seed, strategy_ids=strategy_ids):
+        batch.append(trade)
+        if len(batch) >= batch_size:
+            save_trades(conn, batch)
+            batch.clear()
+    save_trades(conn, batch)
+
+# --- بنچمارک ---
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"best_s": min(timings), "median_s": statistics.median(timings), "repeat": repeat}
+
+def _rerun_pipeline(conn, cache=None):
+    """همان کاری که app.py در هر rerun قبل از رسم صفحه انجام می‌دهد"""
+    get = cache.get if cache else (lambda name, loader, c: loader(c))
+    df = get("trades_frame", load_trades_frame, conn)
+    get("strategies", load_strategies, conn)
+    get("summary", load_trade_summary, conn)
+    get_recent_symbols_df(df)
+    learn_user_pattern_df(df)
+    analyze_evolution_df(df)
+    detect_strategy_change_df(df)
+
+def _legacy_pipeline(conn):
+    """مسیر قدیمی: لیست دیکشنری‌ها و تحلیل‌های پایتونی خالص"""
+    trades = load_trades(conn)
+    load_strategies(conn)
+    get_recent_symbols(trades)
+    learn_user_pattern(trades)
+    analyze_evolution(trades)
+    analyze_strategy_performance(trades)
+    detect_strategy_change(trades)
+
+def _close(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+def _pnl_parity(trades, df):
+    """موتور دسته‌ای (بدون کارمزد) باید دقیقاً همان نتیجه نسخه تکی را بدهد"""
+    pnl, rr = calculate_pnl_and_rr_df(df)
+    batch = dict(zip(df["id"].tolist(), zip(pnl.tolist(), rr.tolist())))
+    return all(
+        batch[t["id"]] == tuple(float(v) for v in calculate_pnl_and_rr(t))
+        for t in trades
+    )
+
+def _deviation_parity(df, samples=200, seed=0):
+    """امتیاز دسته‌ای هر معامله = check_deviation با الگوی معاملات قبل از آن"""
+    scores = score_deviation_df(df)
+    rows = df.astype(object).where(df.notna(), None).to_dict("records")
+    rng = random.Random(seed)
+    for i in rng.sample(range(max(len(df) - 3, 0)), min(samples, max(len(df) - 3, 0))):
+        expected = check_deviation(rows[i], learn_user_pattern_df(df.iloc[i + 1:]))
+        if not math.isclose(expected, scores[i]):
+            return False
+    return True
+
+def _profile_parity(conn, df):
+    engine = ProfileEngine().sync(conn)
+    return all(
+        engine.pattern(n) == learn_user_pattern_df(df, n) for n in engine.lookbacks
+    )
+
+def _tag_stats_parity(conn, trades):
+    """تجمیع SQL روی trade_tags = گروه‌بندی پایتونی برچسب‌های decodeشده"""
+    groups = {}
+    for t in trades:
+        for tag in set(t["psychological_tags"]):
+            groups.setdefault(tag, []).append(t)
+    stats = load_tag_stats(conn)
+    if set(stats["tag"]) != set(groups):
+        return False
+    for row in stats.itertuples(index=False):
+        pnl = [t["profit_or_loss"] or 0 for t in groups[row.tag]]
+        rr = [t["rr_calculated"] or 0 for t in groups[row.tag]]
+        if not (row.trades == len(pnl)
+                and _close(row.win_rate, sum(p > 0 for p in pnl) / len(pnl))
+                and _close(row.total_pnl, math.fsum(pnl))
+                and _close(row.avg_rr, math.fsum(rr) / len(rr))):
+            return False
+    return True
+
+SEARCH_QUERIES = ["news", "BTC", "fomo", "ترس", "news or روند", "eth greed"]
+
+def _search_parity(conn, trades):
+    """trades_fts = پیمایش پایتونی: هر کلمه پیشوند یکی از کلمه‌های نماد، زمینه یا برچسب‌ها"""
+    docs = {}
+    for t in trades:
+        text = normalize_search_text(" ".join(
+            [t["symbol"] or "", t["market_context"] or "", *t["psychological_tags"]]
+        )).casefold()
+        docs[t["id"]] = "".join(ch if ch.isalnum() else " " for ch in text).split()
+    for query in SEARCH_QUERIES:
+        groups = [g.split() for g in normalize_search_text(query).casefold().split(" or ")]
+        expected = {
+            trade_id for trade_id, words in docs.items()
+            if any(all(any(w.startswith(term) for w in words) for term in group) for group in groups)
+        }
+        page, total = search_trades(conn, query, limit=len(trades) + 1)
+        if total != len(expected) or {t["id"] for t in page} != expected:
+            return False
+    return True
+
+def _rule_stats_parity(conn, trades):
+    """تجمیع SQL روی trade_rule_outcomes = شمارش پایتونی از strategy_missing_rules"""
+    rules = {s["id"]: s["entry_rules"] for s in load_strategies(conn)}
+    expected = {}
+    for t in trades:
+        if t["strategy_compliance_rate"] is None or t["strategy_id"] not in rules:
+            continue
+        missing = set(decode_tags(t["strategy_missing_rules"]))
+        for rule in rules[t["strategy_id"]]:
+            met = rule["condition"] not in missing
+            expected.setdefault((t["strategy_id"], rule["condition"]), []).append(
+                (met, t["profit_or_loss"] or 0, t["rr_calculated"] or 0)
+            )
+    stats = load_rule_stats(conn)
+    if len(stats) != len(expected):
+        return False
+    for row in stats.itertuples(index=False):
+        outcomes = expected.get((row.strategy_id, row.rule))
+        if not outcomes or row.trades != len(outcomes):
+            return False
+        met = [o for o in outcomes if o[0]]
+        skipped = [o for o in outcomes if not o[0]]
+        if not _close(row.hit_rate, len(met) / len(outcomes)):
+            return False
+        for value, group, i in ((row.met_avg_pnl, met, 1), (row.skipped_avg_pnl, skipped, 1),
+                                (row.met_avg_rr, met, 2), (row.skipped_avg_rr, skipped, 2)):
+            if group and not _close(value, math.fsum(o[i] for o in group) / len(group)):
+                return False
+            if not group and not math.isnan(value):
+                return False
+    return True
+
+def _rollup_parity(conn, df):
+    """نمودار و خلاصه از روی trade_rollups = گروه‌بندی pandas روی معاملات خام"""
+    valid = df[df["trade_day"].notna()]
+    day = pd.to_datetime(valid["trade_day"].astype("int64"), unit="D")
+    keys = {
+        "day": day,
+        "week": day - pd.to_timedelta(valid["trade_weekday"].astype("int64"), unit="D"),
+        "month": day.dt.to_period("M").dt.start_time,
+    }
+    for bucket in PNL_BUCKETS:
+        expected = valid["profit_or_loss"].fillna(0).groupby(keys[bucket].to_numpy()).agg(["sum", "size"])
+        series = load_pnl_buckets(conn, bucket)
+        if not (series["bucket"].tolist() == expected.index.tolist()
+                and series["trades"].tolist() == expected["size"].tolist()
+                and np.allclose(series["pnl"], expected["sum"])):
+            return False
+    return _close(load_rollup_summary(conn), load_trade_summary(conn))
+
+def _risk_parity(conn, df):
+    """RiskEngine و risk_metrics_df = افزودن تک‌تک معاملات به RiskState"""
+    state = RiskState()
+    timed = df[df["trade_ts"].notna()].sort_values(["trade_ts", "id"])
+    for row in timed.itertuples():
+        rr = None if pd.isna(row.rr_calculated) else row.rr_calculated
+        state.add(row.profit_or_loss, rr, row.trade_ts, row.trade_day, row.id)
+    expected = state.metrics()
+    return (_close(RiskEngine().sync(conn).metrics(), expected)
+            and _close(risk_metrics_df(df), expected))
+
+def _monte_carlo_parity(df, paths=60, n_trades=40, risk=0.02, seed=0):
+    """شبیه‌سازی برداری = حلقه پایتونی روی همان اندیس‌ها؛ و نتیجه مستقل از تعداد worker"""
+    samples = outcome_samples(df)
+    if not len(samples):
+        return True
+    chunk = paths // 3
+    result = simulate(samples, paths, n_trades, risk, seed=seed, chunk_paths=chunk)
+    drawdowns, finals, ruined = [], [], []
+    for chunk_seed in np.random.SeedSequence(seed).spawn(3):
+        rng = np.random.default_rng(chunk_seed)
+        for row in rng.integers(0, len(samples), size=(chunk, n_trades)):
+            equity = peak = low = 1.0
+            drawdown = 0.0
+            for i in row:
+                equity *= 1 + max(samples[i] * risk, -1.0)
+                peak = max(peak, equity)
+                low = min(low, equity)
+                drawdown = max(drawdown, 1 - equity / peak)
+            drawdowns.append(drawdown)
+            finals.append(equity)
+            ruined.append(low <= 0.5)
+    pooled = simulate(samples, paths, n_trades, risk, seed=seed, chunk_paths=chunk, workers=2)
+    return (np.allclose(result["max_drawdowns"], drawdowns)
+            and math.isclose(result["expected_final_equity"], statistics.fmean(finals), rel_tol=1e-9)
+            and result["risk_of_ruin"] == statistics.fmean(ruined)
+            and np.array_equal(result["max_drawdowns"], pooled["max_drawdowns"]))
+
+WHATIF_MIXED = {
+    "name": "mixed", "skip_tags": ["Fear", "greed"], "min_compliance": 0.5, "sides": ["buy"],
+    "max_leverage": 3, "qty_scale": 0.5,
+}
+
+def _whatif_parity(trades, df):
+    """Replay = حلقه پایتونی روی معاملات با calculate_pnl_and_rr برای ردیف‌های تغییرکرده"""
+    replay = Replay(df)
+    for scenario in [*PRESET_SCENARIOS.values(), WHATIF_MIXED]:
+        kept, total = 0, 0.0
+        for trade in trades:
+            tags = {tag.casefold() for tag in trade["psychological_tags"]}
+            if tags & {tag.casefold() for tag in scenario.get("skip_tags", ())}:
+                continue
+            compliance = trade["strategy_compliance_rate"]
+            if "min_compliance" in scenario and (
+                compliance is None or compliance < scenario["min_compliance"]
+            ):
+                continue
+            if "sides" in scenario and trade["side"] not in scenario["sides"]:
+                continue
+            changed = dict(trade)
+            cap = scenario.get("max_leverage")
+            if cap is not None and trade["trade_type"] == "futures" and trade["leverage"] > cap:
+                changed["leverage"] = cap
+            changed["qty"] = trade["qty"] * scenario.get("qty_scale", 1)
+            pnl = (calculate_pnl_and_rr(changed)[0] if changed != trade
+                   else trade["profit_or_loss"] or 0.0)
+            kept += 1
+            total += pnl
+        result = replay.run(scenario)
+        if result["trades"] != kept or not math.isclose(
+            result["total_pnl"], total, rel_tol=1e-9, abs_tol=1e-6
+        ):
+            return False
+    return True
+
+def check_parity(trades, df, conn=None):
+    """خروجی نسخه‌های برداری را با نسخه‌های لیستی مقایسه می‌کند"""
+    pattern, pattern_df = learn_user_pattern(trades), learn_user_pattern_df(df)
+    if pattern and pattern_df:
+        # در حالت تساوی، نسخه لیستی به ترتیب set بستگی دارد
+        for key in ("common_side", "common_type"):
+            pattern.pop(key)
+            pattern_df.pop(key)
+    return {
+        "learn_user_pattern": _close(pattern, pattern_df),
+        "analyze_evolution": _close(analyze_evolution(trades), analyze_evolution_df(df)),
+        "analyze_strategy_performance": _close(
+            analyze_strategy_performance(trades), analyze_strategy_performance_df(df)
+        ),
+        "detect_strategy_change": detect_strategy_change(trades) == detect_strategy_change_df(df),
+        "get_recent_symbols": get_recent_symbols(trades) == get_recent_symbols_df(df),
+        "calculate_pnl_and_rr": _pnl_parity(trades, df),
+        "score_deviation_df": _deviation_parity(df),
+        "simulate": _monte_carlo_parity(df),
+        "Replay": _whatif_parity(trades, df),
+        **({
+            "ProfileEngine": _profile_parity(conn, df),
+            "load_tag_stats": _tag_stats_parity(conn, trades),
+            "load_rule_stats": _rule_stats_parity(conn, trades),
+            "search_trades": _search_parity(conn, trades),
+            "trade_rollups": _rollup_parity(conn, df),
+            "RiskEngine": _risk_parity(conn, df),
+        } if conn is not None else {}),
+    }
+
+def bench_size(path, n, repeat):
+    conn = connect_db(path)
+    create_tables(conn)  # ژورنال‌های ساخته‌شده با نسخه‌های قبلی هم مهاجرت کنند
+    trades = load_trades(conn)
+    df = load_trades_frame(conn)
+    pattern = learn_user_pattern(trades)
+    new_trade = dict(trades[0]) if trades else None
+    cache = QueryCache(path)
+    _rerun_pipeline(conn, cache)
+    report_worker = ReportWorker(path)
+    report_worker.get()
+
+    cases = {
+        "load_trades": lambda: load_trades(conn),
+        "load_trades_frame": lambda: load_trades_frame(conn),
+        "load_trade_summary": lambda: load_trade_summary(conn),
+        "learn_user_pattern": lambda: learn_user_pattern(trades),
+        "check_deviation": lambda: check_deviation(new_trade, pattern),
+        "analyze_evolution": lambda: analyze_evolution(trades),
+        "analyze_strategy_performance": lambda: analyze_strategy_performance(trades),
+        "detect_strategy_change": lambda: detect_strategy_change(trades),
+        "get_recent_symbols": lambda: get_recent_symbols(trades),
+        "learn_user_pattern_df": lambda: learn_user_pattern_df(df),
+        "analyze_evolution_df": lambda: analyze_evolution_df(df),
+        "analyze_strategy_performance_df": lambda: analyze_strategy_performance_df(df),
+        "detect_strategy_change_df": lambda: detect_strategy_change_df(df),
+        "calculate_pnl_and_rr_df": lambda: calculate_pnl_and_rr_df(df),
+        "score_deviation_df": lambda: score_deviation_df(df),
+        "ProfileEngine.sync": lambda: ProfileEngine().sync(conn).pattern(),
+        "load_tag_stats": lambda: load_tag_stats(conn),
+        "load_rule_stats": lambda: load_rule_stats(conn),
+        "search_trades_news": lambda: search_trades(conn, "news"),
+        "search_trades_fomo_p2": lambda: search_trades(conn, "fomo greed", offset=20),
+        "load_pnl_buckets_week": lambda: load_pnl_buckets(conn, "week"),
+        "load_rollup_summary": lambda: load_rollup_summary(conn),
+        "RiskEngine.seed": lambda: RiskEngine().sync(conn).metrics(),
+        "risk_metrics_df": lambda: risk_metrics_df(df),
+        "get_recent_symbols_df": lambda: get_recent_symbols_df(df),
+        "rerun_legacy": lambda: _legacy_pipeline(conn),
+        "rerun_cold": lambda: _rerun_pipeline(conn),
+        "rerun_cached": lambda: _rerun_pipeline(conn, cache),
+        "build_report": lambda: build_report(conn),
+        "report_worker_get": lambda: report_worker.get(wait=0),
+        "simulate_10k_x_1000": lambda: simulate(outcome_samples(df), 10000, 1000, seed=0),
+        "whatif_compare": lambda: Replay(df).compare([*PRESET_SCENARIOS.values(), WHATIF_MIXED]),
+    }
+    results = [
+        {"trades": n, "function": name, **_time(fn, repeat)}
+        for name, fn in cases.items()
+    ]
+    parity = check_parity(trades, df, conn)
+    conn.close()
+    return results, parity
+
+def run(sizes, seed=42, repeat=3, workdir=None):
+    tmp = workdir or tempfile.mkdtemp(prefix="journal-bench-")
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": [],
+        "parity": {},
+    }
+    try:
+        for n in sizes:
+            path = os.path.join(tmp, f"synthetic_{n}_{seed}.db")
+            if not os.path.exists(path):
+                start = time.perf_counter()
+                conn = connect_db(path)
+                fill_journal(conn, n, seed)
+                conn.close()
+                print(f"generated {n} trades in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            results, parity = bench_size(path, n, repeat)
+            report["results"].extend(results)
+            report["parity"][str(n)] = parity
+            for r in results:
+                print(f"{n:>9} {r['function']:<34} {r['best_s'] * 1000:10.2f} ms", file=sys.stderr)
+    finally:
+        if workdir is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return report
+
+def compare(report, baseline):
+    """نسبت زمان فعلی به baseline برای هر (اندازه، تابع)"""
+    old = {(r["trades"], r["function"]): r["best_s"] for r in baseline["results"]}
+    print(f"{'trades':>9} {'function':<34} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for r in report["results"]:
+        key = (r["trades"], r["function"])
+        if key in old:
+            print(f"{r['trades']:>9} {r['function']:<34} {old[key] * 1000:10.2f} "
+                  f"{r['best_s'] * 1000:10.2f} {r['best_s'] / old[key]:7.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic journal generator and analytics benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="fill a journal database with synthetic trades")
+    gen.add_argument("--trades", type=int, required=True)
+    gen.add_argument("--db", required=True)
+    gen.add_argument("--seed", type=int, default=42)
+
+    bench = sub.add_parser("run", help="time the analytics functions over synthetic journals")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    bench.add_argument("--seed", type=int, default=42)
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--workdir", help="keep generated databases here for reuse")
+    bench.add_argument("--out", default="bench_results.json")
+    bench.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        conn = connect_db(args.db)
+        fill_journal(conn, args.trades, args.seed)
+        print(f"Generated {args.trades} trades in {args.db}.")
+        return
+
+    report = run(args.sizes, args.seed, args.repeat, args.workdir)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.out}.")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
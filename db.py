@@ -0,0 +1,1669 @@
+# db.py
+import sqlite3
+import json
+import functools
+import hashlib
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import pandas as pd
+import numpy as np
+
+# --- اتصال به دیتابیس ---
+DB_PATH = os.environ.get('JOURNAL_DB_PATH', 'journal.db')
+CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# جدا تعریف شده‌اند تا نوشتن‌های دسته‌ای (save_trades و update_trade_results)
+# بتوانند کنارشان بگذارند (همین‌طور BATCH_INSERT_TRIGGERS؛ نگاه کنید به batch_writes)
+SUMMARY_INSERT_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trades_summary_insert AFTER INSERT ON trades
+    BEGIN
+        INSERT OR IGNORE INTO strategy_summary (strategy_key)
+        VALUES (IFNULL(NEW.strategy_id, 0));
+        UPDATE strategy_summary SET
+            pnl = pnl + IFNULL(NEW.profit_or_loss, 0),
+            rr_sum = rr_sum + IFNULL(NEW.rr_calculated, 0),
+            trade_count = trade_count + 1,
+            wins = wins + (IFNULL(NEW.profit_or_loss, 0) > 0),
+            losses = losses + (IFNULL(NEW.profit_or_loss, 0) <= 0)
+        WHERE strategy_key = IFNULL(NEW.strategy_id, 0);
+    END;
+"""
+
+SUMMARY_UPDATE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trades_summary_update
+    AFTER UPDATE OF strategy_id, profit_or_loss, rr_calculated ON trades
+    BEGIN
+        UPDATE strategy_summary SET
+            pnl = pnl - IFNULL(OLD.profit_or_loss, 0),
+            rr_sum = rr_sum - IFNULL(OLD.rr_calculated, 0),
+            trade_count = trade_count - 1,
+            wins = wins - (IFNULL(OLD.profit_or_loss, 0) > 0),
+            losses = losses - (IFNULL(OLD.profit_or_loss, 0) <= 0)
+        WHERE strategy_key = IFNULL(OLD.strategy_id, 0);
+        INSERT OR IGNORE INTO strategy_summary (strategy_key)
+        VALUES (IFNULL(NEW.strategy_id, 0));
+        UPDATE strategy_summary SET
+            pnl = pnl + IFNULL(NEW.profit_or_loss, 0),
+            rr_sum = rr_sum + IFNULL(NEW.rr_calculated, 0),
+            trade_count = trade_count + 1,
+            wins = wins + (IFNULL(NEW.profit_or_loss, 0) > 0),
+            losses = losses + (IFNULL(NEW.profit_or_loss, 0) <= 0)
+        WHERE strategy_key = IFNULL(NEW.strategy_id, 0);
+        DELETE FROM strategy_summary WHERE trade_count <= 0;
+    END;
+"""
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # خواننده‌ها نویسنده را قفل نمی‌کنند
+    "synchronous": "NORMAL",        # در WAL امن است و fsync کمتری دارد
+    "busy_timeout": 5000,
+    "cache_size": -64 * 1024,       # KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+class JournalConnection(sqlite3.Connection):
+    """اتصال sqlite با قفل نوشتن، تا یک اتصال نوشتن بین threadهای Streamlit مشترک باشد.
+
+    تراکنش‌های نوشتن (مثل save_trades) نباید با هم قاطی شوند. خواندن‌ها روی
+    این اتصال انجام نمی‌شوند (Journal.reader)، چون داخل تراکنش باز thread
+    دیگری داده commit نشده را می‌بینند.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_lock = threading.RLock()
+
+def connect_db(path=None, shared=False):
+    """اتصال تنظیم‌شده به دیتابیس؛ shared=True برای استفاده از چند thread"""
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        factory=JournalConnection,
+        check_same_thread=not shared
+    )
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+def _serialized_write(fn):
+    """نوشتن‌های روی یک اتصال مشترک را پشت write_lock آن سریالی می‌کند"""
+    @functools.wraps(fn)
+    def wrapper(conn, *args, **kwargs):
+        with getattr(conn, "write_lock", None) or nullcontext():
+            return fn(conn, *args, **kwargs)
+    return wrapper
+
+# --- مهاجرت‌های schema ---
+# نسخه schema در PRAGMA user_version ذخیره می‌شود و هر مهاجرت فقط یک بار، در
+# تراکنش خودش، اجرا می‌شود. ژورنال‌های قدیمی (نسخه 0) ممکن است بخشی از schema
+# را از قبل داشته باشند، برای همین مهاجرت‌های اولیه IF NOT EXISTS دارند.
+# مهاجرت جدید فقط به انتهای MIGRATIONS اضافه شود؛ ترتیب قبلی‌ها عوض نشود.
+
+def _migrate_base(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY,
+            symbol TEXT,
+            entry_price REAL,
+            exit_price REAL,
+            side TEXT,
+            qty REAL,
+            risk REAL,
+            trade_type TEXT,
+            leverage REAL,
+            psychological_tags TEXT,
+            market_context TEXT,
+            strategy_id INTEGER,
+            profit_or_loss REAL,
+            rr_calculated REAL,
+            trade_date TEXT,
+            strategy_compliance_rate REAL,
+            strategy_missing_rules TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS strategies (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE,
+            description TEXT,
+            entry_rules TEXT,
+            exit_rules TEXT,
+            created_at TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_date ON trades (trade_date, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_strategy ON trades (strategy_id, trade_date, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol ON trades (symbol, trade_date, id)")
+
+def _migrate_summary(cur):
+    # خلاصه تجمیعی هر استراتژی (0 = بدون استراتژی)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS strategy_summary (
+            strategy_key INTEGER PRIMARY KEY,
+            pnl REAL NOT NULL DEFAULT 0,
+            rr_sum REAL NOT NULL DEFAULT 0,
+            trade_count INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trades_summary_delete AFTER DELETE ON trades
+        BEGIN
+            UPDATE strategy_summary SET
+                pnl = pnl - IFNULL(OLD.profit_or_loss, 0),
+                rr_sum = rr_sum - IFNULL(OLD.rr_calculated, 0),
+                trade_count = trade_count - 1,
+                wins = wins - (IFNULL(OLD.profit_or_loss, 0) > 0),
+                losses = losses - (IFNULL(OLD.profit_or_loss, 0) <= 0)
+            WHERE strategy_key = IFNULL(OLD.strategy_id, 0);
+            DELETE FROM strategy_summary WHERE trade_count <= 0;
+        END
+    """)
+    cur.execute(SUMMARY_INSERT_TRIGGER)
+    cur.execute(SUMMARY_UPDATE_TRIGGER)
+    # دیتابیس‌های قدیمی: خلاصه را یک بار از روی تاریخچه بساز
+    cur.execute("SELECT EXISTS(SELECT 1 FROM strategy_summary)")
+    if not cur.fetchone()[0]:
+        _rebuild_summary(cur)
+
+# --- ستون‌های زمانی عددی ---
+# trade_ts میلی‌ثانیه از epoch (تاریخ بدون منطقه زمانی همان ساعت دیواری فرض می‌شود،
+# تاریخ با offset به UTC برده می‌شود)؛ ساعت، روز هفته (دوشنبه=0) و روز از epoch
+# همه از روی trade_ts گرد‌شده به دست می‌آیند تا پایتون و SQL یکسان باشند.
+TIME_COLUMNS = ("trade_ts", "trade_hour", "trade_weekday", "trade_day")
+EPOCH = datetime(1970, 1, 1)
+DAY_MS = 86400000
+
+TRADE_TS_SQL = "CAST(ROUND((julianday(trade_date) - 2440587.5) * 86400000) AS INTEGER)"
+TIME_BUCKETS_SQL = """
+    trade_hour = CAST(strftime('%H', trade_ts / 1000.0, 'unixepoch') AS INTEGER),
+    trade_weekday = (CAST(strftime('%w', trade_ts / 1000.0, 'unixepoch') AS INTEGER) + 6) % 7,
+    trade_day = CAST(julianday(trade_ts / 1000.0, 'unixepoch', 'start of day') - 2440587.5 AS INTEGER)
+"""
+
+def time_columns(trade_date):
+    """تاریخ ISO -> (trade_ts, trade_hour, trade_weekday, trade_day)؛ تاریخ نامعتبر -> None ها"""
+    try:
+        dt = datetime.fromisoformat(trade_date)
+    except (TypeError, ValueError):
+        return None, None, None, None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = dt - EPOCH
+    ts = delta.days * DAY_MS + delta.seconds * 1000 + (delta.microseconds + 500) // 1000
+    day = ts // DAY_MS
+    return ts, ts // 3600000 % 24, (day + 3) % 7, day
+
+def _migrate_time_columns(cur):
+    """ستون‌های زمانی را (اگر نیستند) اضافه و از روی trade_date پر می‌کند"""
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(trades)")}
+    for name in TIME_COLUMNS:
+        if name not in columns:
+            cur.execute(f"ALTER TABLE trades ADD COLUMN {name} INTEGER")
+    cur.execute(f"""
+        UPDATE trades SET trade_ts = {TRADE_TS_SQL}
+        WHERE trade_ts IS NULL AND trade_date IS NOT NULL
+    """)
+    cur.execute(f"""
+        UPDATE trades SET {TIME_BUCKETS_SQL}
+        WHERE trade_hour IS NULL AND trade_ts IS NOT NULL
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_ts ON trades (trade_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_weekday_hour ON trades (trade_weekday, trade_hour)")
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trades_time_update AFTER UPDATE OF trade_date ON trades
+        BEGIN
+            UPDATE trades SET trade_ts = {TRADE_TS_SQL} WHERE id = NEW.id;
+            UPDATE trades SET {TIME_BUCKETS_SQL} WHERE id = NEW.id;
+        END
+    """)
+
+# --- برچسب‌ها و قوانین رعایت‌نشده به صورت جدول ---
+# ستون‌های JSON همچنان ترتیب اصلی را برای نمایش نگه می‌دارند؛ جدول‌های زیر با
+# trigger همگام می‌مانند و فقط برای فیلتر و تجمیع در SQL هستند.
+# ستون JSON -> (جدول، ستون مقدار)
+TRADE_LABELS = {
+    "psychological_tags": ("trade_tags", "tag"),
+    "strategy_missing_rules": ("trade_missing_rules", "rule"),
+}
+
+def _json_array_sql(expr):
+    """خود آرایه JSON؛ JSON نامعتبر یا غیرآرایه مثل لیست خالی است"""
+    return f"CASE WHEN NOT json_valid({expr}) THEN '[]' WHEN json_type({expr}) = 'array' THEN {expr} ELSE '[]' END"
+
+def _json_items_sql(expr):
+    """عناصر متنی غیرخالی یک آرایه JSON"""
+    return f"json_each({_json_array_sql(expr)}) WHERE json_each.type = 'text' AND json_each.value != ''"
+
+def _label_insert_trigger(source, table, column):
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON trades
+        BEGIN
+            INSERT OR IGNORE INTO {table} (trade_id, {column})
+            SELECT NEW.id, json_each.value FROM {_json_items_sql(f"NEW.{source}")};
+        END
+    """
+
+LABEL_INSERT_TRIGGERS = {
+    f"{table}_insert": _label_insert_trigger(source, table, column)
+    for source, (table, column) in TRADE_LABELS.items()
+}
+
+def _insert_labels(cur, after_id=0):
+    """برچسب‌ها و قوانین معاملات با id بزرگ‌تر از after_id را یک‌جا از JSON پر می‌کند"""
+    for source, (table, column) in TRADE_LABELS.items():
+        cur.execute(f"""
+            INSERT OR IGNORE INTO {table} (trade_id, {column})
+            SELECT trades.id, json_each.value
+            FROM trades, {_json_items_sql(f"trades.{source}")} AND trades.id > ?
+        """, (after_id,))
+
+def _migrate_trade_labels(cur):
+    for source, (table, column) in TRADE_LABELS.items():
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                trade_id INTEGER NOT NULL,
+                {column} TEXT NOT NULL,
+                PRIMARY KEY (trade_id, {column})
+            ) WITHOUT ROWID
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column}, trade_id)")
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {source} ON trades
+            BEGIN
+                DELETE FROM {table} WHERE trade_id = OLD.id;
+                INSERT OR IGNORE INTO {table} (trade_id, {column})
+                SELECT NEW.id, json_each.value FROM {_json_items_sql(f"NEW.{source}")};
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON trades
+            BEGIN
+                DELETE FROM {table} WHERE trade_id = OLD.id;
+            END
+        """)
+    for trigger in LABEL_INSERT_TRIGGERS.values():
+        cur.execute(trigger)
+    _insert_labels(cur)
+
+# --- قوانین استراتژی و نتیجه هر قانون در هر معامله ---
+# قوانین ورود/خروج هر استراتژی از ستون‌های JSON جدول strategies در strategy_rules
+# نگه داشته می‌شوند. برای معاملاتی که رعایت استراتژی برایشان ثبت شده
+# (strategy_compliance_rate نه NULL)، هر قانون ورود یک ردیف met/skipped دارد.
+# قانونی که بعداً از استراتژی حذف شود برای حفظ تاریخچه پاک نمی‌شود.
+RULE_KINDS = {"entry": "entry_rules", "exit": "exit_rules"}
+
+def _upsert_rules_sql(strategy, kind):
+    """INSERT قوانین یک نوع از ردیف strategy (NEW یا strategies) در strategy_rules"""
+    rules = _json_array_sql(f"{strategy}.{RULE_KINDS[kind]}")
+    condition = "TRIM(json_extract(json_each.value, '$.condition'))"
+    return f"""
+        INSERT INTO strategy_rules (strategy_id, kind, position, condition, required)
+        SELECT {strategy}.id, '{kind}', json_each.key, {condition},
+               IFNULL(json_extract(json_each.value, '$.required'), 1) != 0
+        FROM {"strategies, " if strategy == "strategies" else ""}json_each({rules})
+        WHERE json_each.type = 'object' AND IFNULL({condition}, '') != ''
+        ON CONFLICT (strategy_id, kind, condition) DO UPDATE SET
+            position = excluded.position, required = excluded.required
+    """
+
+def _rule_outcomes_sql(trade):
+    """INSERT نتیجه قوانین ورود برای ردیف trade (NEW یا trades)"""
+    missing = f"SELECT json_each.value FROM {_json_items_sql(f'{trade}.strategy_missing_rules')}"
+    return f"""
+        INSERT OR IGNORE INTO trade_rule_outcomes (trade_id, rule_id, met)
+        SELECT {trade}.id, strategy_rules.id, strategy_rules.condition NOT IN ({missing})
+        FROM {"trades, " if trade == "trades" else ""}strategy_rules
+        WHERE strategy_rules.strategy_id = {trade}.strategy_id
+          AND strategy_rules.kind = 'entry'
+          AND {trade}.strategy_compliance_rate IS NOT NULL
+    """
+
+RULE_OUTCOMES_INSERT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS trade_rule_outcomes_insert AFTER INSERT ON trades
+    BEGIN
+        {_rule_outcomes_sql("NEW")};
+    END
+"""
+
+def _migrate_strategy_rules(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS strategy_rules (
+            id INTEGER PRIMARY KEY,
+            strategy_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            condition TEXT NOT NULL,
+            required INTEGER NOT NULL DEFAULT 1,
+            UNIQUE (strategy_id, kind, condition)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS trade_rule_outcomes (
+            trade_id INTEGER NOT NULL,
+            rule_id INTEGER NOT NULL,
+            met INTEGER NOT NULL,
+            PRIMARY KEY (trade_id, rule_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trade_rule_outcomes_rule ON trade_rule_outcomes (rule_id, met)")
+
+    for kind in RULE_KINDS:
+        cur.execute(_upsert_rules_sql("strategies", kind))
+    upserts = "".join(f"{_upsert_rules_sql('NEW', kind)};" for kind in RULE_KINDS)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS strategy_rules_insert AFTER INSERT ON strategies
+        BEGIN {upserts} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS strategy_rules_update
+        AFTER UPDATE OF entry_rules, exit_rules ON strategies
+        BEGIN {upserts} END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS strategy_rules_delete AFTER DELETE ON strategies
+        BEGIN
+            DELETE FROM trade_rule_outcomes WHERE rule_id IN (
+                SELECT id FROM strategy_rules WHERE strategy_id = OLD.id
+            );
+            DELETE FROM strategy_rules WHERE strategy_id = OLD.id;
+        END
+    """)
+
+    cur.execute(RULE_OUTCOMES_INSERT_TRIGGER)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trade_rule_outcomes_update
+        AFTER UPDATE OF strategy_id, strategy_compliance_rate, strategy_missing_rules ON trades
+        BEGIN
+            DELETE FROM trade_rule_outcomes WHERE trade_id = OLD.id;
+            {_rule_outcomes_sql("NEW")};
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trade_rule_outcomes_delete AFTER DELETE ON trades
+        BEGIN
+            DELETE FROM trade_rule_outcomes WHERE trade_id = OLD.id;
+        END
+    """)
+    _insert_rule_outcomes(cur)
+
+def _insert_rule_outcomes(cur, after_id=0):
+    cur.execute(f"{_rule_outcomes_sql('trades')} AND trades.id > ?", (after_id,))
+
+# --- جدول‌های تجمیعی زمانی (rollup) ---
+# برای هر بازه روز/هفته/ماه و هر (استراتژی، نماد): جمع PnL و R:R، تعداد و بردها.
+# کلید هر بازه شماره روز شروع آن از epoch است (هفته از دوشنبه).
+# triggerها فقط روزهای تغییرکرده را در rollup_dirty ثبت می‌کنند و هر نوشتن
+# قبل از commit همان بازه‌ها را دوباره از trades می‌سازد (_refresh_rollups).
+def _bucket_sql(grain, day, end=False):
+    """شروع (یا پایان انحصاری) بازه grain شامل روز day، هر دو به صورت شماره روز"""
+    if grain == "day":
+        return f"({day} + 1)" if end else day
+    if grain == "week":
+        start = f"({day} - (({day} + 3) % 7 + 7) % 7)"
+        return f"({start} + 7)" if end else start
+    shift = ", '+1 month'" if end else ""
+    return f"CAST(julianday({day} * 86400, 'unixepoch', 'start of month'{shift}) - 2440587.5 AS INTEGER)"
+
+ROLLUP_GRAINS = ("day", "week", "month")
+
+def _dirty_days_sql(trade):
+    return f"""
+        INSERT OR IGNORE INTO rollup_dirty (day)
+        SELECT {trade}.trade_day WHERE {trade}.trade_day IS NOT NULL
+    """
+
+ROLLUP_INSERT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS trade_rollups_insert AFTER INSERT ON trades
+    BEGIN
+        {_dirty_days_sql("NEW")};
+    END
+"""
+
+def _migrate_rollups(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS trade_rollups (
+            grain TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            strategy_key INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            pnl REAL NOT NULL,
+            rr_sum REAL NOT NULL,
+            trade_count INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            PRIMARY KEY (grain, bucket, strategy_key, symbol)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS rollup_dirty (day INTEGER PRIMARY KEY) WITHOUT ROWID")
+    cur.execute(ROLLUP_INSERT_TRIGGER)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trade_rollups_update
+        AFTER UPDATE OF trade_day, strategy_id, symbol, profit_or_loss, rr_calculated ON trades
+        BEGIN
+            {_dirty_days_sql("OLD")};
+            {_dirty_days_sql("NEW")};
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trade_rollups_delete AFTER DELETE ON trades
+        BEGIN
+            {_dirty_days_sql("OLD")};
+        END
+    """)
+    cur.execute("INSERT OR IGNORE INTO rollup_dirty (day) SELECT DISTINCT trade_day FROM trades WHERE trade_day IS NOT NULL")
+    _refresh_rollups(cur)
+
+def _refresh_rollups(cur):
+    """بازه‌های شامل روزهای rollup_dirty را دوباره می‌سازد: روزانه از trades (با
+    ایندکس trade_ts)، هفتگی و ماهانه از ردیف‌های روزانه همان بازه"""
+    cur.execute("SELECT EXISTS(SELECT 1 FROM rollup_dirty)")
+    if not cur.fetchone()[0]:
+        return
+    for grain in ROLLUP_GRAINS:
+        start, end = _bucket_sql(grain, "day"), _bucket_sql(grain, "day", end=True)
+        cur.execute(f"""
+            DELETE FROM trade_rollups
+            WHERE grain = ? AND bucket IN (SELECT {start} FROM rollup_dirty)
+        """, (grain,))
+        if grain == "day":
+            cur.execute(f"""
+                INSERT INTO trade_rollups (grain, bucket, strategy_key, symbol, pnl, rr_sum, trade_count, wins)
+                SELECT 'day', b.day, IFNULL(t.strategy_id, 0), IFNULL(t.symbol, ''),
+                       SUM(IFNULL(t.profit_or_loss, 0)), SUM(IFNULL(t.rr_calculated, 0)),
+                       COUNT(*), SUM(IFNULL(t.profit_or_loss, 0) > 0)
+                FROM rollup_dirty b
+                JOIN trades t ON t.trade_ts >= b.day * {DAY_MS} AND t.trade_ts < (b.day + 1) * {DAY_MS}
+                GROUP BY b.day, IFNULL(t.strategy_id, 0), IFNULL(t.symbol, '')
+            """)
+            continue
+        cur.execute(f"""
+            INSERT INTO trade_rollups (grain, bucket, strategy_key, symbol, pnl, rr_sum, trade_count, wins)
+            SELECT ?, b.bucket, r.strategy_key, r.symbol,
+                   SUM(r.pnl), SUM(r.rr_sum), SUM(r.trade_count), SUM(r.wins)
+            FROM (SELECT DISTINCT {start} AS bucket, {end} AS bucket_end FROM rollup_dirty) b
+            JOIN trade_rollups r ON r.grain = 'day' AND r.bucket >= b.bucket AND r.bucket < b.bucket_end
+            GROUP BY b.bucket, r.strategy_key, r.symbol
+        """, (grain,))
+    cur.execute("DELETE FROM rollup_dirty")
+
+@_serialized_write
+def refresh_rollups(conn):
+    """برای تغییراتی که بیرون از توابع این ماژول (مثلاً با SQL دستی) انجام شده‌اند"""
+    cur = conn.cursor()
+    _refresh_rollups(cur)
+    conn.commit()
+
+# --- جستجوی متنی (FTS5) روی نماد، زمینه بازار و برچسب‌ها ---
+# trades_fts یک سند برای هر معامله (rowid = trades.id) دارد که triggerها همگام
+# نگهش می‌دارند. توکنایزر unicode61 حروف فارسی را می‌شناسد ولی نیم‌فاصله و
+# اعراب را جداکننده می‌گیرد و ي/ك عربی را با ی/ک فارسی یکی نمی‌داند؛ برای همین
+# متن سند در SQL و متن جستجو در پایتون با همین SEARCH_CHAR_MAP یکسان می‌شوند.
+# ارقام فارسی و عربی در سند همان‌طور می‌مانند و کلمه عددی جستجو به هر سه خط
+# جستجو می‌شود (SEARCH_DIGITS)؛ زنجیره replace() در trigger جای بیشتری ندارد.
+SEARCH_CHAR_MAP = {
+    "\u064a": "\u06cc", "\u0649": "\u06cc",    # ي ى -> ی
+    "\u0643": "\u06a9",                        # ك -> ک
+    "\u0629": "\u0647", "\u06c0": "\u0647",    # ة ۀ -> ه
+    "\u0623": "\u0627", "\u0625": "\u0627",    # أ إ -> ا
+    "\u200c": "", "\u200d": "", "\u200e": "", "\u200f": "",  # نیم‌فاصله و نشانه‌های جهت
+    "\u0640": "",                              # کشیده
+    **{chr(c): "" for c in range(0x064b, 0x0656)}, "\u0670": "",  # اعراب و همزه روی حرف
+}
+SEARCH_DIGITS = ("0123456789", "۰۱۲۳۴۵۶۷۸۹", "٠١٢٣٤٥٦٧٨٩")
+_SEARCH_TRANSLATION = str.maketrans(SEARCH_CHAR_MAP)
+SEARCH_COLUMNS = ("symbol", "context", "tags")
+SEARCH_WEIGHTS = (4.0, 1.0, 2.0)  # وزن bm25 هر ستون؛ تطابق نماد و برچسب مهم‌تر از متن آزاد
+
+def normalize_search_text(text):
+    """همان یکسان‌سازی سندهای trades_fts، برای متن جستجو"""
+    return (text or "").translate(_SEARCH_TRANSLATION)
+
+SEARCH_SQL_CHUNK = 12  # replace()های تو در تو در هر زیرکوئری؛ بیشتر به parser stack overflow می‌خورد
+
+def _normalize_sql(expr):
+    """normalize_search_text در SQL، به صورت زیرکوئری‌های پشت سر هم از replace()"""
+    items = list(SEARCH_CHAR_MAP.items())
+    for start in range(0, len(items), SEARCH_SQL_CHUNK):
+        value = "v"
+        for src, dst in items[start:start + SEARCH_SQL_CHUNK]:
+            value = f"replace({value}, char({ord(src)}), {f'char({ord(dst)})' if dst else repr('')})"
+        expr = f"(SELECT {value} FROM (SELECT {expr} AS v))"
+    return expr
+
+def _search_doc_sql(trade):
+    """ستون‌های سند جستجوی یک معامله (trade: NEW یا trades)"""
+    tags = f"(SELECT group_concat(json_each.value, ' ') FROM {_json_items_sql(f'{trade}.psychological_tags')})"
+    return ", ".join(
+        _normalize_sql(f"IFNULL({expr}, '')")
+        for expr in (f"{trade}.symbol", f"{trade}.market_context", tags)
+    )
+
+SEARCH_INSERT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS trades_fts_insert AFTER INSERT ON trades
+    BEGIN
+        INSERT INTO trades_fts (rowid, {", ".join(SEARCH_COLUMNS)})
+        SELECT NEW.id, {_search_doc_sql("NEW")};
+    END
+"""
+
+def _search_doc(symbol, market_context, tags_json):
+    """همان سند _search_doc_sql در پایتون؛ برای درج دسته‌ای، که زنجیره replace()
+    در SQL برای هر ردیف کندتر از خود ایندکس FTS است"""
+    tags = decode_tags(tags_json)
+    tags = " ".join(t for t in tags if isinstance(t, str) and t) if isinstance(tags, list) else ""
+    return tuple(normalize_search_text(text) for text in (symbol, market_context, tags))
+
+def _insert_search_docs(cur, after_id=0):
+    rows = cur.execute(
+        "SELECT id, symbol, market_context, psychological_tags FROM trades WHERE id > ?", (after_id,)
+    ).fetchall()
+    cur.executemany(
+        f"INSERT INTO trades_fts (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES (?, ?, ?, ?)",
+        [(trade_id, *_search_doc(*row)) for trade_id, *row in rows]
+    )
+
+def _migrate_search(cur):
+    cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS trades_fts USING fts5(
+            {", ".join(SEARCH_COLUMNS)},
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    cur.execute(SEARCH_INSERT_TRIGGER)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trades_fts_update
+        AFTER UPDATE OF symbol, market_context, psychological_tags ON trades
+        BEGIN
+            DELETE FROM trades_fts WHERE rowid = OLD.id;
+            INSERT INTO trades_fts (rowid, {", ".join(SEARCH_COLUMNS)})
+            SELECT NEW.id, {_search_doc_sql("NEW")};
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trades_fts_delete AFTER DELETE ON trades
+        BEGIN
+            DELETE FROM trades_fts WHERE rowid = OLD.id;
+        END
+    """)
+    _insert_search_docs(cur)
+
+# triggerهای درج معامله که save_trades برای دسته‌ها کنار می‌گذارد
+BATCH_INSERT_TRIGGERS = {
+    **LABEL_INSERT_TRIGGERS,
+    "trade_rule_outcomes_insert": RULE_OUTCOMES_INSERT_TRIGGER,
+    "trade_rollups_insert": ROLLUP_INSERT_TRIGGER,
+    "trades_fts_insert": SEARCH_INSERT_TRIGGER,
+}
+
+def _insert_trade_details(cur, after_id):
+    """کار triggerهای BATCH_INSERT_TRIGGERS برای ردیف‌های با id بزرگ‌تر از after_id"""
+    _insert_labels(cur, after_id)
+    _insert_rule_outcomes(cur, after_id)
+    _insert_search_docs(cur, after_id)
+    cur.execute("""
+        INSERT OR IGNORE INTO rollup_dirty (day)
+        SELECT DISTINCT trade_day FROM trades WHERE id > ? AND trade_day IS NOT NULL
+    """, (after_id,))
+
+# --- کلیدهای یکتای ارسال‌های API ---
+# هر معامله‌ای که از ingest.py می‌آید client_id فرستنده را دارد؛ ارسال دوباره
+# همان کلید (مثلاً retry ربات) همان trade_id را برمی‌گرداند و ردیف تازه نمی‌سازد.
+# کلید با حذف معامله پاک نمی‌شود تا retry دیرهنگام آن را دوباره نسازد.
+def _migrate_ingest_keys(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_keys (
+            client_id TEXT PRIMARY KEY,
+            trade_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+# --- کنار گذاشتن triggerهای ردیفی در نوشتن‌های دسته‌ای ---
+# نوشتن دسته‌ای به جای DROP/CREATE TRIGGER (که schema را عوض می‌کند و همه
+# اتصال‌های دیگر را به prepare دوباره statementها وادار می‌کند) داخل تراکنش
+# خودش یک ردیف در batch_writes می‌گذارد و قبل از commit برمی‌دارد. این ردیف
+# هرگز commit نمی‌شود، پس برای اتصال‌های دیگر triggerها همیشه فعال‌اند.
+BATCH_GUARD_SQL = "NOT EXISTS (SELECT 1 FROM batch_writes)"
+
+# triggerهایی که نوشتن دسته‌ای کارشان را خودش یک‌جا انجام می‌دهد
+GUARDED_TRIGGERS = {
+    "trades_summary_insert": SUMMARY_INSERT_TRIGGER,
+    "trades_summary_update": SUMMARY_UPDATE_TRIGGER,
+    **BATCH_INSERT_TRIGGERS,
+}
+
+def _guarded_trigger(sql):
+    """همان trigger با WHEN BATCH_GUARD_SQL"""
+    head, begin, body = sql.partition("BEGIN")
+    return f"{head.rstrip()}\n    WHEN {BATCH_GUARD_SQL}\n    {begin}{body}"
+
+def _migrate_batch_guard(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS batch_writes (active INTEGER PRIMARY KEY)")
+    for name, sql in GUARDED_TRIGGERS.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(_guarded_trigger(sql))
+
+class _BatchWrite:
+    """triggerهای GUARDED_TRIGGERS را فقط برای تراکنش جاری cur کنار می‌گذارد"""
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def __enter__(self):
+        self.cur.execute("INSERT OR IGNORE INTO batch_writes (active) VALUES (1)")
+
+    def __exit__(self, *exc):
+        self.cur.execute("DELETE FROM batch_writes")
+
+# --- ایندکس‌های ترتیب زمانی روی trade_ts ---
+# فیلتر، ترتیب و cursor معاملات از trade_date متنی به trade_ts رفته‌اند؛
+# ایندکس‌های ترکیبی trade_date دیگر استفاده نمی‌شوند.
+def _migrate_ts_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_ts ON trades (symbol, trade_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_strategy_ts ON trades (strategy_id, trade_ts)")
+    for name in ("idx_trades_date", "idx_trades_strategy", "idx_trades_symbol"):
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+MIGRATIONS = [
+    (1, _migrate_base),
+    (2, _migrate_summary),
+    (3, _migrate_time_columns),
+    (4, _migrate_trade_labels),
+    (5, _migrate_strategy_rules),
+    (6, _migrate_rollups),
+    (7, _migrate_ingest_keys),
+    (8, _migrate_search),
+    (9, _migrate_ts_indexes),
+    (10, _migrate_batch_guard),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+@_serialized_write
+def migrate(conn):
+    """مهاجرت‌های اجرانشده را به ترتیب اعمال می‌کند؛ خروجی: نسخه‌های اعمال‌شده.
+
+    هر مهاجرت با BEGIN IMMEDIATE قفل نوشتن را می‌گیرد و نسخه را دوباره
+    می‌خواند، تا اگر پروسه دیگری همزمان همان مهاجرت را اجرا کرده، تکرار نشود.
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+    if conn.in_transaction:
+        conn.commit()
+    applied = []
+    cur = conn.cursor()
+    for version, step in MIGRATIONS:
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(cur)
+            cur.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def create_tables(conn):
+    """schema ژورنال را به آخرین نسخه می‌رساند (نام قدیمی برای سازگاری) و
+    rollupهای تغییرات بیرونی را به‌روز می‌کند"""
+    applied = migrate(conn)
+    refresh_rollups(conn)
+    return applied
+
+def _rebuild_summary(cur):
+    cur.execute("DELETE FROM strategy_summary")
+    cur.execute("""
+        INSERT INTO strategy_summary (strategy_key, pnl, rr_sum, trade_count, wins, losses)
+        SELECT IFNULL(strategy_id, 0),
+               SUM(IFNULL(profit_or_loss, 0)),
+               SUM(IFNULL(rr_calculated, 0)),
+               COUNT(*),
+               SUM(IFNULL(profit_or_loss, 0) > 0),
+               SUM(IFNULL(profit_or_loss, 0) <= 0)
+        FROM trades
+        GROUP BY IFNULL(strategy_id, 0)
+    """)
+
+@_serialized_write
+def rebuild_trade_summary(conn):
+    """خلاصه استراتژی‌ها را از صفر از جدول trades می‌سازد"""
+    _rebuild_summary(conn.cursor())
+    conn.commit()
+
+# --- بارگذاری معاملات ---
+def _row_to_trade(r):
+    trade = {
+        "id": r[0], "symbol": r[1], "entry_price": r[2], "exit_price": r[3],
+        "side": r[4], "qty": r[5], "risk": r[6], "trade_type": r[7],
+        "leverage": r[8], "market_context": r[10],
+        "profit_or_loss": r[12], "rr_calculated": r[13], "trade_date": r[14],
+        "strategy_id": r[11],
+        "strategy_compliance_rate": r[15],
+        "strategy_missing_rules": r[16],
+        "trade_ts": r[17], "trade_hour": r[18],
+        "trade_weekday": r[19], "trade_day": r[20],
+    }
+    trade["psychological_tags"] = decode_tags(r[9])
+    return trade
+
+def load_trades(conn):
+    cur = conn.cursor()
+    cur.execute(f"SELECT * FROM trades ORDER BY {TRADE_ORDER_SQL}")
+    return [_row_to_trade(r) for r in cur.fetchall()]
+
+# --- فیلتر و صفحه‌بندی معاملات ---
+# ترتیب همه مسیرها (trade_ts DESC, id DESC) است؛ معاملات بدون تاریخ معتبر
+# (trade_ts NULL) در انتها می‌آیند.
+TRADE_ORDER_SQL = "trade_ts DESC, id DESC"
+
+def _day_number(day):
+    """date -> شماره روز از epoch (همان trade_day و bucket روزانه rollup)"""
+    return (day - EPOCH.date()).days
+
+def _trade_filters(start_date=None, end_date=None, symbol=None, strategy_id=None, tag=None):
+    """شرط WHERE و پارامترها را برای فیلترهای تاریخ، نماد، استراتژی و برچسب می‌سازد.
+
+    start_date و end_date از نوع date هستند و end_date خودش هم شامل می‌شود.
+    مرز روزها مثل trade_day و rollupها به UTC روی trade_ts است، نه مقایسه
+    متن trade_date (که با offset منطقه زمانی ممکن است روز دیگری باشد).
+    strategy_id=0 یعنی معاملات بدون استراتژی.
+    """
+    clauses, params = [], []
+    if start_date:
+        clauses.append("trade_ts >= ?")
+        params.append(_day_number(start_date) * DAY_MS)
+    if end_date:
+        clauses.append("trade_ts < ?")
+        params.append((_day_number(end_date) + 1) * DAY_MS)
+    if symbol:
+        clauses.append("symbol = ?")
+        params.append(symbol)
+    if strategy_id == 0:
+        clauses.append("(strategy_id IS NULL OR strategy_id = 0)")
+    elif strategy_id is not None:
+        clauses.append("strategy_id = ?")
+        params.append(strategy_id)
+    if tag:
+        clauses.append("id IN (SELECT trade_id FROM trade_tags WHERE tag = ?)")
+        params.append(tag)
+    return clauses, params
+
+def query_trades(conn, start_date=None, end_date=None, symbol=None,
+                 strategy_id=None, tag=None, before=None, limit=20):
+    """یک صفحه از معاملات (جدیدترین اول) با صفحه‌بندی keyset.
+
+    before همان cursor برگشتی از صفحه قبل است: (trade_ts, id) آخرین ردیف.
+    خروجی: (لیست معاملات، cursor صفحه بعد یا None)
+    """
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    if before is not None and before[0] is None:
+        clauses.append("(trade_ts IS NULL AND id < ?)")
+        params.append(before[1])
+    elif before is not None:
+        clauses.append("(trade_ts < ? OR trade_ts IS NULL OR (trade_ts = ? AND id < ?))")
+        params.extend([before[0], before[0], before[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT * FROM trades {where}
+        ORDER BY {TRADE_ORDER_SQL}
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = cur.fetchall()
+
+    page = [_row_to_trade(r) for r in rows[:limit]]
+    next_cursor = (page[-1]["trade_ts"], page[-1]["id"]) if len(rows) > limit else None
+    return page, next_cursor
+
+def load_symbols(conn):
+    """همه نمادهای ثبت‌شده (از روی ایندکس نماد)"""
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT symbol FROM trades WHERE symbol IS NOT NULL AND symbol != '' ORDER BY symbol")
+    return [r[0] for r in cur.fetchall()]
+
+def load_recent_symbols(conn, limit=10):
+    """نمادهای یکتای اخیر (معادل get_recent_symbols)؛ از جدیدترین معامله پیمایش
+    می‌کند و به محض پیدا شدن limit نماد متوقف می‌شود"""
+    cur = conn.cursor()
+    cur.execute(f"SELECT symbol FROM trades ORDER BY {TRADE_ORDER_SQL}")
+    unique = []
+    while len(unique) < limit:
+        rows = cur.fetchmany(256)
+        if not rows:
+            break
+        for (symbol,) in rows:
+            if symbol and symbol not in unique:
+                unique.append(symbol)
+                if len(unique) == limit:
+                    break
+    cur.close()
+    return unique
+
+SEARCH_OPERATORS = {"or": "OR", "یا": "OR"}
+# هر رقم از هر خط به رقم همان مقدار در یک خط مشخص
+_DIGIT_TABLES = [
+    str.maketrans("".join(SEARCH_DIGITS), script * len(SEARCH_DIGITS)) for script in SEARCH_DIGITS
+]
+
+def _fts_query(text):
+    """عبارت MATCH امن از متن کاربر؛ هر کلمه پیشوند است (BTC -> BTCUSDT) و
+    کلمه‌ها با AND، یا با OR/«یا» بینشان، ترکیب می‌شوند. بدون کلمه: None"""
+    terms = []
+    for word in normalize_search_text(text).split():
+        operator = SEARCH_OPERATORS.get(word.casefold())
+        if operator:
+            if terms and terms[-1] != operator:
+                terms.append(operator)
+        elif any(ch.isalnum() for ch in word):
+            variants = dict.fromkeys(word.translate(table) for table in _DIGIT_TABLES)
+            phrase = " OR ".join('"{}"*'.format(v.replace('"', '""')) for v in variants)
+            terms.append(phrase if len(variants) == 1 else f"({phrase})")
+    while terms and terms[-1] == "OR":
+        terms.pop()
+    return " ".join(terms) or None
+
+def search_trades(conn, text, start_date=None, end_date=None, symbol=None,
+                  strategy_id=None, tag=None, offset=0, limit=20):
+    """یک صفحه از معاملاتی که نماد، زمینه بازار یا برچسب‌هایشان با text می‌خواند،
+    مرتب‌شده بر اساس bm25 (مرتبط‌ترین اول)؛ فیلترها مثل query_trades.
+
+    خروجی: (لیست معاملات، تعداد کل نتیجه‌ها)
+    """
+    match = _fts_query(text)
+    if match is None:
+        return [], 0
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    # رتبه‌بندی و صفحه‌بندی داخل FTS، تا فقط ردیف‌های همین صفحه از trades خوانده شوند
+    where = "trades_fts MATCH ?"
+    if clauses:
+        # +rowid: شرط به FTS5 داده نشود، وگرنه MATCH برای تک‌تک idها دوباره اجرا می‌شود
+        where += f" AND +rowid IN (SELECT id FROM trades WHERE {' AND '.join(clauses)})"
+    weights = ", ".join(map(str, SEARCH_WEIGHTS))
+
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT trades.* FROM (
+            SELECT rowid AS trade_id, bm25(trades_fts, {weights}) AS score
+            FROM trades_fts WHERE {where}
+            ORDER BY score, rowid DESC
+            LIMIT ? OFFSET ?
+        ) m JOIN trades ON trades.id = m.trade_id
+        ORDER BY m.score, trades.id DESC
+    """, [match] + params + [limit, offset])
+    page = [_row_to_trade(r) for r in cur.fetchall()]
+    if offset == 0 and len(page) < limit:
+        return page, len(page)
+    cur.execute(f"SELECT COUNT(*) FROM trades_fts WHERE {where}", [match] + params)
+    return page, cur.fetchone()[0]
+
+def load_recent_trades(conn, limit=5):
+    """فقط آخرین معاملات (برای الگوی رفتاری که به lookback معامله نیاز دارد)"""
+    return query_trades(conn, limit=limit)[0]
+
+def load_trades_after(conn, after_id, limit=None):
+    """معاملاتی که بعد از after_id ثبت شده‌اند (به ترتیب id)؛ برای به‌روزرسانی افزایشی"""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT * FROM trades WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, -1 if limit is None else limit)
+    )
+    return [_row_to_trade(r) for r in cur.fetchall()]
+
+def load_trade_results(conn, after_id=0):
+    """(id, trade_ts, trade_day, profit_or_loss, rr_calculated) معاملات بعد از after_id
+    به ترتیب id؛ برای شاخص‌های ریسک که به کل ستون‌ها نیاز ندارند.
+
+    مرتب‌سازی زمانی با فراخواننده است: ORDER BY trade_ts اینجا SQLite را به
+    پیمایش کل ایندکس زمان می‌کشاند، حتی وقتی فقط چند ردیف تازه لازم است.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, trade_ts, trade_day, profit_or_loss, rr_calculated FROM trades
+        WHERE id > ? ORDER BY id
+    """, (after_id,))
+    return cur.fetchall()
+
+def max_trade_id(conn):
+    return conn.execute("SELECT IFNULL(MAX(id), 0) FROM trades").fetchone()[0]
+
+# --- بارگذاری ستونی معاملات ---
+TRADE_COLUMNS = {
+    "id": "int64", "symbol": object, "entry_price": "float64",
+    "exit_price": "float64", "side": object, "qty": "float64",
+    "risk": "float64", "trade_type": object, "leverage": "float64",
+    "tags_json": object, "market_context": object, "strategy_id": "Int64",
+    "profit_or_loss": "float64", "rr_calculated": "float64",
+    "trade_date": object, "strategy_compliance_rate": "float64",
+    "strategy_missing_rules": object, "trade_ts": "Int64", "trade_hour": "Int64",
+    "trade_weekday": "Int64", "trade_day": "Int64",
+}
+
+def decode_tags(raw):
+    try:
+        return json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+
+def load_trades_frame(conn, start_date=None, end_date=None, symbol=None,
+                      strategy_id=None, tag=None):
+    """معاملات را مستقیم به صورت ستون‌های تایپ‌دار pandas برمی‌گرداند (جدیدترین اول)"""
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {", ".join(c if c != "tags_json" else "psychological_tags" for c in TRADE_COLUMNS)}
+        FROM trades {where} ORDER BY {TRADE_ORDER_SQL}
+    """, params)
+    rows = cur.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(TRADE_COLUMNS)
+
+    data = {}
+    for (name, dtype), values in zip(TRADE_COLUMNS.items(), columns):
+        if dtype is object:
+            arr = np.empty(len(values), dtype=object)
+            arr[:] = values
+            data[name] = arr
+        elif dtype == "Int64":
+            data[name] = pd.array(values, dtype="Int64")
+        else:
+            data[name] = np.array(values, dtype=dtype)
+    df = pd.DataFrame(data)
+
+    # برچسب‌ها: هر ترکیب یکتا فقط یک بار decode می‌شود
+    df["tags_json"] = df["tags_json"].astype("category")
+    decoded = [decode_tags(raw) for raw in df["tags_json"].cat.categories]
+    codes = df["tags_json"].cat.codes.to_numpy()
+    lookup = np.empty(len(decoded) + 1, dtype=object)
+    lookup[:len(decoded)] = decoded
+    lookup[-1] = []
+    df["psychological_tags"] = lookup[codes]
+    df["trade_time"] = pd.to_datetime(df["trade_ts"], unit="ms")
+    return df
+
+# --- تجمیع PnL برای نمودارها ---
+# کلید هر بازه: شماره روز شروع آن از epoch؛ هفته از دوشنبه شروع می‌شود
+PNL_BUCKETS = ROLLUP_GRAINS
+
+def _rollup_filters(start_date=None, end_date=None, symbol=None, strategy_id=None):
+    """معادل _trade_filters روی trade_rollups (فقط برای بازه‌های روزانه دقیق است)"""
+    clauses, params = [], []
+    if start_date:
+        clauses.append("bucket >= ?")
+        params.append(_day_number(start_date))
+    if end_date:
+        clauses.append("bucket <= ?")
+        params.append(_day_number(end_date))
+    if symbol:
+        clauses.append("symbol = ?")
+        params.append(symbol)
+    if strategy_id is not None:
+        clauses.append("strategy_key = ?")
+        params.append(strategy_id)
+    return clauses, params
+
+def _pnl_bucket_rows(conn, bucket, start_date, end_date, symbol, strategy_id, tag):
+    if tag:
+        # برچسب در rollup نیست: مستقیم از trades
+        clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+        clauses.append("trade_day IS NOT NULL")
+        return conn.execute(f"""
+            SELECT {_bucket_sql(bucket, "trade_day")} AS b, SUM(IFNULL(profit_or_loss, 0)), COUNT(*)
+            FROM trades WHERE {' AND '.join(clauses)}
+            GROUP BY b ORDER BY b
+        """, params).fetchall()
+
+    clauses, params = _rollup_filters(start_date, end_date, symbol, strategy_id)
+    if start_date or end_date:
+        # بازه دلخواه: از rollup روزانه، دوباره گروه‌بندی به هفته/ماه
+        grain, key = "day", _bucket_sql(bucket, "bucket")
+    else:
+        grain, key = bucket, "bucket"
+    return conn.execute(f"""
+        SELECT {key} AS b, SUM(pnl), SUM(trade_count)
+        FROM trade_rollups WHERE {' AND '.join(["grain = ?"] + clauses)}
+        GROUP BY b ORDER BY b
+    """, [grain] + params).fetchall()
+
+def load_pnl_buckets(conn, bucket="day", start_date=None, end_date=None,
+                     symbol=None, strategy_id=None, tag=None):
+    """جمع PnL هر روز/هفته/ماه از جدول trade_rollups (قدیمی‌ترین اول).
+
+    ستون‌ها: bucket (Timestamp)، pnl، trades و equity (منحنی سرمایه تجمعی).
+    """
+    rows = _pnl_bucket_rows(conn, bucket, start_date, end_date, symbol, strategy_id, tag)
+    df = pd.DataFrame(rows, columns=["bucket", "pnl", "trades"])
+    df["bucket"] = pd.to_datetime(df["bucket"].astype("int64"), unit="D")
+    df["pnl"] = df["pnl"].astype("float64")
+    df["equity"] = df["pnl"].cumsum()
+    return df
+
+def load_rollup_summary(conn, start_date=None, end_date=None, symbol=None, strategy_id=None):
+    """همان خروجی load_trade_summary برای یک بازه فیلترشده، از روی trade_rollups.
+
+    بدون فیلتر تاریخ از rollup ماهانه و با آن از rollup روزانه خوانده می‌شود.
+    معاملات بدون تاریخ معتبر در rollup نیستند.
+    """
+    clauses, params = _rollup_filters(start_date, end_date, symbol, strategy_id)
+    grain = "day" if start_date or end_date else "month"
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT strategy_key, SUM(pnl), SUM(rr_sum), SUM(trade_count), SUM(wins),
+               SUM(trade_count) - SUM(wins), strategies.name
+        FROM trade_rollups LEFT JOIN strategies ON strategies.id = strategy_key
+        WHERE {' AND '.join(["grain = ?"] + clauses)}
+        GROUP BY strategy_key
+    """, [grain] + params)
+    return _summary_from_rows(cur.fetchall())
+
+# --- تحلیل در سطح برچسب ---
+def load_tags(conn):
+    """همه برچسب‌های به‌کاررفته (از روی ایندکس برچسب)"""
+    return [r[0] for r in conn.execute("SELECT DISTINCT tag FROM trade_tags ORDER BY tag")]
+
+def load_tag_stats(conn, start_date=None, end_date=None, symbol=None,
+                   strategy_id=None, tag=None):
+    """تعداد، درصد برد، PnL و R:R معاملات هر برچسب با یک GROUP BY روی trade_tags.
+
+    معامله‌ای با چند برچسب در ردیف هر کدام شمرده می‌شود.
+    ستون‌ها: tag، trades، win_rate، total_pnl، avg_pnl و avg_rr (پرتکرارترین اول).
+    """
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT trade_tags.tag, COUNT(*),
+               AVG(IFNULL(profit_or_loss, 0) > 0),
+               SUM(IFNULL(profit_or_loss, 0)),
+               AVG(IFNULL(profit_or_loss, 0)),
+               AVG(IFNULL(rr_calculated, 0))
+        FROM trade_tags JOIN trades ON trades.id = trade_tags.trade_id
+        {where}
+        GROUP BY trade_tags.tag
+        ORDER BY COUNT(*) DESC, trade_tags.tag
+    """, params)
+    return pd.DataFrame(
+        cur.fetchall(),
+        columns=["tag", "trades", "win_rate", "total_pnl", "avg_pnl", "avg_rr"]
+    )
+
+# --- تحلیل رعایت قوانین استراتژی ---
+RULE_STATS_COLUMNS = [
+    "strategy_id", "strategy_name", "rule", "required", "trades", "hit_rate",
+    "met_avg_pnl", "skipped_avg_pnl", "met_avg_rr", "skipped_avg_rr",
+]
+
+def load_rule_stats(conn, start_date=None, end_date=None, symbol=None,
+                    strategy_id=None, tag=None):
+    """برای هر قانون ورود هر استراتژی: درصد رعایت و میانگین PnL و R:R وقتی
+    رعایت شده در برابر وقتی رعایت نشده (یک GROUP BY روی trade_rule_outcomes).
+
+    فقط معاملاتی حساب می‌شوند که رعایت استراتژی برایشان ثبت شده است.
+    """
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    pnl, rr = "IFNULL(t.profit_or_loss, 0)", "IFNULL(t.rr_calculated, 0)"
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT r.strategy_id, s.name, r.condition, r.required, COUNT(*), AVG(o.met),
+               AVG(CASE WHEN o.met THEN {pnl} END), AVG(CASE WHEN NOT o.met THEN {pnl} END),
+               AVG(CASE WHEN o.met THEN {rr} END), AVG(CASE WHEN NOT o.met THEN {rr} END)
+        FROM (SELECT id, profit_or_loss, rr_calculated FROM trades {where}) t
+        JOIN trade_rule_outcomes o ON o.trade_id = t.id
+        JOIN strategy_rules r ON r.id = o.rule_id
+        LEFT JOIN strategies s ON s.id = r.strategy_id
+        GROUP BY o.rule_id
+        ORDER BY s.name, r.strategy_id, r.position
+    """, params)
+    df = pd.DataFrame(cur.fetchall(), columns=RULE_STATS_COLUMNS)
+    df["required"] = df["required"].astype(bool)
+    return df
+
+# --- ذخیره معامله ---
+TRADE_INSERT_SQL = """
+    INSERT INTO trades (symbol, entry_price, exit_price, side, qty, risk,
+                        trade_type, leverage, psychological_tags,
+                        market_context, strategy_id, profit_or_loss,
+                        rr_calculated, trade_date, strategy_compliance_rate,
+                        strategy_missing_rules, trade_ts, trade_hour,
+                        trade_weekday, trade_day)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+def _json_list(values):
+    return json.dumps(values, ensure_ascii=False) if values else "[]"
+
+def _trade_params(data):
+    tags_json = _json_list(data.get("psychological_tags", []))
+    missing_json = _json_list(data.get("strategy_missing_rules", []))
+    date = data.get("trade_date") or datetime.now().isoformat()
+    return (
+        data["symbol"], data["entry_price"], data["exit_price"], data["side"],
+        data["qty"], data["risk"], data["trade_type"], data["leverage"],
+        tags_json, data.get("market_context"), data.get("strategy_id"),
+        data["profit_or_loss"], data["rr_calculated"], date,
+        data.get("strategy_compliance_rate"),
+        missing_json, *time_columns(date)
+    )
+
+@_serialized_write
+def save_trade(conn, data):
+    cur = conn.cursor()
+    cur.execute(TRADE_INSERT_SQL, _trade_params(data))
+    _refresh_rollups(cur)
+    conn.commit()
+
+BATCH_TRIGGERS_MIN = 64  # دسته کوچک‌تر: triggerهای ردیفی ارزان‌تر از گذرهای مجموعه‌ای هستند
+
+def _insert_trades(cur, params, refresh=True):
+    """بدنه save_trades داخل تراکنش جاری (بدون commit)؛ خروجی: بیشترین id قبل از درج.
+
+    refresh=False به‌روزرسانی rollupها را به نوشتن بعدی (یا refresh_rollups) می‌سپارد؛
+    روزهای تغییرکرده در rollup_dirty می‌مانند.
+    """
+    last_id = max_trade_id(cur.connection)
+    if len(params) < BATCH_TRIGGERS_MIN:
+        cur.executemany(TRADE_INSERT_SQL, params)
+        if refresh:
+            _refresh_rollups(cur)
+        return last_id
+
+    # تغییرات خلاصه: strategy_key -> [pnl, rr_sum, count, wins, losses]
+    delta = {}
+    for p in params:
+        pnl = p[11] or 0
+        row = delta.setdefault(p[10] or 0, [0, 0, 0, 0, 0])
+        row[0] += pnl
+        row[1] += p[12] or 0
+        row[2] += 1
+        row[3 if pnl > 0 else 4] += 1
+
+    with _BatchWrite(cur):
+        cur.executemany(TRADE_INSERT_SQL, params)
+    _insert_trade_details(cur, last_id)
+    cur.executemany("""
+        INSERT INTO strategy_summary (strategy_key, pnl, rr_sum, trade_count, wins, losses)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (strategy_key) DO UPDATE SET
+            pnl = pnl + excluded.pnl,
+            rr_sum = rr_sum + excluded.rr_sum,
+            trade_count = trade_count + excluded.trade_count,
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses
+    """, [(key, *row) for key, row in delta.items()])
+    if refresh:
+        _refresh_rollups(cur)
+    return last_id
+
+@_serialized_write
+def save_trades(conn, trades):
+    """چند معامله را با یک executemany در یک تراکنش ذخیره می‌کند.
+
+    triggerهای خلاصه و برچسب‌ها برای هر ردیف اجرا نمی‌شوند: داخل همین
+    تراکنش کنار گذاشته می‌شوند، strategy_summary یک بار برای کل دسته به‌روز
+    و برچسب‌ها و نتیجه قوانین ردیف‌های تازه با INSERT ... SELECT پر می‌شوند.
+    """
+    params = [_trade_params(d) for d in trades]
+    if not params:
+        return 0
+
+    cur = conn.cursor()
+    if not conn.in_transaction:
+        # IMMEDIATE: قفل نوشتن از همان اول گرفته می‌شود. با BEGIN معمولی، اگر
+        # پروسه دیگری (مثلاً ingest) بین اولین خواندن و اولین نوشتن commit کند،
+        # تراکنش بدون صبر busy_timeout با SQLITE_BUSY شکست می‌خورد.
+        cur.execute("BEGIN IMMEDIATE")
+    try:
+        _insert_trades(cur, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(params)
+
+KEY_LOOKUP_CHUNK = 500  # زیر سقف پارامترهای یک کوئری sqlite
+
+@_serialized_write
+def save_keyed_trades(conn, keyed_trades, refresh=True):
+    """معاملات [(client_id, data)] را یک بار ذخیره می‌کند (مثل save_trades، در یک تراکنش).
+
+    کلیدهایی که قبلاً (یا زودتر در همین دسته) آمده‌اند دوباره درج نمی‌شوند.
+    refresh مثل _insert_trades است. خروجی به ترتیب ورودی: [(trade_id, created)]
+    """
+    keyed_trades = list(keyed_trades)
+    if not keyed_trades:
+        return []
+    cur = conn.cursor()
+    if not conn.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")
+    try:
+        keys = list(dict.fromkeys(key for key, _ in keyed_trades))
+        known = {}
+        for i in range(0, len(keys), KEY_LOOKUP_CHUNK):
+            chunk = keys[i:i + KEY_LOOKUP_CHUNK]
+            known.update(cur.execute(
+                f"SELECT client_id, trade_id FROM ingest_keys WHERE client_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+        fresh = {}
+        for key, data in keyed_trades:
+            if key not in known and key not in fresh:
+                fresh[key] = data
+        if fresh:
+            last_id = _insert_trades(cur, [_trade_params(d) for d in fresh.values()], refresh)
+            # بدون AUTOINCREMENT هر ردیف max(id) + 1 می‌گیرد: ترتیب id همان ترتیب درج است
+            ids = [r[0] for r in cur.execute("SELECT id FROM trades WHERE id > ? ORDER BY id", (last_id,))]
+            new_ids = dict(zip(fresh, ids))
+            cur.executemany("INSERT INTO ingest_keys (client_id, trade_id) VALUES (?, ?)", new_ids.items())
+        else:
+            new_ids = {}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    results, created = [], set()
+    for key, _ in keyed_trades:
+        if key in new_ids and key not in created:
+            created.add(key)
+            results.append((new_ids[key], True))
+        else:
+            results.append((known.get(key, new_ids.get(key)), False))
+    return results
+
+@_serialized_write
+def update_trade_results(conn, results):
+    """PnL و R:R ذخیره‌شده را برای ردیف‌های (id, pnl, rr) در یک تراکنش بازنویسی می‌کند.
+
+    مثل save_trades، trigger به‌روزرسانی خلاصه کنار گذاشته می‌شود و تفاوت
+    هر استراتژی یک بار با SQL روی strategy_summary اعمال می‌شود.
+    """
+    cur = conn.cursor()
+    if not conn.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")  # مثل save_trades
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS trade_results (
+                id INTEGER PRIMARY KEY, pnl REAL, rr REAL
+            )
+        """)
+        cur.executemany("INSERT OR REPLACE INTO trade_results VALUES (?, ?, ?)", results)
+        count = cur.execute("SELECT COUNT(*) FROM trade_results").fetchone()[0]
+
+        cur.execute("""
+            INSERT INTO strategy_summary (strategy_key, pnl, rr_sum, trade_count, wins, losses)
+            SELECT IFNULL(t.strategy_id, 0),
+                   SUM(IFNULL(r.pnl, 0) - IFNULL(t.profit_or_loss, 0)),
+                   SUM(IFNULL(r.rr, 0) - IFNULL(t.rr_calculated, 0)),
+                   0,
+                   SUM((IFNULL(r.pnl, 0) > 0) - (IFNULL(t.profit_or_loss, 0) > 0)),
+                   SUM((IFNULL(r.pnl, 0) <= 0) - (IFNULL(t.profit_or_loss, 0) <= 0))
+            FROM trade_results r JOIN trades t ON t.id = r.id
+            GROUP BY IFNULL(t.strategy_id, 0)
+            ON CONFLICT (strategy_key) DO UPDATE SET
+                pnl = pnl + excluded.pnl,
+                rr_sum = rr_sum + excluded.rr_sum,
+                wins = wins + excluded.wins,
+                losses = losses + excluded.losses
+        """)
+        with _BatchWrite(cur):
+            cur.execute("""
+                UPDATE trades SET profit_or_loss = r.pnl, rr_calculated = r.rr
+                FROM trade_results r WHERE trades.id = r.id
+            """)
+        cur.execute("DELETE FROM trade_results")
+        _refresh_rollups(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+# --- خلاصه گزارش (بدون اسکن کل تاریخچه) ---
+def load_trade_summary(conn):
+    """سود کل، درصد برنده و عملکرد هر استراتژی را از جدول خلاصه می‌خواند"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT strategy_key, pnl, rr_sum, trade_count, wins, losses, strategies.name
+        FROM strategy_summary LEFT JOIN strategies ON strategies.id = strategy_key
+    """)
+    return _summary_from_rows(cur.fetchall())
+
+def _summary_from_rows(rows):
+    """ردیف‌های (strategy_key, pnl, rr_sum, count, wins, losses, name) -> خلاصه گزارش"""
+    total_pnl = sum(r[1] for r in rows)
+    trade_count = sum(r[3] for r in rows)
+    wins = sum(r[4] for r in rows)
+    losses = sum(r[5] for r in rows)
+
+    strategies = []
+    for sid, pnl, rr_sum, count, s_wins, s_losses, name in rows:
+        if count <= 0:
+            continue
+        strategies.append({
+            "strategy_name": strategy_label(sid, name),
+            "total_pnl": round(pnl, 2),
+            "avg_rr": round(rr_sum / count, 2),
+            "win_rate": round(s_wins / count, 2),
+            "trade_count": count,
+            "wins": s_wins,
+            "losses": s_losses
+        })
+
+    return {
+        "total_pnl": total_pnl,
+        "trade_count": trade_count,
+        "wins": wins,
+        "losses": losses,
+        "win_rate": wins / trade_count if trade_count else 0,
+        "strategies": sorted(strategies, key=lambda x: x["total_pnl"], reverse=True)
+    }
+
+# --- بارگذاری استراتژی‌ها ---
+def strategy_label(strategy_id, name=None):
+    """نام نمایشی استراتژی؛ استراتژی پاک‌شده با شماره‌اش نشان داده می‌شود"""
+    if not strategy_id:
+        return "No Strategy"
+    return name or f"Strategy {strategy_id}"
+
+def load_strategy_names(conn):
+    """id -> نام همه استراتژی‌ها"""
+    return dict(conn.execute("SELECT id, name FROM strategies"))
+
+def load_strategies(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM strategies ORDER BY name")
+    rows = cur.fetchall()
+    strategies = []
+    for r in rows:
+        try:
+            entry_rules = json.loads(r[3]) if r[3] else []
+            exit_rules = json.loads(r[4]) if r[4] else []
+        except:
+            entry_rules = []
+            exit_rules = []
+        strategies.append({
+            "id": r[0],
+            "name": r[1],
+            "description": r[2],
+            "entry_rules": entry_rules,
+            "exit_rules": exit_rules,
+            "created_at": r[5]
+        })
+    return strategies
+
+# --- ذخیره استراتژی ---
+@_serialized_write
+def save_strategy(conn, strategy_data):
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO strategies (name, description, entry_rules, exit_rules, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            strategy_data['name'],
+            strategy_data['description'],
+            json.dumps(strategy_data['entry_rules'], ensure_ascii=False),
+            json.dumps(strategy_data['exit_rules'], ensure_ascii=False),
+            datetime.now().isoformat()
+        ))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False  # اسم تکراری
+
+# ================================
+# 🗄️ کش مشترک بین نشست‌ها
+# ================================
+
+def _estimate_size(value, sample=100):
+    """تخمین تقریبی حافظه یک نتیجه (لیست دیکشنری‌ها) با نمونه‌گیری"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, list):
+        if not value:
+            return sys.getsizeof(value)
+        head = value[:sample]
+        per_item = sum(_estimate_size(v) for v in head) / len(head)
+        return sys.getsizeof(value) + int(per_item * len(value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(k) + _estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (set, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+class QueryCache:
+    """کش LRU نتایج کوئری‌ها که فقط با تغییر واقعی دیتابیس باطل می‌شود.
+
+    نسخه دیتابیس از PRAGMA data_version یک اتصال ناظر جداگانه خوانده می‌شود؛
+    این مقدار با هر commit از هر اتصال یا پروسه دیگری تغییر می‌کند.
+    """
+
+    def __init__(self, db_path, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._watch = sqlite3.connect(db_path, check_same_thread=False)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _data_version(self):
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def get(self, name, loader, conn):
+        with self._lock:
+            version = self._data_version()
+            if version != self._version:
+                # داده عوض شده: همه نتایج قبلی بی‌اعتبارند
+                self._entries.clear()
+                self._size = 0
+                self._version = version
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return self._entries[name][0]
+
+        value = loader(conn)
+        size = _estimate_size(value)
+        # نتیجه‌ای که داخل تراکنش باز خوانده شده شاید هرگز commit نشود
+        # (rollback نسخه را عوض نمی‌کند)، پس کش نمی‌شود
+        uncommitted = getattr(conn, "in_transaction", False)
+
+        with self._lock:
+            if version != self._version or size > self.max_bytes or uncommitted:
+                return value
+            if name in self._entries:
+                self._size -= self._entries.pop(name)[1]
+            self._entries[name] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._size -= old_size
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._version = None
+
+# --- ژورنال جدا برای هر کاربر ---
+# هر کاربر فایل sqlite خودش را دارد؛ کاربر پیش‌فرض بار اول journal.db قدیمی را به ارث می‌برد
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR', 'journals')
+DEFAULT_USER = "Trader"
+MAX_OPEN_JOURNALS = 64
+MAX_IDLE_READERS = 4  # اتصال‌های خواندنی آزاد نگه‌داشته‌شده برای rerunهای بعدی
+
+def user_key(user_name):
+    """نام کاربر -> شناسه امن برای نام فایل (حروف لاتین + هش کوتاه برای یکتایی)"""
+    name = (user_name or "").strip()
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:32]
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:10]
+    return f"{slug}-{digest}" if slug else digest
+
+def user_db_path(user_name, identity=None):
+    """فایل ژورنال یک کاربر.
+
+    identity (کاربر واردشده با st.login) بر نام ترجیح دارد و در پوشه جدا
+    نگه داشته می‌شود. بدون آن، ژورنال‌ها فقط بر اساس نام تفکیک می‌شوند و این
+    جداسازی امن نیست: هر کس همان نام را وارد کند همان ژورنال را می‌بیند.
+    نام پیش‌فرض هم ژورنال خودش را دارد (open_user_journal داده DB_PATH قدیمی
+    را یک بار به آن منتقل می‌کند).
+    """
+    if identity:
+        return os.path.join(JOURNAL_DIR, "auth", f"{user_key(identity)}.db")
+    return os.path.join(JOURNAL_DIR, f"{user_key((user_name or '').strip() or DEFAULT_USER)}.db")
+
+_adopt_lock = threading.Lock()
+
+def adopt_legacy_journal(path):
+    """ژورنال مشترک قدیمی (DB_PATH) را، اگر path هنوز وجود ندارد، یک بار به آن کپی می‌کند.
+
+    کپی با backup خود sqlite گرفته می‌شود (اتصال باز دیگری به DB_PATH مشکلی
+    ندارد) و اول در فایل موقت نوشته و بعد یکجا جابه‌جا می‌شود، پس نیمه‌کاره
+    دیده نمی‌شود. DB_PATH دست نمی‌خورد و نسخه پشتیبان می‌ماند.
+    خروجی: آیا کپی انجام شد
+    """
+    with _adopt_lock:
+        if os.path.exists(path) or not os.path.exists(DB_PATH):
+            return False
+        tmp = f"{path}.{os.getpid()}.tmp"
+        src, dst = sqlite3.connect(DB_PATH), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+        except Exception:
+            dst.close()
+            os.remove(tmp)
+            raise
+        finally:
+            src.close()
+        dst.close()
+        os.replace(tmp, path)
+        return True
+
+def open_user_journal(user_name=None, identity=None):
+    """مسیر ژورنال کاربر (user_db_path) با پوشه ساخته‌شده.
+
+    ژورنال کاربر پیش‌فرض بدون ورود، بار اول داده DB_PATH قدیمی را می‌گیرد تا
+    استقرار تک‌کاربره بعد از ارتقا با ژورنال خالی باز نشود.
+    """
+    path = user_db_path(user_name, identity)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not identity and path == user_db_path(DEFAULT_USER):
+        adopt_legacy_journal(path)
+    return path
+
+def add_journal_arguments(parser):
+    """--user/--identity/--db مشترک ابزارهای خط فرمان؛ با journal_path_from_args خوانده می‌شوند"""
+    parser.add_argument("--user", default=DEFAULT_USER,
+                        help="use the journal the app opens for this name")
+    parser.add_argument("--identity",
+                        help="use the journal of this login (OIDC sub or email); overrides --user")
+    parser.add_argument("--db", help="journal database path; overrides --user and --identity")
+
+def journal_path_from_args(args):
+    return args.db or open_user_journal(args.user, args.identity)
+
+class _Reader:
+    """اتصال خواندنی یک thread؛ با پایان thread (پاک شدن threading.local) به استخر برمی‌گردد"""
+
+    def __init__(self, conn, release):
+        self.conn = conn
+        self._release = release
+
+    def __del__(self):
+        self._release(self.conn)
+
+class Journal:
+    """اتصال نوشتن مشترک، اتصال‌های خواندنی هر thread و کش کوئری ژورنال یک کاربر.
+
+    conn فقط برای نوشتن است. خواندن‌ها از reader() می‌آیند تا هیچ‌وقت داخل
+    تراکنش نوشتن نیمه‌کاره thread دیگری (مثلاً save_trades با triggerهای
+    کنارگذاشته) اجرا نشوند و نتیجه commit نشده در کش ننشیند.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = connect_db(path, shared=True)
+        create_tables(self.conn)
+        self.cache = QueryCache(path)
+        self._local = threading.local()
+        self._idle = []
+        self._idle_lock = threading.Lock()
+
+    def reader(self):
+        """اتصال خواندنی thread فعلی؛ اتصال‌های آزاد (تا MAX_IDLE_READERS) دوباره استفاده می‌شوند"""
+        reader = getattr(self._local, "reader", None)
+        if reader is None:
+            with self._idle_lock:
+                conn = self._idle.pop() if self._idle else None
+            # بین threadها جابه‌جا می‌شود، ولی هر بار فقط دست یک thread است
+            reader = self._local.reader = _Reader(
+                conn or connect_db(self.path, shared=True), self._release
+            )
+        return reader.conn
+
+    def _release(self, conn):
+        with self._idle_lock:
+            if len(self._idle) < MAX_IDLE_READERS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+class JournalPool:
+    """LRU محدود از ژورنال‌های باز؛ هر کاربر فقط روی فایل خودش کوئری می‌زند.
+
+    ساختن ژورنال (مهاجرت‌ها و پرکردن جدول‌های مشتق برای ژورنال تازه یا قدیمی)
+    بیرون از قفل استخر انجام می‌شود: زیر قفل فقط یک Future جای آن گذاشته
+    می‌شود، rerunهای همان کاربر منتظر همان Future می‌مانند و کاربران دیگر معطل
+    نمی‌شوند. ژورنال بیرون‌رفته از LRU صریحاً بسته نمی‌شود، چون ممکن است rerun
+    دیگری هنوز از آن استفاده کند؛ با آزاد شدن آخرین ارجاع، اتصال‌هایش بسته می‌شوند.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_JOURNALS):
+        self.max_open = max_open
+        self._journals = OrderedDict()  # path -> Future[Journal]
+        self._lock = threading.Lock()
+
+    def get(self, user_name, identity=None):
+        path = user_db_path(user_name, identity)
+        with self._lock:
+            pending = self._journals.get(path)
+            build = pending is None
+            if build:
+                pending = self._journals[path] = Future()
+                while len(self._journals) > self.max_open:
+                    self._journals.popitem(last=False)
+            else:
+                self._journals.move_to_end(path)
+
+        if build:
+            try:
+                open_user_journal(user_name, identity)
+                pending.set_result(Journal(path))
+            except BaseException as e:
+                # ساخت ناموفق در استخر نمی‌ماند تا درخواست بعدی دوباره امتحان کند
+                with self._lock:
+                    if self._journals.get(path) is pending:
+                        del self._journals[path]
+                pending.set_exception(e)
+                raise
+        return pending.result()
+
+    def __len__(self):
+        return len(self._journals)
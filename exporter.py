@@ -0,0 +1,131 @@
+# exporter.py
+"""خروجی جریانی ژورنال به CSV یا Parquet (حافظه ثابت، مستقل از حجم ژورنال)
+
+    python exporter.py trades.csv
+    python exporter.py trades.parquet --from 2024-01-01 --to 2024-06-30 --strategy 3
+    python exporter.py fomo.csv --tag FOMO
+    python exporter.py sara.csv --user Sara
+"""
+import argparse
+import csv
+import importlib.util
+import io
+import sys
+from datetime import date
+
+from db import (
+    _trade_filters, add_journal_arguments, connect_db, create_tables, journal_path_from_args,
+)
+
+CHUNK_SIZE = 10000
+
+# ستون‌ها با همان نام‌های قالب generic در importer تا خروجی دوباره قابل ورود باشد
+EXPORT_COLUMNS = {
+    "id": "int64", "trade_date": "string", "symbol": "string", "side": "string",
+    "trade_type": "string", "entry_price": "float64", "exit_price": "float64",
+    "qty": "float64", "leverage": "float64", "risk": "float64",
+    "profit_or_loss": "float64", "rr_calculated": "float64",
+    "strategy_id": "int64", "psychological_tags": "string",
+    "market_context": "string", "strategy_compliance_rate": "float64",
+    "strategy_missing_rules": "string",
+}
+
+EXPORT_FORMATS = ("csv", "parquet")
+PARQUET_MISSING = "Parquet export requires pyarrow (pip install pyarrow)"
+
+def format_available(fmt):
+    """آیا وابستگی نوشتن fmt نصب است؛ Parquet به pyarrow نیاز دارد"""
+    return fmt != "parquet" or importlib.util.find_spec("pyarrow") is not None
+
+def iter_trade_chunks(conn, start_date=None, end_date=None, symbol=None,
+                      strategy_id=None, tag=None, chunk_size=CHUNK_SIZE):
+    """معاملات (قدیمی‌ترین اول، از روی ایندکس trade_ts) را تکه‌تکه با fetchmany برمی‌گرداند"""
+    clauses, params = _trade_filters(start_date, end_date, symbol, strategy_id, tag)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {", ".join(EXPORT_COLUMNS)} FROM trades {where}
+        ORDER BY trade_ts, id
+    """, params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+def _write_csv(chunks, fileobj):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    text.flush()
+    text.detach()
+    return count
+
+def _write_parquet(chunks, fileobj):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(PARQUET_MISSING)
+
+    schema = pa.schema([(name, getattr(pa, dtype)()) for name, dtype in EXPORT_COLUMNS.items()])
+    count = 0
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            count += len(rows)
+    return count
+
+def export_trades(conn, fileobj, fmt="csv", start_date=None, end_date=None,
+                  symbol=None, strategy_id=None, tag=None, chunk_size=CHUNK_SIZE):
+    """معاملات فیلترشده را تکه‌به‌تکه در fileobj (باینری) می‌نویسد؛ خروجی: تعداد ردیف‌ها"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunks = iter_trade_chunks(conn, start_date, end_date, symbol, strategy_id, tag, chunk_size)
+    if fmt == "parquet":
+        return _write_parquet(chunks, fileobj)
+    return _write_csv(chunks, fileobj)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export journal trades to CSV or Parquet.")
+    parser.add_argument("output", help="output file; '-' writes CSV to stdout")
+    parser.add_argument("--format", choices=EXPORT_FORMATS,
+                        help="defaults to the output file extension")
+    parser.add_argument("--from", dest="start_date", type=date.fromisoformat, metavar="YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", type=date.fromisoformat, metavar="YYYY-MM-DD")
+    parser.add_argument("--symbol")
+    parser.add_argument("--strategy", type=int, metavar="ID",
+                        help="strategy id (0 = trades without a strategy)")
+    parser.add_argument("--tag", help="only trades with this psychological tag")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    add_journal_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    if args.output == "-" and fmt != "csv":
+        parser.error("only CSV can be written to stdout")
+    conn = connect_db(journal_path_from_args(args))
+    create_tables(conn)
+    filters = dict(start_date=args.start_date, end_date=args.end_date,
+                   symbol=args.symbol, strategy_id=args.strategy,
+                   tag=args.tag, chunk_size=args.chunk_size)
+    if args.output == "-":
+        count = export_trades(conn, sys.stdout.buffer, fmt, **filters)
+    else:
+        with open(args.output, "wb") as f:
+            count = export_trades(conn, f, fmt, **filters)
+    print(f"Exported {count} trades.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
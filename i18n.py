@@ -0,0 +1,51 @@
+# i18n.py
+"""ترجمه متن‌های رابط و شکل‌دهی متن راست‌به‌چپ
+
+هر زبان یک فایل locales/<code>.json است با کلیدهای name، rtl و messages
+(متن انگلیسی -> ترجمه). فایل‌ها فقط یک بار هنگام import خوانده می‌شوند؛
+برای افزودن زبان کافی است یک فایل جدید کنار fa.json گذاشته شود.
+"""
+import functools
+import json
+import os
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+SOURCE_LANGUAGE = "English"
+SHAPE_CACHE_SIZE = 4096
+
+def _load_catalogs(directory=LOCALES_DIR):
+    catalogs = {SOURCE_LANGUAGE: {"rtl": False, "messages": {}}}
+    for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            catalog = json.load(f)
+        catalogs[catalog["name"]] = {
+            "rtl": bool(catalog.get("rtl")),
+            "messages": catalog["messages"],
+        }
+    return catalogs
+
+CATALOGS = _load_catalogs()
+LANGUAGES = list(CATALOGS)
+
+def is_rtl(language):
+    return CATALOGS[language]["rtl"]
+
+def translator(language):
+    """تابع t برای یک زبان؛ متن بدون ترجمه همان متن انگلیسی می‌ماند"""
+    messages = CATALOGS[language]["messages"]
+    if not messages:
+        return lambda text: text
+    return lambda text: messages.get(text, text)
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def shape_rtl(text):
+    """reshape + bidi برای نمایش درست فارسی/عربی؛ نتیجه هر متن در LRU می‌ماند"""
+    try:
+        return get_display(arabic_reshaper.reshape(text))
+    except Exception:
+        return text
@@ -0,0 +1,236 @@
+# importer.py
+"""ورود دسته‌ای معاملات از خروجی CSV صرافی‌ها
+
+    python importer.py history.csv --format binance
+    python importer.py my.csv --map symbol=Pair --map trade_date=Time
+    python importer.py history.csv --format bybit --user Sara
+"""
+import argparse
+import csv
+import math
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from db import (
+    add_journal_arguments, connect_db, create_tables, journal_path_from_args, save_trades,
+)
+from analytics import calculate_pnl_and_rr_df
+
+BATCH_SIZE = 20000
+
+# --- قالب‌های شناخته‌شده (ستون‌های خروجی «پوزیشن‌های بسته‌شده») ---
+# columns: فیلد ژورنال -> نام ستون در CSV
+# sides: مقدار ستون جهت (حروف کوچک) -> buy/sell
+CSV_FORMATS = {
+    "binance": {
+        "columns": {
+            "symbol": "Symbol", "side": "Side", "entry_price": "Entry Price",
+            "exit_price": "Avg. Close Price", "qty": "Closed Vol.",
+            "trade_date": "Closed", "leverage": "Leverage",
+        },
+        "sides": {"long": "buy", "short": "sell", "buy": "buy", "sell": "sell"},
+        "trade_type": "futures",
+    },
+    "bybit": {
+        "columns": {
+            "symbol": "Contracts", "side": "Closing Direction",
+            "entry_price": "Entry Price", "exit_price": "Exit Price",
+            "qty": "Qty", "trade_date": "Trade Time(UTC+0)", "leverage": "Leverage",
+        },
+        # جهت بستن برعکس جهت پوزیشن است
+        "sides": {"sell": "buy", "buy": "sell"},
+        "trade_type": "futures",
+    },
+    "generic": {
+        "columns": {
+            "symbol": "symbol", "side": "side", "entry_price": "entry_price",
+            "exit_price": "exit_price", "qty": "qty", "trade_date": "trade_date",
+            "leverage": "leverage", "risk": "risk", "trade_type": "trade_type",
+            "market_context": "market_context",
+        },
+        "sides": {"buy": "buy", "sell": "sell", "long": "buy", "short": "sell"},
+        "trade_type": "spot",
+    },
+}
+
+REQUIRED_FIELDS = ("symbol", "side", "entry_price", "exit_price", "qty")
+
+# ویرگول فقط به‌عنوان جداکننده هزارگان پذیرفته می‌شود: '1,234.5' بله، '1234,5' نه
+THOUSANDS_NUMBER = re.compile(r"^[+-]?\d{1,3}(,\d{3})+(\.\d+)?$")
+
+def _parse_number(value):
+    """'1,234.5 USDT' -> 1234.5؛ اعشار با ویرگول ('1234,5')، nan و inf -> ValueError
+
+    حدس زدن جداکننده اعشار قیمت را ده‌ها برابر اشتباه می‌کند؛ ردیف مبهم رد می‌شود.
+    """
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        parts = value.strip().split()
+        if not parts:
+            return None
+        token = parts[0]
+        if len(parts) > 1 and parts[1][:1].isdigit():
+            # '1 234,5': فاصله به‌عنوان جداکننده هزارگان
+            raise ValueError(f"Ambiguous number: {value}")
+        if "," in token:
+            if not THOUSANDS_NUMBER.match(token):
+                raise ValueError(f"Ambiguous decimal separator: {value}")
+            token = token.replace(",", "")
+        number = float(token)
+    if not math.isfinite(number):
+        raise ValueError(f"Not a finite number: {value}")
+    return number
+
+def _parse_date(value):
+    """تاریخ ISO، 'YYYY-MM-DD HH:MM:SS' یا timestamp میلی‌ثانیه را به ISO استاندارد تبدیل می‌کند"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        ts = int(value)
+        if ts > 10 ** 11:
+            ts /= 1000
+        try:
+            return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None).isoformat()
+        except (OverflowError, OSError) as e:
+            # خارج از بازه datetime/سیستم‌عامل؛ مثل بقیه خطاهای ردیف، ردیف رد می‌شود
+            raise ValueError(f"Invalid timestamp: {value}") from e
+    return datetime.fromisoformat(value.replace("/", "-")).isoformat()
+
+def _iter_lines(fileobj, counter):
+    """خط‌به‌خط از فایل باینری می‌خواند و بایت‌های خوانده‌شده را می‌شمارد"""
+    first = True
+    for raw in fileobj:
+        counter[0] += len(raw)
+        yield raw.decode("utf-8-sig" if first else "utf-8")
+        first = False
+
+def parse_trade_row(row, index, fmt):
+    """یک ردیف CSV را به دیکشنری معامله تبدیل می‌کند؛ ردیف نامعتبر -> None.
+
+    PnL و R:R اینجا حساب نمی‌شوند؛ import_trades_csv آن‌ها را برای هر دسته
+    یک‌جا با calculate_pnl_and_rr_df حساب می‌کند (add_pnl_and_rr).
+    """
+    size = len(row)
+    field = {name: row[i] for name, i in index.items() if i < size}.get
+
+    try:
+        data = {
+            "symbol": (field("symbol") or "").strip().upper(),
+            "side": fmt["sides"].get((field("side") or "").strip().lower()),
+            "entry_price": _parse_number(field("entry_price")),
+            "exit_price": _parse_number(field("exit_price")),
+            "qty": abs(_parse_number(field("qty")) or 0),
+            # ریسک ثبت‌نشده NULL می‌ماند، نه صفر
+            "risk": _parse_number(field("risk")),
+            "leverage": _parse_number(field("leverage")) or 1.0,
+            "trade_type": (field("trade_type") or fmt["trade_type"]).strip().lower(),
+            "market_context": field("market_context") or None,
+            "trade_date": _parse_date(field("trade_date")),
+        }
+    except ValueError:
+        return None
+
+    if any(not data[f] for f in REQUIRED_FIELDS):
+        return None
+    return data
+
+PNL_COLUMNS = ["entry_price", "exit_price", "qty", "side", "risk", "leverage", "trade_type"]
+
+def add_pnl_and_rr(trades):
+    """profit_or_loss و rr_calculated یک دسته معامله با یک فراخوانی موتور برداری"""
+    df = pd.DataFrame({c: [t[c] for t in trades] for c in PNL_COLUMNS})
+    pnl, rr = calculate_pnl_and_rr_df(df)
+    for trade, p, r in zip(trades, pnl.tolist(), rr.tolist()):
+        trade["profit_or_loss"], trade["rr_calculated"] = p, r
+
+def import_trades_csv(conn, fileobj, fmt="generic", columns=None,
+                      total_bytes=None, batch_size=BATCH_SIZE, progress=None):
+    """فایل CSV (باینری) را به صورت جریانی می‌خواند و دسته‌ای در trades ذخیره می‌کند.
+
+    columns نگاشت ستون‌ها را روی قالب انتخاب‌شده بازنویسی می‌کند.
+    progress(imported, skipped, fraction) بعد از هر دسته صدا زده می‌شود؛
+    fraction فقط وقتی total_bytes داده شود مقدار دارد.
+    خروجی: {"imported": ..., "skipped": ...}
+    """
+    fmt = dict(CSV_FORMATS[fmt])
+    fmt["columns"] = {**fmt["columns"], **(columns or {})}
+
+    bytes_read = [0]
+    reader = csv.reader(_iter_lines(fileobj, bytes_read))
+    header = [h.strip() for h in next(reader, [])]
+    positions = {name: i for i, name in enumerate(header)}
+    index = {
+        f: positions[col] for f, col in fmt["columns"].items() if col in positions
+    }
+    missing = [fmt["columns"][f] for f in REQUIRED_FIELDS if f not in index]
+    if missing:
+        raise ValueError(f"Missing columns in CSV: {', '.join(missing)}")
+
+    imported = skipped = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        if batch:
+            add_pnl_and_rr(batch)
+            save_trades(conn, batch)
+            imported += len(batch)
+            batch.clear()
+        if progress:
+            fraction = min(bytes_read[0] / total_bytes, 1.0) if total_bytes else None
+            progress(imported, skipped, fraction)
+
+    for row in reader:
+        if not row:
+            continue
+        data = parse_trade_row(row, index, fmt)
+        if data is None:
+            skipped += 1
+            continue
+        batch.append(data)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return {"imported": imported, "skipped": skipped}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import exchange trade history into the journal.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--format", choices=sorted(CSV_FORMATS), default="generic")
+    parser.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                        help="override the CSV column used for a journal field")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    add_journal_arguments(parser)
+    args = parser.parse_args(argv)
+
+    columns = {}
+    for item in args.map:
+        field, _, column = item.partition("=")
+        columns[field.strip()] = column.strip()
+
+    def report(imported, skipped, fraction):
+        pct = f"{fraction:6.1%} " if fraction is not None else ""
+        print(f"\r{pct}imported {imported}, skipped {skipped}", end="", file=sys.stderr)
+
+    conn = connect_db(journal_path_from_args(args))
+    create_tables(conn)
+    with open(args.csv_path, "rb") as f:
+        result = import_trades_csv(
+            conn, f, args.format, columns,
+            total_bytes=os.path.getsize(args.csv_path),
+            batch_size=args.batch_size, progress=report
+        )
+    print(file=sys.stderr)
+    print(f"Imported {result['imported']} trades ({result['skipped']} skipped).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+# ingest.py
+"""سرویس HTTP/JSON محلی برای ثبت معامله از ربات‌ها، کنار اپ Streamlit
+
+    python ingest.py --port 8765 --user Sara
+    curl -X POST localhost:8765/trades -d '{"client_id": "bot1-42", "symbol": "BTCUSDT",
+        "side": "buy", "entry_price": 60000, "exit_price": 60500, "qty": 0.1}'
+    curl -X POST localhost:8765/trades -d '{"trades": [{...}, {...}]}'
+
+معاملات در همان ژورنالی نوشته می‌شوند که اپ برای --user (یا --identity وقتی ورود
+فعال است) باز می‌کند؛ بدون آن‌ها ژورنال کاربر پیش‌فرض اپ.
+
+هر معامله باید client_id یکتا داشته باشد (برای ارسال تکی، هدر Idempotency-Key
+هم پذیرفته می‌شود). ارسال دوباره همان کلید معامله تازه نمی‌سازد و همان trade_id
+را با status=duplicate برمی‌گرداند، پس ربات می‌تواند بعد از خطای شبکه بی‌خطر
+دوباره بفرستد.
+
+threadهای HTTP فقط اعتبارسنجی و محاسبه PnL/R:R را انجام می‌دهند؛ نوشتن با یک
+thread است که هرچه در صف جمع شده (تا MAX_BATCH معامله) را با save_keyed_trades
+در یک تراکنش commit می‌کند. زیر بار، هزینه هر commit بین درخواست‌های همزمان
+تقسیم می‌شود و rollupهای نمودار به جای هر commit، وقتی صف خالی شد یا هر
+ROLLUP_INTERVAL ثانیه دوباره ساخته می‌شوند.
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from db import (
+    add_journal_arguments, connect_db, create_tables, journal_path_from_args, open_user_journal,
+    refresh_rollups, save_keyed_trades, schema_version,
+)
+from analytics import calculate_pnl_and_rr
+from importer import _parse_date
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BATCH = 5000               # سقف معاملات یک commit
+MAX_REQUEST_TRADES = 10000     # سقف معاملات یک درخواست
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_CLIENT_ID = 128
+SUBMIT_TIMEOUT = 30            # ثانیه
+ROLLUP_INTERVAL = 1.0          # زیر بار، rollupها حداکثر با این تأخیر (ثانیه) به‌روز می‌شوند
+
+SIDES = {"buy": "buy", "sell": "sell", "long": "buy", "short": "sell"}
+TRADE_TYPES = ("spot", "futures")
+
+# --- اعتبارسنجی ---
+def _number(payload, field, errors, default=None, minimum=None, positive=False):
+    value = payload.get(field)
+    if value is None:
+        if default is None:
+            errors.append(f"{field} is required")
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        errors.append(f"{field} must be a number")
+        return default
+    value = float(value)
+    if value != value or value in (float("inf"), float("-inf")):
+        errors.append(f"{field} must be finite")
+    elif positive and value <= 0:
+        errors.append(f"{field} must be positive")
+    elif minimum is not None and value < minimum:
+        errors.append(f"{field} must be at least {minimum:g}")
+    return value
+
+def _strings(payload, field, errors):
+    values = payload.get(field) or []
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        errors.append(f"{field} must be a list of strings")
+        return []
+    return [v.strip() for v in values if v.strip()]
+
+def validate_trade(payload, client_id=None):
+    """بدنه JSON یک معامله -> (client_id, داده معامله با PnL و R:R, خطاها)"""
+    if not isinstance(payload, dict):
+        return None, None, ["trade must be a JSON object"]
+    errors = []
+    client_id = payload.get("client_id", client_id)
+    if not isinstance(client_id, str) or not client_id.strip():
+        errors.append("client_id is required")
+        client_id = None
+    elif len(client_id) > MAX_CLIENT_ID:
+        errors.append(f"client_id must be at most {MAX_CLIENT_ID} characters")
+
+    symbol = payload.get("symbol")
+    if not isinstance(symbol, str) or not symbol.strip():
+        errors.append("symbol is required")
+        symbol = ""
+    side = SIDES.get(str(payload.get("side") or "").strip().lower())
+    if side is None:
+        errors.append(f"side must be one of {', '.join(SIDES)}")
+    trade_type = str(payload.get("trade_type") or "spot").strip().lower()
+    if trade_type not in TRADE_TYPES:
+        errors.append(f"trade_type must be one of {', '.join(TRADE_TYPES)}")
+
+    strategy_id = payload.get("strategy_id")
+    if strategy_id is not None and (isinstance(strategy_id, bool) or not isinstance(strategy_id, int)):
+        errors.append("strategy_id must be an integer")
+    compliance = payload.get("strategy_compliance_rate")
+    if compliance is not None:
+        compliance = _number(payload, "strategy_compliance_rate", errors)
+        if compliance is not None and not 0 <= compliance <= 1:
+            errors.append("strategy_compliance_rate must be between 0 and 1")
+    market_context = payload.get("market_context")
+    if market_context is not None and not isinstance(market_context, str):
+        errors.append("market_context must be a string")
+
+    trade_date = payload.get("trade_date")
+    if trade_date is None:
+        trade_date = datetime.now().isoformat()
+    elif isinstance(trade_date, bool) or not isinstance(trade_date, (str, int, float)):
+        errors.append("trade_date must be an ISO date or an epoch timestamp")
+    else:
+        try:
+            trade_date = _parse_date(str(int(trade_date)) if isinstance(trade_date, (int, float)) else trade_date)
+        except (ValueError, OverflowError, OSError):
+            errors.append("trade_date must be an ISO date or an epoch timestamp")
+
+    data = {
+        "symbol": symbol.strip().upper(),
+        "side": side,
+        "entry_price": _number(payload, "entry_price", errors, positive=True),
+        "exit_price": _number(payload, "exit_price", errors, positive=True),
+        "qty": _number(payload, "qty", errors, positive=True),
+        "risk": _number(payload, "risk", errors, default=0.0, minimum=0),
+        "leverage": _number(payload, "leverage", errors, default=1.0, positive=True),
+        "trade_type": trade_type,
+        "market_context": market_context or None,
+        "psychological_tags": _strings(payload, "psychological_tags", errors),
+        "strategy_id": strategy_id,
+        "strategy_compliance_rate": compliance,
+        "strategy_missing_rules": _strings(payload, "strategy_missing_rules", errors),
+        "trade_date": trade_date,
+    }
+    if errors:
+        return client_id, None, errors
+    data["profit_or_loss"], data["rr_calculated"] = calculate_pnl_and_rr(data)
+    return client_id, data, []
+
+# --- نویسنده گروهی ---
+class IngestWriter:
+    """تنها نویسنده سرویس: درخواست‌های صف‌شده را با هم در یک تراکنش commit می‌کند"""
+
+    def __init__(self, conn, max_batch=MAX_BATCH, rollup_interval=ROLLUP_INTERVAL):
+        self.conn = conn
+        self.max_batch = max_batch
+        self.rollup_interval = rollup_interval
+        self._refreshed = time.monotonic()
+        self.commits = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, keyed_trades):
+        """[(client_id, data)] را در صف می‌گذارد؛ Future نتیجه [(trade_id, created)] را می‌دهد"""
+        future = Future()
+        self._queue.put((keyed_trades, future))
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, size = [item], len(item[0])
+            # هرچه تا این لحظه رسیده با همین commit می‌رود؛ بدون صبر برای پر شدن دسته
+            while size < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._commit(batch)
+            now = time.monotonic()
+            if self._queue.empty() or now - self._refreshed >= self.rollup_interval:
+                self._refresh(now)
+
+    def _refresh(self, now):
+        try:
+            refresh_rollups(self.conn)
+        except Exception as exc:
+            # روزهای تغییرکرده در rollup_dirty می‌مانند و دفعه بعد ساخته می‌شوند
+            print(f"rollup refresh failed: {exc}", file=sys.stderr)
+        self._refreshed = now
+
+    def _commit(self, batch):
+        rows = [row for keyed_trades, _ in batch for row in keyed_trades]
+        try:
+            results = save_keyed_trades(self.conn, rows, refresh=False)
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        self.commits += 1
+        self.written += sum(created for _, created in results)
+        start = 0
+        for keyed_trades, future in batch:
+            future.set_result(results[start:start + len(keyed_trades)])
+            start += len(keyed_trades)
+
+# --- HTTP ---
+def _ack(client_id, data, errors, result):
+    if errors:
+        return {"client_id": client_id, "status": "rejected", "errors": errors}
+    trade_id, created = result
+    ack = {"client_id": client_id, "status": "created" if created else "duplicate", "trade_id": trade_id}
+    if created:
+        ack["profit_or_loss"] = data["profit_or_loss"]
+        ack["rr_calculated"] = data["rr_calculated"]
+    return ack
+
+class IngestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive برای ربات‌هایی که پشت سر هم می‌فرستند
+    disable_nagle_algorithm = True  # هدر و بدنه جدا نوشته می‌شوند؛ بدون آن هر پاسخ منتظر ACK می‌ماند
+    server_version = "JournalIngest/1"
+
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message):
+        self._send(status, {"error": message})
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._error(404, "not found")
+        writer = self.server.writer
+        self._send(200, {
+            "status": "ok",
+            "schema_version": schema_version(writer.conn),
+            "pending": writer.pending(),
+            "commits": writer.commits,
+            "written": writer.written,
+        })
+
+    def do_POST(self):
+        if self.path != "/trades":
+            return self._error(404, "not found")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._error(400, "invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._error(413, f"body larger than {MAX_BODY_BYTES} bytes")
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+        except (UnicodeDecodeError, ValueError):
+            return self._error(400, "body is not valid JSON")
+
+        single = isinstance(body, dict) and "trades" not in body
+        items = [body] if single else body.get("trades") if isinstance(body, dict) else body
+        if not isinstance(items, list) or not items:
+            return self._error(400, "expected a trade object, a list of trades or {\"trades\": [...]}")
+        if len(items) > MAX_REQUEST_TRADES:
+            return self._error(413, f"at most {MAX_REQUEST_TRADES} trades per request")
+
+        header_key = self.headers.get("Idempotency-Key") if single else None
+        checked = [validate_trade(item, header_key) for item in items]
+        accepted = [(client_id, data) for client_id, data, errors in checked if not errors]
+        try:
+            results = iter(
+                self.server.writer.submit(accepted).result(timeout=SUBMIT_TIMEOUT) if accepted else []
+            )
+        except Exception as exc:
+            # چیزی commit نشده؛ ربات می‌تواند همان درخواست را دوباره بفرستد
+            return self._error(503, f"write failed: {exc}")
+        acks = [
+            _ack(client_id, data, errors, None if errors else next(results))
+            for client_id, data, errors in checked
+        ]
+
+        if single:
+            ack = acks[0]
+            status = {"created": 201, "duplicate": 200, "rejected": 422}[ack["status"]]
+            return self._send(status, ack)
+        counts = {"created": 0, "duplicate": 0, "rejected": 0}
+        for ack in acks:
+            counts[ack["status"]] += 1
+        self._send(200, {**counts, "results": acks})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class IngestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, writer, verbose=False):
+        super().__init__(address, IngestHandler)
+        self.writer = writer
+        self.verbose = verbose
+
+def make_server(db_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                max_batch=MAX_BATCH, verbose=False):
+    """سرور آماده اجرا با نویسنده شروع‌شده؛ بعد از shutdown باید writer.close() صدا زده شود.
+
+    db_path پیش‌فرض ژورنال کاربر پیش‌فرض اپ است (open_user_journal).
+    """
+    conn = connect_db(db_path or open_user_journal(), shared=True)
+    create_tables(conn)
+    writer = IngestWriter(conn, max_batch).start()
+    return IngestServer((host, port), writer, verbose)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON service for recording trades from bots.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                        help="most trades written in one commit")
+    add_journal_arguments(parser)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    db_path = journal_path_from_args(args)
+    server = make_server(db_path, args.host, args.port, args.max_batch, args.verbose)
+    print(f"Listening on http://{args.host}:{server.server_address[1]} ({db_path})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.writer.close()
+
+if __name__ == "__main__":
+    main()
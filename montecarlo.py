@@ -0,0 +1,162 @@
+# montecarlo.py
+"""شبیه‌سازی مونت‌کارلوی منحنی سرمایه با نمونه‌گیری دوباره از نتایج ژورنال
+
+    python montecarlo.py --paths 100000 --trades 1000 --risk 0.01 --workers 4
+    python montecarlo.py --strategy 3 --kind pnl --equity 10000 --seed 42
+
+هر مسیر n_trades معامله است که با جایگذاری از نتایج گذشته کشیده می‌شوند:
+- kind="r": R-multipleها (فقط معاملات با ریسک ثبت‌شده)؛ هر معامله risk_per_trade
+  از سرمایه فعلی را ریسک می‌کند (رشد مرکب، سرمایه اولیه 1).
+- kind="pnl": PnL خود معاملات به starting_equity اضافه می‌شود.
+
+ورشکستگی یعنی سرمایه زمانی به (1 - ruin_drawdown) سرمایه اولیه یا کمتر برسد.
+مسیرها دسته‌های CHUNK_PATHS تایی‌اند تا حافظه به تعداد مسیرها بستگی نداشته
+باشد؛ هر دسته seed خودش را از SeedSequence می‌گیرد، پس نتیجه یک seed ثابت با
+هر تعداد worker یکسان است.
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from db import (
+    add_journal_arguments, connect_db, create_tables, journal_path_from_args, load_trades_frame,
+)
+
+SIMULATION_KINDS = ("r", "pnl")
+PERCENTILES = (5, 25, 50, 75, 95)
+RUIN_DRAWDOWN = 0.5
+MIN_SAMPLES = 10     # کمتر از این، نمونه‌گیری دوباره توزیع معناداری نمی‌دهد
+CHUNK_PATHS = 2000   # هر آرایه دسته 2000 × 1000 معامله = 16MB
+BAND_PATHS = 2000    # مسیرهای دسته اول که باند صدک‌های نمودار از آن‌ها ساخته می‌شود
+
+def outcome_samples(df, strategy_id=None, kind="r"):
+    """نمونه‌های شبیه‌سازی از فریم معاملات؛ strategy_id=0 یعنی معاملات بدون استراتژی.
+
+    R:R معاملات بدون ریسک ثبت‌شده صفر ذخیره می‌شود، برای همین در kind="r" کنار می‌روند.
+    """
+    if strategy_id is not None:
+        df = df[df["strategy_id"].fillna(0).to_numpy(dtype="int64") == strategy_id]
+    if kind == "r":
+        values = df.loc[df["risk"] > 0, "rr_calculated"]
+    else:
+        values = df["profit_or_loss"]
+    return values.dropna().to_numpy(dtype="float64")
+
+def _simulate_chunk(samples, n_paths, n_trades, seed, kind, risk_per_trade,
+                    starting_equity, ruin_equity, band_paths):
+    """(سرمایه نهایی, بیشترین افت, ورشکسته) هر مسیر و صدک‌های band_paths مسیر اول"""
+    rng = np.random.default_rng(seed)
+    equity = samples[rng.integers(0, len(samples), size=(n_paths, n_trades))]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if kind == "r":
+            # رشد مرکب در فضای لگاریتمی؛ ضرر بیش از کل سرمایه همان صفر شدن است
+            np.multiply(equity, risk_per_trade, out=equity)
+            np.maximum(equity, -1.0, out=equity)
+            np.log1p(equity, out=equity)
+            np.cumsum(equity, axis=1, out=equity)
+            np.exp(equity, out=equity)
+            equity *= starting_equity
+        else:
+            np.cumsum(equity, axis=1, out=equity)
+            equity += starting_equity
+        ruined = equity.min(axis=1) <= ruin_equity
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.maximum(peak, starting_equity, out=peak)
+        # افت به نسبت سقف قبلی؛ با سقف مثبت (سرمایه اولیه) همیشه تعریف‌شده است
+        np.divide(equity, peak, out=peak)
+        max_drawdown = 1.0 - peak.min(axis=1)
+    bands = np.percentile(equity[:band_paths], PERCENTILES, axis=0) if band_paths else None
+    return equity[:, -1].copy(), max_drawdown, ruined, bands
+
+def _run_chunk(args):
+    return _simulate_chunk(*args)
+
+def simulate(samples, n_paths=10000, n_trades=1000, risk_per_trade=0.01, kind="r",
+             starting_equity=1.0, ruin_drawdown=RUIN_DRAWDOWN, seed=None, workers=1,
+             chunk_paths=CHUNK_PATHS):
+    """توزیع سرمایه نهایی، بیشترین افت و احتمال ورشکستگی؛ بدون نمونه None.
+
+    با seed ثابت (و chunk_paths ثابت) نتیجه برای هر workers یکسان است.
+    workers > 1 دسته‌ها را بین پروسه‌ها پخش می‌کند.
+    """
+    if kind not in SIMULATION_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(SIMULATION_KINDS)}")
+    samples = np.asarray(samples, dtype="float64")
+    if not len(samples) or n_paths <= 0 or n_trades <= 0:
+        return None
+    sizes = [min(chunk_paths, n_paths - start) for start in range(0, n_paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    ruin_equity = starting_equity * (1.0 - ruin_drawdown)
+    tasks = [
+        (samples, size, n_trades, chunk_seed, kind, risk_per_trade,
+         starting_equity, ruin_equity, min(BAND_PATHS, size) if i == 0 else 0)
+        for i, (size, chunk_seed) in enumerate(zip(sizes, seeds))
+    ]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            chunks = list(pool.map(_run_chunk, tasks))
+    else:
+        chunks = [_run_chunk(task) for task in tasks]
+
+    final = np.concatenate([c[0] for c in chunks])
+    max_drawdown = np.concatenate([c[1] for c in chunks])
+    ruined = np.concatenate([c[2] for c in chunks])
+    bands = pd.DataFrame(chunks[0][3].T, columns=[f"p{p}" for p in PERCENTILES])
+    bands.index = pd.RangeIndex(1, n_trades + 1, name="trade")
+    return {
+        "paths": n_paths,
+        "trades": n_trades,
+        "samples": len(samples),
+        "starting_equity": starting_equity,
+        "risk_of_ruin": float(ruined.mean()),
+        "expected_final_equity": float(final.mean()),
+        "final_equity": dict(zip(PERCENTILES, np.percentile(final, PERCENTILES).tolist())),
+        "max_drawdown": dict(zip(PERCENTILES, np.percentile(max_drawdown, PERCENTILES).tolist())),
+        "max_drawdowns": max_drawdown,
+        "bands": bands.reset_index(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo equity and risk-of-ruin simulation.")
+    parser.add_argument("--kind", choices=SIMULATION_KINDS, default="r",
+                        help="resample R-multiples (compounded) or PnL (added to --equity)")
+    parser.add_argument("--strategy", type=int, metavar="ID",
+                        help="only this strategy's trades (0 = no strategy)")
+    parser.add_argument("--paths", type=int, default=10000)
+    parser.add_argument("--trades", type=int, default=1000, help="trades per path")
+    parser.add_argument("--risk", type=float, default=0.01,
+                        help="fraction of equity risked per trade (--kind r)")
+    parser.add_argument("--equity", type=float, default=None,
+                        help="starting equity (default 1 for --kind r, required for --kind pnl)")
+    parser.add_argument("--ruin", type=float, default=RUIN_DRAWDOWN,
+                        help="loss of starting equity counted as ruin")
+    parser.add_argument("--seed", type=int, help="seed for a reproducible run")
+    parser.add_argument("--workers", type=int, default=1, help="processes to spread paths over")
+    add_journal_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.kind == "pnl" and args.equity is None:
+        parser.error("--equity is required with --kind pnl")
+
+    conn = connect_db(journal_path_from_args(args))
+    create_tables(conn)
+    samples = outcome_samples(load_trades_frame(conn, strategy_id=args.strategy),
+                              kind=args.kind)
+    result = simulate(
+        samples, args.paths, args.trades, args.risk, args.kind,
+        args.equity or 1.0, args.ruin, args.seed, args.workers
+    )
+    if result is None:
+        sys.exit("No trades to resample.")
+
+    print(f"{result['paths']} paths x {result['trades']} trades from {result['samples']} samples")
+    print(f"Risk of ruin ({args.ruin:.0%} loss): {result['risk_of_ruin']:.2%}")
+    print(f"Expected final equity: {result['expected_final_equity']:.4g}")
+    for p in PERCENTILES:
+        print(f"  p{p:<3} final equity {result['final_equity'][p]:>12.4g}"
+              f"   max drawdown {result['max_drawdown'][p]:7.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# profiler.py
+"""زمان‌سنجی سبک مراحل هر rerun برای پیدا کردن گلوگاه‌ها در production"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+logger = logging.getLogger("journal.perf")
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[i]
+
+class _Stage:
+    __slots__ = ("name", "rows", "start", "duration")
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+class RunTimings:
+    """مراحل یک rerun؛ با run.stage(...) زمان‌سنجی و در پایان با finish() ثبت می‌شود"""
+
+    def __init__(self, profiler, page=None):
+        self.profiler = profiler
+        self.page = page
+        self.stages = []
+        self._start = time.perf_counter()
+        self.total = None
+
+    def stage(self, name, rows=None):
+        return _StageTimer(self, name, rows)
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+        self.profiler.record(self)
+        logger.info(json.dumps({
+            "event": "rerun",
+            "page": self.page,
+            "total_ms": round(self.total * 1000, 2),
+            "stages": [
+                {"stage": s.name, "ms": round(s.duration * 1000, 2), "rows": s.rows}
+                for s in self.stages
+            ],
+        }, ensure_ascii=False))
+        return self
+
+class _StageTimer:
+    def __init__(self, run, name, rows):
+        self.run = run
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.stage = _Stage(self.name, self.rows)
+        return self.stage
+
+    def __exit__(self, *exc):
+        self.stage.duration = time.perf_counter() - self.stage.start
+        self.run.stages.append(self.stage)
+        return False
+
+class RerunProfiler:
+    """زمان‌های اخیر هر مرحله را نگه می‌دارد تا p50/p95 روی rerunهای اخیر گزارش شود"""
+
+    def __init__(self, history=200):
+        self._durations = defaultdict(lambda: deque(maxlen=history))
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def new_run(self, page=None):
+        return RunTimings(self, page)
+
+    def record(self, run):
+        with self._lock:
+            for s in run.stages:
+                self._durations[s.name].append(s.duration)
+                if s.rows is not None:
+                    self._rows[s.name] = s.rows
+            self._durations["total"].append(run.total)
+
+    def stats(self, last_run=None):
+        """برای هر مرحله: آخرین زمان، تعداد ردیف، p50 و p95 (میلی‌ثانیه)"""
+        last = {s.name: s.duration for s in last_run.stages} if last_run else {}
+        if last_run and last_run.total is not None:
+            last["total"] = last_run.total
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._durations.items()}
+            rows = dict(self._rows)
+
+        # مجموع rerun همیشه ردیف آخر
+        names = [n for n in snapshot if n != "total"] + ["total"] * ("total" in snapshot)
+        result = []
+        for name in names:
+            values = snapshot[name]
+            result.append({
+                "stage": name,
+                "last_ms": round(last.get(name, float("nan")) * 1000, 2),
+                "rows": rows.get(name),
+                "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+                "runs": len(values),
+            })
+        return result
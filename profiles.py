@@ -0,0 +1,121 @@
+# profiles.py
+"""پروفایل رفتاری افزایشی روی پنجره‌های لغزان آخرین معاملات
+
+به جای ساختن دوباره الگو از کل تاریخچه در هر rerun، برای هر lookback یک
+پنجره با Counter نگه داشته می‌شود که با هر معامله جدید فقط به‌روز می‌شود.
+"""
+import bisect
+import threading
+from collections import Counter
+
+from db import load_recent_trades, load_trades_after, max_trade_id
+
+PROFILE_LOOKBACKS = (5, 20, 100)
+
+def _counter_mode(counter):
+    """پرتکرارترین مقدار؛ در تساوی کوچک‌ترین (مثل _mode در analytics)"""
+    top = max(counter.values())
+    return min(value for value, count in counter.items() if count == top)
+
+def _bump(counter, value, sign):
+    counter[value] += sign
+    if counter[value] <= 0:
+        del counter[value]
+
+class _Window:
+    """آخرین size معامله به ترتیب (trade_ts, id) همراه با شمارنده‌های هر ویژگی"""
+
+    def __init__(self, size):
+        self.size = size
+        self.keys = []
+        self.trades = {}
+        self.symbols = Counter()
+        self.sides = Counter()
+        self.types = Counter()
+        self.contexts = Counter()
+        self.tags = Counter()
+        self.leverage_sum = 0.0
+
+    def _count(self, trade, sign):
+        _bump(self.symbols, trade["symbol"], sign)
+        _bump(self.sides, trade["side"], sign)
+        _bump(self.types, trade["trade_type"], sign)
+        _bump(self.contexts, trade.get("market_context") or "not_set", sign)
+        for tag in trade.get("psychological_tags", []):
+            _bump(self.tags, tag, sign)
+        self.leverage_sum += sign * (trade["leverage"] or 0)
+
+    def add(self, trade):
+        # ترتیب load_trades_frame: معامله بدون trade_ts قدیمی‌تر از همه
+        ts = trade["trade_ts"]
+        key = (float("-inf") if ts is None else ts, trade["id"])
+        if len(self.keys) >= self.size and key <= self.keys[0]:
+            return  # قدیمی‌تر از همه معاملات پنجره
+        if key in self.trades:
+            return
+        bisect.insort(self.keys, key)
+        self.trades[key] = trade
+        self._count(trade, 1)
+        if len(self.keys) > self.size:
+            self._count(self.trades.pop(self.keys.pop(0)), -1)
+
+    def pattern(self):
+        """همان خروجی learn_user_pattern برای این پنجره"""
+        if len(self.keys) < 3:
+            return None
+        return {
+            'common_symbols': set(self.symbols),
+            'common_side': _counter_mode(self.sides),
+            'common_type': _counter_mode(self.types),
+            'avg_leverage': self.leverage_sum / len(self.keys),
+            'common_contexts': set(self.contexts),
+            'common_tags': set(self.tags),
+        }
+
+class ProfileEngine:
+    """پنجره‌های لغزان برای چند lookback که با معاملات تازه به‌روز می‌شوند.
+
+    sync(conn) فقط ردیف‌های با id بزرگ‌تر از آخرین ردیف دیده‌شده را می‌خواند؛
+    اگر تعداد آن‌ها زیاد باشد (مثلاً بعد از ورود CSV) پنجره‌ها از نو ساخته می‌شوند.
+    """
+
+    def __init__(self, lookbacks=PROFILE_LOOKBACKS):
+        self.lookbacks = tuple(sorted(set(lookbacks)))
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.windows = {n: _Window(n) for n in self.lookbacks}
+        self.last_id = 0
+
+    def observe(self, trade):
+        for window in self.windows.values():
+            window.add(trade)
+        self.last_id = max(self.last_id, trade["id"])
+
+    def seed(self, conn):
+        self._reset()
+        # max_trade_id قبل از خواندن، تا ردیفی که همزمان اضافه شود از دست نرود
+        last_id = max_trade_id(conn)
+        for trade in load_recent_trades(conn, limit=max(self.lookbacks)):
+            self.observe(trade)
+        self.last_id = last_id
+
+    def sync(self, conn):
+        with self._lock:
+            latest = max_trade_id(conn)
+            if latest < self.last_id:
+                self.seed(conn)  # ژورنال از نو ساخته شده
+            elif latest > self.last_id:
+                limit = 4 * max(self.lookbacks)
+                new_trades = load_trades_after(conn, self.last_id, limit=limit + 1)
+                if len(new_trades) > limit or self.last_id == 0:
+                    self.seed(conn)
+                else:
+                    for trade in new_trades:
+                        self.observe(trade)
+        return self
+
+    def pattern(self, lookback=None):
+        with self._lock:
+            return self.windows[lookback or self.lookbacks[0]].pattern()
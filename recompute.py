@@ -0,0 +1,91 @@
+# recompute.py
+"""محاسبه دوباره PnL و R:R ذخیره‌شده برای کل تاریخچه (مثلاً بعد از اصلاح لوریج یا افزودن کارمزد)
+
+    python recompute.py
+    python recompute.py --fees binance_futures --entry-order maker --funding-rate 0.0003
+    python recompute.py --identity 'google-oauth2|1234' --fees binance_spot
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from db import (
+    add_journal_arguments, connect_db, create_tables, journal_path_from_args, update_trade_results,
+)
+from analytics import FEE_SCHEDULES, calculate_pnl_and_rr_df, fee_rates
+
+BATCH_SIZE = 50000
+
+RECOMPUTE_COLUMNS = [
+    "id", "entry_price", "exit_price", "qty", "side", "risk", "leverage",
+    "trade_type", "profit_or_loss", "rr_calculated",
+]
+
+def recompute_pnl(conn, entry_fee=0.0, exit_fee=0.0, funding_rate=0.0,
+                  batch_size=BATCH_SIZE, progress=None):
+    """معاملات را به ترتیب id دسته‌دسته می‌خواند، با موتور برداری دوباره حساب می‌کند
+    و فقط ردیف‌های تغییرکرده را (هر دسته در یک تراکنش) بازنویسی می‌کند.
+
+    progress(scanned, updated) بعد از هر دسته صدا زده می‌شود.
+    خروجی: {"scanned": ..., "updated": ...}
+    """
+    scanned = updated = 0
+    last_id = 0
+    cur = conn.cursor()
+    while True:
+        cur.execute(f"""
+            SELECT {", ".join(RECOMPUTE_COLUMNS)} FROM trades
+            WHERE id > ? ORDER BY id LIMIT ?
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        df = pd.DataFrame(rows, columns=RECOMPUTE_COLUMNS)
+        pnl, rr = calculate_pnl_and_rr_df(df, entry_fee, exit_fee, funding_rate)
+
+        old_pnl = df["profit_or_loss"].to_numpy(dtype="float64", na_value=np.nan)
+        old_rr = df["rr_calculated"].to_numpy(dtype="float64", na_value=np.nan)
+        changed = (pnl != old_pnl) | (rr != old_rr)
+        if changed.any():
+            ids = df["id"].to_numpy()[changed]
+            updated += update_trade_results(
+                conn, zip(ids.tolist(), pnl[changed].tolist(), rr[changed].tolist())
+            )
+
+        scanned += len(rows)
+        last_id = rows[-1][0]
+        if progress:
+            progress(scanned, updated)
+    return {"scanned": scanned, "updated": updated}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored PnL and R:R for all trades.")
+    parser.add_argument("--fees", choices=sorted(FEE_SCHEDULES), default="none",
+                        help="fee schedule applied to entry and exit notional")
+    parser.add_argument("--entry-order", choices=("maker", "taker"), default="taker")
+    parser.add_argument("--exit-order", choices=("maker", "taker"), default="taker")
+    parser.add_argument("--funding-rate", type=float, default=0.0,
+                        help="total funding rate over a futures position, as a fraction of entry "
+                             "notional (positive: longs pay, shorts receive)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    add_journal_arguments(parser)
+    args = parser.parse_args(argv)
+
+    entry_fee, exit_fee = fee_rates(args.fees, args.entry_order, args.exit_order)
+
+    def report(scanned, updated):
+        print(f"\rscanned {scanned}, updated {updated}", end="", file=sys.stderr)
+
+    conn = connect_db(journal_path_from_args(args))
+    create_tables(conn)
+    result = recompute_pnl(
+        conn, entry_fee, exit_fee, args.funding_rate,
+        batch_size=args.batch_size, progress=report
+    )
+    print(file=sys.stderr)
+    print(f"Recomputed {result['scanned']} trades ({result['updated']} updated).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# reports.py
+"""گزارش هوشمند بدون فیلتر، ساخته‌شده در پس‌زمینه (stale-while-revalidate)
+
+تحلیل‌های سنگین گزارش (تکامل، تغییر استراتژی، انحراف، ریسک، احساسات، قوانین و
+داده نمودارها) روی کل تاریخچه در یک thread پس‌زمینه ساخته می‌شوند. صفحه همیشه
+آخرین نسخه ساخته‌شده را فوراً نشان می‌دهد؛ اگر از آن به بعد چیزی commit شده باشد، همان
+نسخه قدیمی با نشانگر تازگی نمایش داده می‌شود و ساخت دوباره در پس‌زمینه
+شروع می‌شود. فقط اولین نمایش هر ژورنال منتظر ساخت می‌ماند.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from db import (
+    connect_db, load_rule_stats, load_tag_stats, load_trade_summary, load_trades_frame,
+)
+from analytics import (
+    analyze_evolution_df, detect_strategy_change_df, deviation_outcomes_df,
+    learn_user_pattern_df, score_deviation_df,
+)
+from risk import equity_curve_df, risk_metrics_df
+
+REPORT_WORKERS = 2   # ساخت همزمان گزارش ژورنال‌های مختلف
+FRESH_WAIT = 0.2     # ثانیه؛ اگر ساخت دوباره زود تمام شود، نسخه تازه نشان داده می‌شود
+RETRY_SECONDS = 30   # ساخت ناموفق برای همان نسخه دیتابیس زودتر از این دوباره امتحان نمی‌شود
+
+logger = logging.getLogger("journal.reports")
+
+# یک pool مشترک برای همه ژورنال‌ها، تا تعداد threadها به تعداد ژورنال‌های باز بستگی نداشته باشد
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+
+def build_report(conn, profile_engine=None, risk_engine=None):
+    """داده‌های گزارش بدون فیلتر؛ خروجی: (داده‌ها, زمان هر مرحله به ثانیه).
+
+    همه خواندن‌ها در یک تراکنش‌اند تا خلاصه و معاملات از یک نسخه دیتابیس باشند.
+    موتورهای افزایشی، اگر داده شوند، به جای ساخت الگو و ریسک از کل جدول به‌کار می‌روند.
+    """
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        value = fn()
+        timings[name] = time.perf_counter() - start
+        return value
+
+    conn.execute("BEGIN")
+    try:
+        trades_df = timed("trades_df", lambda: load_trades_frame(conn))
+        data = {
+            "summary": timed("summary", lambda: load_trade_summary(conn)),
+            "trades_df": trades_df,
+            "tag_stats": timed("tag_stats", lambda: load_tag_stats(conn)),
+            "rule_stats": timed("rule_stats", lambda: load_rule_stats(conn)),
+            "pattern": timed("pattern", lambda: (
+                profile_engine.sync(conn).pattern() if profile_engine
+                else learn_user_pattern_df(trades_df)
+            )),
+            "risk": timed("risk", lambda: (
+                risk_engine.sync(conn).metrics() if risk_engine else risk_metrics_df(trades_df)
+            )),
+        }
+    finally:
+        conn.rollback()
+    data["evolution"] = timed("evolution", lambda: analyze_evolution_df(trades_df))
+    data["strategy_change"] = timed("strategy_change", lambda: detect_strategy_change_df(trades_df))
+    data["deviation_outcomes"] = timed("deviation_outcomes", lambda: deviation_outcomes_df(
+        trades_df, score_deviation_df(trades_df)
+    ))
+    data["equity_curve"] = timed("equity_curve", lambda: equity_curve_df(trades_df))
+    return data, timings
+
+class ReportSnapshot:
+    """نتیجه یک ساخت گزارش و نسخه دیتابیسی که از آن ساخته شده"""
+
+    def __init__(self, data, version, timings):
+        self.data = data
+        self.version = version
+        self.timings = timings
+        self.built_at = time.time()
+
+    @property
+    def seconds(self):
+        return sum(self.timings.values())
+
+class ReportWorker:
+    """آخرین گزارش یک ژورنال و ساخت دوباره آن در پس‌زمینه.
+
+    نسخه دیتابیس مثل QueryCache از PRAGMA data_version یک اتصال ناظر جدا
+    خوانده می‌شود و با هر commit از هر اتصال یا پروسه دیگری تغییر می‌کند.
+    """
+
+    def __init__(self, db_path, build=build_report):
+        self.db_path = db_path
+        self._build = build
+        self._watch = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn = None  # فقط در thread ساخت استفاده می‌شود
+        self._snapshot = None
+        self._pending = None
+        self._failure = None  # (نسخه, زمان, خطا) آخرین ساخت ناموفق
+        self._lock = threading.Lock()
+
+    def _data_version(self):
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self, version):
+        try:
+            if self._conn is None:
+                self._conn = connect_db(self.db_path, shared=True)
+            data, timings = self._build(self._conn)
+        except Exception as exc:
+            logger.exception("report build failed for %s", self.db_path)
+            with self._lock:
+                self._failure = (version, time.monotonic(), exc)
+            raise
+        snapshot = ReportSnapshot(data, version, timings)
+        with self._lock:
+            self._snapshot = snapshot
+            self._failure = None
+        return snapshot
+
+    def _should_build(self, version):
+        """زیر _lock: ساختی در جریان نیست و همین نسخه تازگی شکست نخورده"""
+        if self._pending is not None and not self._pending.done():
+            return False
+        failure = self._failure
+        return not (failure and failure[0] == version
+                    and time.monotonic() - failure[1] < RETRY_SECONDS)
+
+    @property
+    def error(self):
+        """خطای آخرین ساخت ناموفق، تا وقتی ساخت بعدی موفق نشده؛ وگرنه None"""
+        failure = self._failure
+        return failure[2] if failure else None
+
+    def get(self, wait=FRESH_WAIT):
+        """(آخرین گزارش, آیا از دیتابیس عقب است)؛ گزارش عقب‌مانده در پس‌زمینه دوباره ساخته می‌شود.
+
+        اگر هنوز گزارشی ساخته نشده، منتظر اولین ساخت می‌ماند (و خطای آن بالا
+        می‌رود). خطای ساخت دوباره بالا نمی‌رود: نسخه قبلی برمی‌گردد و خطا در
+        error می‌ماند تا کنار آن نشان داده شود.
+        """
+        with self._lock:
+            version = self._data_version()
+            snapshot = self._snapshot
+            stale = snapshot is None or snapshot.version != version
+            if stale and self._should_build(version):
+                self._pending = _executor.submit(self._refresh, version)
+            pending = self._pending
+        if snapshot is None:
+            snapshot = pending.result()
+        elif stale and wait:
+            done, _ = wait_futures([pending], timeout=wait)
+            if done and pending.exception() is None:
+                snapshot = pending.result()
+        return snapshot, snapshot.version != version
+
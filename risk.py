@@ -0,0 +1,287 @@
+# risk.py
+"""شاخص‌های ریسک روی منحنی سرمایه: افت سرمایه، امید ریاضی، Sharpe/Sortino و رشته‌ها
+
+همه چیز به ترتیب زمان معامله (trade_ts، سپس id) حساب می‌شود. وضعیت RiskState
+از کل تاریخچه با یک گذر برداری ساخته می‌شود و با هر معامله جدید در O(1)
+به‌روز می‌شود. معاملات بدون تاریخ معتبر (trade_ts خالی) در شاخص‌ها نیستند.
+
+Sharpe و Sortino روی PnL روزانه (فقط روزهای دارای معامله) حساب می‌شوند؛
+چون سرمایه حساب ثبت نمی‌شود، نسبت‌ها همان نسبت‌های بازده با سرمایه ثابت‌اند.
+"""
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from db import DAY_MS, load_trade_results
+
+PERIODS_PER_YEAR = 365  # بازار کریپتو هر روز باز است
+RESULT_COLUMNS = ["id", "trade_ts", "trade_day", "profit_or_loss", "rr_calculated"]
+MAX_INCREMENTAL = 10000  # بیش از این معامله تازه (مثلاً ورود CSV): ساخت دوباره برداری
+
+class RiskState:
+    """جمع‌های لازم برای شاخص‌های ریسک تا آخرین معامله دیده‌شده"""
+
+    def __init__(self):
+        self.trades = 0
+        self.wins = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.rr_sum = 0.0
+        # منحنی سرمایه و افت آن (از سرمایه صفر)
+        self.equity = 0.0
+        self.peak = 0.0
+        self.peak_ts = None
+        self.max_drawdown = 0.0
+        self.max_drawdown_ms = 0
+        # رشته برد/باخت؛ streak مثبت یعنی برد پیاپی
+        self.streak = 0
+        self.longest_win = 0
+        self.longest_loss = 0
+        # PnL روزانه: روزهای بسته با Welford، روز جاری جدا
+        self.day = None
+        self.day_pnl = 0.0
+        self.days = 0
+        self.day_mean = 0.0
+        self.day_m2 = 0.0
+        self.downside_sq = 0.0
+        self.last_key = None
+
+    def add(self, pnl, rr, ts, day, trade_id):
+        """یک معامله جدیدتر از همه معاملات قبلی"""
+        pnl = pnl or 0.0
+        self.trades += 1
+        if pnl > 0:
+            self.wins += 1
+            self.gross_profit += pnl
+        else:
+            self.gross_loss -= pnl
+        self.rr_sum += rr or 0.0
+
+        self.equity += pnl
+        if self.peak_ts is None:
+            self.peak_ts = ts
+        if self.equity >= self.peak:
+            self.peak, self.peak_ts = self.equity, ts
+        else:
+            self.max_drawdown = max(self.max_drawdown, self.peak - self.equity)
+            self.max_drawdown_ms = max(self.max_drawdown_ms, ts - self.peak_ts)
+
+        if pnl > 0:
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.longest_win = max(self.longest_win, self.streak)
+        else:
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.longest_loss = max(self.longest_loss, -self.streak)
+
+        if day != self.day:
+            if self.day is not None:
+                self._close_day()
+            self.day, self.day_pnl = day, 0.0
+        self.day_pnl += pnl
+        self.last_key = (ts, trade_id)
+
+    def _close_day(self):
+        self.days, self.day_mean, self.day_m2 = _welford(
+            self.days, self.day_mean, self.day_m2, self.day_pnl
+        )
+        self.downside_sq += min(self.day_pnl, 0.0) ** 2
+
+    def metrics(self):
+        """دیکشنری شاخص‌ها؛ بدون معامله None"""
+        if not self.trades:
+            return None
+        days, mean, m2, downside_sq = self.days, self.day_mean, self.day_m2, self.downside_sq
+        if self.day is not None:
+            days, mean, m2 = _welford(days, mean, m2, self.day_pnl)
+            downside_sq += min(self.day_pnl, 0.0) ** 2
+        return _metrics(
+            trades=self.trades, wins=self.wins, gross_profit=self.gross_profit,
+            gross_loss=self.gross_loss, rr_sum=self.rr_sum, equity=self.equity,
+            drawdown=self.peak - self.equity, max_drawdown=self.max_drawdown,
+            max_drawdown_ms=self.max_drawdown_ms, streak=self.streak,
+            longest_win=self.longest_win, longest_loss=self.longest_loss,
+            days=days, day_mean=mean, day_m2=m2, downside_sq=downside_sq,
+        )
+
+def _welford(n, mean, m2, x):
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return n, mean, m2 + delta * (x - mean)
+
+def _metrics(trades, wins, gross_profit, gross_loss, rr_sum, equity, drawdown,
+             max_drawdown, max_drawdown_ms, streak, longest_win, longest_loss,
+             days, day_mean, day_m2, downside_sq):
+    std = math.sqrt(day_m2 / (days - 1)) if days > 1 else 0.0
+    downside = math.sqrt(downside_sq / days) if days else 0.0
+    annual = math.sqrt(PERIODS_PER_YEAR)
+    return {
+        "trades": trades,
+        "win_rate": wins / trades,
+        "equity": equity,
+        "current_drawdown": drawdown,
+        "max_drawdown": max_drawdown,
+        "max_drawdown_days": max_drawdown_ms / DAY_MS,
+        "expectancy": (gross_profit - gross_loss) / trades,
+        "expectancy_r": rr_sum / trades,
+        "profit_factor": gross_profit / gross_loss if gross_loss else (math.inf if gross_profit else None),
+        "sharpe": day_mean / std * annual if std else None,
+        "sortino": day_mean / downside * annual if downside else None,
+        "trading_days": days,
+        "longest_win_streak": longest_win,
+        "longest_loss_streak": longest_loss,
+        "current_streak": streak,
+    }
+
+# ================================
+# 🧮 ساخت وضعیت با یک گذر برداری
+# ================================
+
+def _runs(flags):
+    """طول رشته‌های پیاپی True: (بیشترین، طول رشته انتهایی)"""
+    if not flags.any():
+        return 0, 0
+    idx = np.arange(len(flags))
+    last_break = np.maximum.accumulate(np.where(flags, -1, idx))
+    lengths = np.where(flags, idx - last_break, 0)
+    return int(lengths.max()), int(lengths[-1])
+
+def _state_from_arrays(trade_id, ts, day, pnl, rr):
+    """RiskState معادل add کردن تک‌تک ردیف‌ها (به ترتیب زمانی)"""
+    state = RiskState()
+    n = len(pnl)
+    if not n:
+        return state
+    pnl = np.nan_to_num(np.asarray(pnl, dtype="float64"))
+    rr = np.nan_to_num(np.asarray(rr, dtype="float64"))
+    ts = np.asarray(ts, dtype="int64")
+    day = np.asarray(day, dtype="int64")
+
+    win = pnl > 0
+    state.trades = n
+    state.wins = int(win.sum())
+    state.gross_profit = float(pnl[win].sum())
+    state.gross_loss = float(-pnl[~win].sum())
+    state.rr_sum = float(rr.sum())
+
+    equity = np.cumsum(pnl)
+    peak = np.maximum(np.maximum.accumulate(equity), 0.0)
+    at_peak = equity >= peak
+    peak_idx = np.maximum.accumulate(np.where(at_peak, np.arange(n), 0))
+    state.equity = float(equity[-1])
+    state.peak = float(peak[-1])
+    state.peak_ts = int(ts[peak_idx[-1]])
+    state.max_drawdown = float(np.max(peak - equity))
+    state.max_drawdown_ms = int(np.max(np.where(at_peak, 0, ts - ts[peak_idx])))
+
+    state.longest_win, win_tail = _runs(win)
+    state.longest_loss, loss_tail = _runs(~win)
+    state.streak = win_tail if win[-1] else -loss_tail
+
+    # PnL روزانه؛ روز آخر باز می‌ماند تا معاملات بعدی همان روز اضافه شوند
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    daily = np.add.reduceat(pnl, starts)
+    closed = daily[:-1]
+    state.day, state.day_pnl = int(day[-1]), float(daily[-1])
+    state.days = len(closed)
+    if state.days:
+        state.day_mean = float(closed.mean())
+        state.day_m2 = float(((closed - state.day_mean) ** 2).sum())
+        state.downside_sq = float((np.minimum(closed, 0.0) ** 2).sum())
+    state.last_key = (int(ts[-1]), int(trade_id[-1]))
+    return state
+
+def _state_from_frame(df):
+    """RiskState از ستون‌های id، trade_ts، trade_day، profit_or_loss و rr_calculated (هر ترتیبی)"""
+    valid = df[df["trade_ts"].notna()].sort_values(["trade_ts", "id"])
+    return _state_from_arrays(
+        valid["id"].to_numpy(), valid["trade_ts"].to_numpy(dtype="int64"),
+        valid["trade_day"].to_numpy(dtype="int64"),
+        valid["profit_or_loss"].to_numpy(dtype="float64", na_value=np.nan),
+        valid["rr_calculated"].to_numpy(dtype="float64", na_value=np.nan),
+    )
+
+def risk_metrics_df(df):
+    """شاخص‌های ریسک برای خروجی load_trades_frame (مثلاً یک بازه فیلترشده)"""
+    return _state_from_frame(df).metrics()
+
+def equity_curve_df(df):
+    """منحنی سرمایه و افت آن بعد از هر معامله (قدیمی‌ترین اول) برای نمودار"""
+    valid = df[df["trade_ts"].notna()].sort_values(["trade_ts", "id"])
+    equity = valid["profit_or_loss"].fillna(0).cumsum().to_numpy()
+    peak = np.maximum(np.maximum.accumulate(equity), 0.0) if len(equity) else equity
+    return pd.DataFrame({
+        "trade_time": valid["trade_time"].to_numpy(),
+        "equity": equity,
+        "drawdown": equity - peak,
+    })
+
+# ================================
+# 🔄 موتور افزایشی برای هر ژورنال
+# ================================
+
+class RiskEngine:
+    """RiskState یک ژورنال که با معاملات تازه به‌روز می‌شود.
+
+    sync(conn) فقط ردیف‌های با id بزرگ‌تر از آخرین ردیف دیده‌شده را می‌خواند.
+    اگر معامله تازه قدیمی‌تر از آخرین معامله باشد، یا تعداد و جمع PnL با
+    strategy_summary نخواند (ویرایش، حذف یا محاسبه دوباره)، از نو ساخته می‌شود.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.state = RiskState()
+        self.last_id = 0
+        self.seen = 0
+        self.seen_pnl = 0.0
+
+    def seed(self, conn):
+        self._reset()
+        rows = load_trade_results(conn)
+        columns = zip(*rows) if rows else [()] * len(RESULT_COLUMNS)
+        # None -> NaN؛ میلی‌ثانیه‌های epoch در float64 دقیق می‌مانند
+        frame = pd.DataFrame({
+            name: np.array(values, dtype="int64" if name == "id" else "float64")
+            for name, values in zip(RESULT_COLUMNS, columns)
+        })
+        self.state = _state_from_frame(frame)
+        self.seen = len(frame)
+        self.seen_pnl = float(frame["profit_or_loss"].sum())
+        self.last_id = int(frame["id"].max()) if len(frame) else 0
+
+    def _in_sync(self, conn):
+        count, pnl = conn.execute(
+            "SELECT IFNULL(SUM(trade_count), 0), IFNULL(SUM(pnl), 0) FROM strategy_summary"
+        ).fetchone()
+        return count == self.seen and math.isclose(pnl, self.seen_pnl, rel_tol=1e-9, abs_tol=1e-6)
+
+    def sync(self, conn):
+        with self._lock:
+            if self.last_id == 0:
+                self.seed(conn)
+                return self
+            rows = load_trade_results(conn, after_id=self.last_id)
+            timed = sorted((r for r in rows if r[1] is not None), key=lambda r: (r[1], r[0]))
+            last_key = self.state.last_key
+            out_of_order = timed and last_key and (timed[0][1], timed[0][0]) < last_key
+            if out_of_order or len(rows) > MAX_INCREMENTAL:
+                self.seed(conn)
+                return self
+            for trade_id, ts, day, pnl, rr in timed:
+                self.state.add(pnl, rr, ts, day, trade_id)
+            self.seen += len(rows)
+            self.seen_pnl += sum(r[3] or 0.0 for r in rows)
+            if rows:
+                self.last_id = rows[-1][0]
+            if not self._in_sync(conn):
+                self.seed(conn)
+        return self
+
+    def metrics(self):
+        with self._lock:
+            return self.state.metrics()
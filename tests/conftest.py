@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# ماژول‌های برنامه در ریشه مخزن هستند، نه در یک پکیج
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
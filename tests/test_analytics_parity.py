@@ -0,0 +1,102 @@
+# tests/test_analytics_parity.py
+"""نسخه‌های برداری analytics (روی load_trades_frame) در برابر نسخه‌های لیستی (روی load_trades)
+
+    python -m pytest -q tests/test_analytics_parity.py
+"""
+import math
+
+import pytest
+
+from analytics import (
+    analyze_evolution, analyze_evolution_df, analyze_strategy_performance,
+    analyze_strategy_performance_df, check_deviation, detect_strategy_change,
+    detect_strategy_change_df, get_recent_symbols, get_recent_symbols_df,
+    learn_user_pattern, learn_user_pattern_df, score_deviation_df,
+)
+from bench import fill_journal
+from db import connect_db, load_strategy_names, load_trades, load_trades_frame
+
+JOURNAL_SIZE = 1500
+# برش‌های کوچک حالت‌های مرزی (ژورنال خالی، کمتر از ۳ معامله، یک استراتژی) را می‌گیرند
+SIZES = [0, 1, 2, 3, 7, 40, JOURNAL_SIZE]
+
+def _close(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+@pytest.fixture(scope="module")
+def journal(tmp_path_factory):
+    conn = connect_db(str(tmp_path_factory.mktemp("journal") / "journal.db"))
+    fill_journal(conn, JOURNAL_SIZE, seed=7)
+    yield load_trades(conn), load_trades_frame(conn), load_strategy_names(conn)
+    conn.close()
+
+@pytest.fixture(params=SIZES)
+def window(request, journal):
+    """(trades, df, strategy_names) برای n معامله آخر"""
+    trades, df, names = journal
+    n = request.param
+    return trades[:n], df.head(n).reset_index(drop=True), names
+
+def test_frame_matches_trades(journal):
+    trades, df, _ = journal
+    assert len(trades) == len(df) == JOURNAL_SIZE
+    assert df["id"].tolist() == [t["id"] for t in trades]
+
+def test_learn_user_pattern(window):
+    trades, df, _ = window
+    for lookback in (3, 5, 20):
+        pattern = learn_user_pattern(trades, lookback)
+        pattern_df = learn_user_pattern_df(df, lookback)
+        if pattern is None:
+            assert pattern_df is None
+            continue
+        for key in ("common_side", "common_type"):
+            # در حالت تساوی نسخه لیستی به ترتیب set بستگی دارد؛ هر مُدی قبول است
+            values = [t[key.replace("common_", "" if key == "common_side" else "trade_")]
+                      for t in trades[:lookback]]
+            modes = {v for v in values if values.count(v) == max(map(values.count, values))}
+            assert pattern.pop(key) in modes
+            assert pattern_df.pop(key) in modes
+        assert _close(pattern, pattern_df)
+
+def test_analyze_evolution(window):
+    trades, df, _ = window
+    assert _close(analyze_evolution(trades), analyze_evolution_df(df))
+
+@pytest.mark.parametrize("with_names", [False, True])
+def test_analyze_strategy_performance(window, with_names):
+    trades, df, names = window
+    names = names if with_names else None
+    assert _close(
+        analyze_strategy_performance(trades, names), analyze_strategy_performance_df(df, names)
+    )
+
+def test_detect_strategy_change(window):
+    trades, df, _ = window
+    assert detect_strategy_change(trades) == detect_strategy_change_df(df)
+
+@pytest.mark.parametrize("limit", [1, 3, 10])
+def test_get_recent_symbols(window, limit):
+    trades, df, _ = window
+    assert get_recent_symbols(trades, limit) == get_recent_symbols_df(df, limit)
+
+@pytest.mark.parametrize("lookback", [3, 5])
+def test_score_deviation(journal, lookback):
+    """امتیاز دسته‌ای هر معامله = check_deviation با الگوی معاملات قبل از آن"""
+    _, df, _ = journal
+    df = df.head(400).reset_index(drop=True)
+    scores = score_deviation_df(df, lookback)
+    rows = df.astype(object).where(df.notna(), None).to_dict("records")
+    for i, row in enumerate(rows):
+        pattern = learn_user_pattern_df(df.iloc[i + 1:], lookback)
+        if pattern is None:
+            # کمتر از ۳ معامله قبلی: الگویی نیست
+            assert math.isnan(scores[i]), row["id"]
+        else:
+            assert scores[i] == pytest.approx(check_deviation(row, pattern)), row["id"]
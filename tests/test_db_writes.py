@@ -0,0 +1,93 @@
+# tests/test_db_writes.py
+"""نوشتن‌های دسته‌ای db کنار نویسنده دیگر (مثلاً سرویس ingest در پروسه جدا)
+
+    python -m pytest -q tests/test_db_writes.py
+"""
+import threading
+import time
+
+import pytest
+
+from db import connect_db, create_tables, save_trades, update_trade_results
+
+def _trade(i):
+    return {
+        "symbol": "BTCUSDT", "entry_price": 100.0, "exit_price": 101.0, "side": "buy",
+        "qty": 1.0, "risk": 1.0, "trade_type": "spot", "leverage": 1.0,
+        "profit_or_loss": 1.0, "rr_calculated": 1.0,
+        "trade_date": f"2024-01-{i % 28 + 1:02d}T10:00:00",
+    }
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "journal.db")
+    conn = connect_db(path)
+    create_tables(conn)
+    save_trades(conn, [_trade(i) for i in range(100)])
+    conn.close()
+    return path
+
+def _hold_write_lock(path, started, seconds=0.3):
+    """نویسنده دیگری که قفل نوشتن را کمی نگه می‌دارد و بعد commit می‌کند"""
+    conn = connect_db(path)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE trades SET market_context = 'other' WHERE id = 1")
+    started.set()
+    time.sleep(seconds)
+    conn.commit()
+    conn.close()
+
+@pytest.mark.parametrize("write", [
+    lambda conn: save_trades(conn, [_trade(i) for i in range(200)]),
+    lambda conn: save_trades(conn, [_trade(1)]),
+    lambda conn: update_trade_results(conn, [(i, 2.0, 2.0) for i in range(1, 101)]),
+])
+def test_batch_writes_wait_for_another_writer(path, write):
+    conn = connect_db(path)
+    started = threading.Event()
+    other = threading.Thread(target=_hold_write_lock, args=(path, started))
+    other.start()
+    assert started.wait(5)
+    # تراکنش deferred اینجا با SQLITE_BUSY فوری شکست می‌خورد؛ IMMEDIATE منتظر busy_timeout می‌ماند
+    write(conn)
+    other.join()
+    assert conn.execute("SELECT market_context FROM trades WHERE id = 1").fetchone() == ("other",)
+    conn.close()
+
+def _schema_cookie(conn):
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+def _derived(conn):
+    """جدول‌هایی که triggerها (یا نسخه دسته‌ای‌شان) پر می‌کنند"""
+    return {
+        "summary": conn.execute(
+            "SELECT SUM(trade_count), SUM(wins), ROUND(SUM(pnl), 6) FROM strategy_summary"
+        ).fetchone(),
+        "tags": conn.execute("SELECT COUNT(*) FROM trade_tags").fetchone()[0],
+        "fts": conn.execute("SELECT COUNT(*) FROM trades_fts").fetchone()[0],
+        "dirty_or_rolled": conn.execute(
+            "SELECT (SELECT COUNT(*) FROM rollup_dirty) + (SELECT SUM(trade_count) FROM trade_rollups"
+            " WHERE grain = 'day')"
+        ).fetchone()[0],
+    }
+
+def test_batch_writes_leave_the_schema_alone(path):
+    conn = connect_db(path)
+    other = connect_db(path)
+    before = _schema_cookie(other)
+    trades = [dict(_trade(i), psychological_tags=["FOMO"]) for i in range(200)]
+    save_trades(conn, trades)
+    update_trade_results(conn, [(i, -1.0, -1.0) for i in range(1, 51)])
+    assert _schema_cookie(other) == before
+    assert conn.execute("SELECT COUNT(*) FROM batch_writes").fetchone()[0] == 0
+
+    # دسته‌ای و ردیف‌به‌ردیف همان جدول‌های مشتق را می‌سازند
+    batched = _derived(conn)
+    assert batched["summary"] == (300, 250, 300.0 - 50 * 2)
+    assert batched["tags"] == 200 and batched["fts"] == 300
+    save_trades(conn, [dict(_trade(1), psychological_tags=["FOMO"])])
+    update_trade_results(conn, [(301, -1.0, -1.0)])
+    assert _derived(conn)["summary"] == (301, 250, 301.0 - 50 * 2 - 2)
+    assert _derived(conn)["tags"] == 201 and _derived(conn)["fts"] == 301
+    conn.close()
+    other.close()
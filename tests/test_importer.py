@@ -0,0 +1,67 @@
+# tests/test_importer.py
+"""ورود CSV: خواندن عددها و تاریخ‌ها و رد شدن ردیف‌های نامعتبر
+
+    python -m pytest -q tests/test_importer.py
+"""
+import io
+
+import pytest
+
+from db import connect_db, create_tables, load_trades
+from importer import _parse_number, import_trades_csv
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,234.5 USDT", 1234.5),
+    ("-1,000,000.25", -1000000.25),
+    ("1,234", 1234.0),
+    ("0.5", 0.5),
+    (" 3 USDT", 3.0),
+    ("", None),
+])
+def test_parse_number(value, expected):
+    assert _parse_number(value) == expected
+
+@pytest.mark.parametrize("value", ["1234,5", "12,34", "1,23,456", "1 234,5", "nan", "inf"])
+def test_parse_number_rejects_ambiguous_or_non_finite(value):
+    with pytest.raises(ValueError):
+        _parse_number(value)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect_db(str(tmp_path / "journal.db"))
+    create_tables(conn)
+    yield conn
+    conn.close()
+
+def test_import_skips_rows_that_cannot_be_read_safely(conn):
+    csv_text = "\n".join([
+        "symbol,side,entry_price,exit_price,qty,trade_date",
+        "BTCUSDT,buy,\"1,234.5\",1300,1,2024-01-02T10:00:00",
+        "ETHUSDT,sell,\"1234,5\",1200,1,2024-01-02T11:00:00",      # اعشار با ویرگول
+        "ETHUSDT,sell,100,nan,1,2024-01-02T12:00:00",
+        "SOLUSDT,buy,10,11,1,99999999999999999",                    # خارج از بازه
+        "XRPUSDT,long,0.5,0.6,100,1704189600000",
+    ])
+    result = import_trades_csv(conn, io.BytesIO(csv_text.encode("utf-8")))
+    assert result == {"imported": 2, "skipped": 3}
+    trades = {t["symbol"]: t for t in load_trades(conn)}
+    assert trades.keys() == {"BTCUSDT", "XRPUSDT"}
+    assert trades["BTCUSDT"]["entry_price"] == 1234.5
+    assert trades["XRPUSDT"]["trade_date"] == "2024-01-02T10:00:00"
+
+def test_import_computes_pnl_per_batch_and_keeps_missing_risk_null(conn):
+    csv_text = "\n".join([
+        "symbol,side,entry_price,exit_price,qty,trade_date,leverage,risk,trade_type",
+        "BTCUSDT,buy,100,110,2,2024-01-02T10:00:00,5,4,futures",
+        "ETHUSDT,short,100,90,1,2024-01-02T11:00:00,,,spot",
+        "SOLUSDT,sell,10,11,3,2024-01-02T12:00:00,1,0,spot",
+    ])
+    import_trades_csv(conn, io.BytesIO(csv_text.encode("utf-8")), batch_size=2)
+    rows = conn.execute(
+        "SELECT symbol, risk, profit_or_loss, rr_calculated FROM trades ORDER BY id"
+    ).fetchall()
+    assert rows == [
+        ("BTCUSDT", 4.0, 100.0, 25.0),
+        ("ETHUSDT", None, 10.0, 0.0),   # ریسک ثبت‌نشده NULL، R:R صفر
+        ("SOLUSDT", 0.0, -3.0, 0.0),
+    ]
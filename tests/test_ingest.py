@@ -0,0 +1,54 @@
+# tests/test_ingest.py
+"""سرویس ingest در همان ژورنالی می‌نویسد که اپ برای همان کاربر باز می‌کند
+
+    python -m pytest -q tests/test_ingest.py
+"""
+import http.client
+import json
+import threading
+
+import pytest
+
+import db
+from db import DEFAULT_USER, JournalPool, load_trades, open_user_journal
+from ingest import make_server
+
+TRADE = {"client_id": "bot1-1", "symbol": "btcusdt", "side": "long",
+         "entry_price": 100, "exit_price": 110, "qty": 2, "risk": 5}
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(db, "JOURNAL_DIR", str(tmp_path / "journals"))
+
+def _post(db_path, body):
+    server = make_server(db_path, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = http.client.HTTPConnection(*server.server_address, timeout=10)
+        client.request("POST", "/trades", json.dumps(body))
+        response = client.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.writer.close()
+
+@pytest.mark.parametrize("user_name, identity", [("Sara", None), (None, "sub-1")])
+def test_ingested_trade_reaches_the_users_app_journal(journal_dir, user_name, identity):
+    status, ack = _post(open_user_journal(user_name, identity), TRADE)
+    assert status == 201 and ack["status"] == "created"
+
+    trades = load_trades(JournalPool().get(user_name, identity).reader())
+    assert [(t["id"], t["symbol"], t["side"], t["profit_or_loss"]) for t in trades] == [
+        (ack["trade_id"], "BTCUSDT", "buy", 20.0)
+    ]
+    # ژورنال کاربرهای دیگر دست نمی‌خورد
+    assert load_trades(JournalPool().get(DEFAULT_USER).reader()) == []
+
+def test_default_service_writes_to_the_default_users_journal(journal_dir):
+    status, ack = _post(None, TRADE)
+    assert status == 201
+    trades = load_trades(JournalPool().get(DEFAULT_USER).reader())
+    assert [t["id"] for t in trades] == [ack["trade_id"]]
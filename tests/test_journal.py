@@ -0,0 +1,158 @@
+# tests/test_journal.py
+"""اتصال‌های خواندنی جدا، کش کوئری، استخر ژورنال‌ها و ژورنال قدیمی کاربر پیش‌فرض
+
+    python -m pytest -q tests/test_journal.py
+"""
+import os
+import threading
+
+import pytest
+
+import db
+import recompute
+from db import (
+    DEFAULT_USER, Journal, JournalPool, QueryCache, adopt_legacy_journal, connect_db,
+    create_tables, load_trades, open_user_journal, save_trade, user_db_path,
+)
+
+TRADE = {
+    "symbol": "BTCUSDT", "entry_price": 100.0, "exit_price": 110.0, "side": "buy",
+    "qty": 1.0, "risk": 5.0, "trade_type": "spot", "leverage": 1.0,
+    "profit_or_loss": 10.0, "rr_calculated": 2.0, "trade_date": "2024-01-02T10:00:00",
+}
+
+@pytest.fixture
+def journal(tmp_path):
+    return Journal(str(tmp_path / "journal.db"))
+
+def _in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+def test_reads_skip_open_write_transaction(journal):
+    save_trade(journal.conn, TRADE)
+    journal.conn.execute("BEGIN IMMEDIATE")
+    journal.conn.execute("DELETE FROM trades")
+    try:
+        trades = _in_thread(lambda: journal.cache.get("trades", load_trades, journal.reader()))
+        assert len(trades) == 1
+    finally:
+        journal.conn.rollback()
+    assert len(journal.cache.get("trades", load_trades, journal.reader())) == 1
+
+def test_cache_skips_results_read_inside_a_transaction(journal):
+    save_trade(journal.conn, TRADE)
+    cache = QueryCache(journal.path)
+    journal.conn.execute("BEGIN IMMEDIATE")
+    journal.conn.execute("DELETE FROM trades")
+    assert cache.get("trades", load_trades, journal.conn) == []
+    journal.conn.rollback()
+    # rollback نسخه داده را عوض نمی‌کند؛ نتیجه نیمه‌کاره نباید در کش مانده باشد
+    assert len(cache.get("trades", load_trades, journal.conn)) == 1
+
+def test_reader_per_thread_and_reused(journal):
+    conn = journal.reader()
+    assert journal.reader() is conn
+    assert journal.reader() is not journal.conn
+
+    other = _in_thread(lambda: id(journal.reader()))
+    assert other != id(conn)
+    # اتصال thread تمام‌شده به استخر برگشته و thread بعدی همان را می‌گیرد
+    assert _in_thread(lambda: id(journal.reader())) == other
+
+@pytest.fixture
+def journal_dirs(tmp_path, monkeypatch):
+    """DB_PATH قدیمی با یک معامله و پوشه خالی ژورنال‌ها"""
+    legacy = str(tmp_path / "journal.db")
+    monkeypatch.setattr(db, "DB_PATH", legacy)
+    monkeypatch.setattr(db, "JOURNAL_DIR", str(tmp_path / "journals"))
+    conn = connect_db(legacy)
+    create_tables(conn)
+    save_trade(conn, TRADE)
+    conn.close()
+    return legacy
+
+def test_default_user_adopts_legacy_journal(journal_dirs):
+    path = open_user_journal(DEFAULT_USER)
+    assert path == user_db_path(DEFAULT_USER)
+    conn = connect_db(path)
+    assert len(load_trades(conn)) == 1
+    save_trade(conn, TRADE)
+    conn.close()
+
+    # فقط یک بار: ژورنال موجود دوباره رونویسی نمی‌شود و DB_PATH دست نخورده می‌ماند
+    assert not adopt_legacy_journal(open_user_journal(""))
+    assert len(load_trades(connect_db(path))) == 2
+    assert len(load_trades(connect_db(journal_dirs))) == 1
+
+@pytest.mark.parametrize("user_name, identity", [("Sara", None), (DEFAULT_USER, "sub-1")])
+def test_other_journals_start_empty(journal_dirs, user_name, identity):
+    path = open_user_journal(user_name, identity)
+    assert load_trades(Journal(path).reader()) == []
+
+def test_pool_opens_the_adopted_journal(journal_dirs):
+    journal = JournalPool().get(DEFAULT_USER)
+    assert len(load_trades(journal.reader())) == 1
+
+def test_cli_resolves_user_journal(journal_dirs, capsys):
+    recompute.main(["--user", "Sara"])
+    recompute.main([])
+    assert capsys.readouterr().out.splitlines() == [
+        "Recomputed 0 trades (0 updated).", "Recomputed 1 trades (0 updated).",
+    ]
+    assert os.path.exists(user_db_path("Sara"))
+
+def test_pool_builds_journals_outside_its_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "JOURNAL_DIR", str(tmp_path))
+    slow_path = user_db_path("Slow")
+    release, started = threading.Event(), threading.Event()
+
+    class SlowJournal(Journal):
+        def __init__(self, path):
+            if path == slow_path:
+                started.set()
+                assert release.wait(10)
+            super().__init__(path)
+
+    monkeypatch.setattr(db, "Journal", SlowJournal)
+    pool = JournalPool()
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(pool.get("Slow"))) for _ in range(2)]
+    for thread in waiters:
+        thread.start()
+    assert started.wait(10)
+
+    # ساخت کند یک ژورنال کاربر دیگر را معطل نمی‌کند
+    fast = threading.Thread(target=lambda: results.append(pool.get("Fast")))
+    fast.start()
+    fast.join(5)
+    blocked = fast.is_alive()
+    release.set()
+    fast.join()
+    assert not blocked
+    assert results.pop(0).path == user_db_path("Fast")
+    for thread in waiters:
+        thread.join()
+    assert len(results) == 2 and results[0] is results[1]
+    assert pool.get("Slow") is results[0]
+
+def test_pool_retries_a_failed_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "JOURNAL_DIR", str(tmp_path))
+    calls = []
+
+    class FlakyJournal(Journal):
+        def __init__(self, path):
+            calls.append(path)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            super().__init__(path)
+
+    monkeypatch.setattr(db, "Journal", FlakyJournal)
+    pool = JournalPool()
+    with pytest.raises(OSError):
+        pool.get("Sara")
+    assert pool.get("Sara").path == user_db_path("Sara")
+    assert len(calls) == 2
@@ -0,0 +1,174 @@
+# tests/test_pnl_parity.py
+"""موتور برداری PnL در برابر نسخه تکی و اجرای recompute روی یک دیتابیس موقت
+
+    python -m pytest -q tests/test_pnl_parity.py
+"""
+import itertools
+import random
+
+import pandas as pd
+import pytest
+
+from analytics import calculate_pnl_and_rr, calculate_pnl_and_rr_df, fee_rates
+from db import (
+    connect_db, create_tables, load_rollup_summary, load_trade_summary, save_trades,
+)
+from recompute import main, recompute_pnl
+
+TRADE_TYPES = ["spot", "futures"]
+SIDES = ["buy", "sell", "BUY", ""]
+LEVERAGES = [1.0, 3.0, 20.0]
+PRICES = [(100.0, 110.0), (100.0, 92.5), (0.1234, 0.1301), (61234.5, 61234.5)]
+FEES = [(0.0, 0.0, 0.0), (0.001, 0.001, 0.0), (0.0002, 0.0005, 0.0003), (0.0, 0.0, -0.0004)]
+
+def _trades():
+    trades = []
+    grid = itertools.product(TRADE_TYPES, SIDES, LEVERAGES, PRICES, [0.0, 12.5])
+    for i, (trade_type, side, leverage, (entry, exit_p), risk) in enumerate(grid, 1):
+        trades.append({
+            "id": i, "symbol": "BTCUSDT", "trade_type": trade_type, "side": side,
+            "leverage": leverage, "entry_price": entry, "exit_price": exit_p,
+            "qty": 0.75, "risk": risk, "trade_date": f"2024-01-01T00:{i % 60:02d}:00",
+        })
+    return trades
+
+def _expected(trade, entry_fee, exit_fee, funding_rate):
+    """PnL مرجع با کارمزد: سود خام نسخه تکی منهای کارمزد ورود/خروج و فاندینگ"""
+    side = trade["side"].lower()
+    if side not in ("buy", "sell"):
+        return 0.0, 0.0
+    multiplier = trade["leverage"] if trade["trade_type"] == "futures" else 1.0
+    direction = 1 if side == "buy" else -1
+    size = trade["qty"] * multiplier
+    pnl = direction * (trade["exit_price"] - trade["entry_price"]) * size
+    pnl -= trade["entry_price"] * size * entry_fee + trade["exit_price"] * size * exit_fee
+    if trade["trade_type"] == "futures":
+        pnl -= direction * trade["entry_price"] * size * funding_rate
+    rr = pnl / trade["risk"] if trade["risk"] > 0 else 0.0
+    return round(pnl, 2), round(rr, 2)
+
+def test_zero_fees_match_scalar_exactly():
+    trades = _trades()
+    pnl, rr = calculate_pnl_and_rr_df(pd.DataFrame(trades))
+    for trade, p, r in zip(trades, pnl.tolist(), rr.tolist()):
+        assert (p, r) == tuple(float(v) for v in calculate_pnl_and_rr(trade)), trade
+
+def test_rounding_ties_match_scalar():
+    # 9.555 (در float کمی کمتر): np.round تنها 9.56 می‌داد، round پایتون 9.55
+    rng = random.Random(1)
+    trades = [{"entry_price": 750.004, "exit_price": 757.504, "qty": 1.274, "side": "buy",
+               "risk": 12.5, "leverage": 10.0, "trade_type": "spot"}]
+    for _ in range(20000):
+        entry = round(rng.uniform(10, 1000), 4)
+        trades.append({
+            "entry_price": entry, "exit_price": round(entry * rng.uniform(0.98, 1.02), 4),
+            "qty": round(rng.uniform(0.1, 3), 3), "side": rng.choice(["buy", "sell"]),
+            "risk": rng.choice([0.0, 12.5, 7.3]), "leverage": rng.choice([1.0, 5.0, 10.0]),
+            "trade_type": rng.choice(["spot", "futures"]),
+        })
+    pnl, rr = calculate_pnl_and_rr_df(pd.DataFrame(trades))
+    assert (pnl[0], rr[0]) == (9.55, 0.76)
+    assert list(zip(pnl.tolist(), rr.tolist())) == [
+        tuple(float(v) for v in calculate_pnl_and_rr(t)) for t in trades
+    ]
+
+@pytest.mark.parametrize("entry_fee, exit_fee, funding_rate", FEES)
+def test_fees_match_reference(entry_fee, exit_fee, funding_rate):
+    trades = _trades()
+    pnl, rr = calculate_pnl_and_rr_df(pd.DataFrame(trades), entry_fee, exit_fee, funding_rate)
+    for trade, p, r in zip(trades, pnl.tolist(), rr.tolist()):
+        expected_pnl, expected_rr = _expected(trade, entry_fee, exit_fee, funding_rate)
+        assert p == pytest.approx(expected_pnl, abs=0.01), trade
+        assert r == pytest.approx(expected_rr, abs=0.01), trade
+
+def test_reference_without_fees_is_scalar():
+    for trade in _trades():
+        assert _expected(trade, 0.0, 0.0, 0.0) == pytest.approx(calculate_pnl_and_rr(trade))
+
+def test_fees_only_lower_pnl():
+    df = pd.DataFrame(_trades())
+    base, _ = calculate_pnl_and_rr_df(df)
+    charged, _ = calculate_pnl_and_rr_df(df, *fee_rates("binance_futures"), 0.0003)
+    valid = df["side"].str.lower().isin(["buy", "sell"]).to_numpy()
+    # روی قیمت‌های خیلی کوچک کارمزد زیر یک سنت است و در گرد کردن گم می‌شود
+    assert (charged[valid] <= base[valid]).all()
+    assert (charged[valid] < base[valid]).any()
+    assert (charged[~valid] == 0).all()
+
+@pytest.mark.parametrize("funding_rate, long_pnl, short_pnl", [
+    # پوزیشن 2 واحد × 100 × لوریج 5 = ارزش 1000؛ فاندینگ 0.001 = 1 دلار
+    (0.001, 99.0, -99.0),     # نرخ مثبت: long می‌پردازد، short دریافت می‌کند
+    (-0.001, 101.0, -101.0),  # نرخ منفی: برعکس
+])
+def test_funding_follows_position_direction(funding_rate, long_pnl, short_pnl):
+    df = pd.DataFrame([
+        {"entry_price": 100.0, "exit_price": 110.0, "qty": 2.0, "side": side,
+         "risk": 10.0, "leverage": 5.0, "trade_type": "futures"}
+        for side in ("buy", "sell")
+    ] + [{"entry_price": 100.0, "exit_price": 110.0, "qty": 2.0, "side": "sell",
+          "risk": 10.0, "leverage": 1.0, "trade_type": "spot"}])
+    pnl, _ = calculate_pnl_and_rr_df(df, funding_rate=funding_rate)
+    assert pnl.tolist() == [long_pnl, short_pnl, -20.0]  # spot فاندینگ ندارد
+
+def test_incomplete_rows_are_zero():
+    df = pd.DataFrame([
+        {"entry_price": None, "exit_price": 110.0, "qty": 1.0, "side": "buy",
+         "risk": 5.0, "leverage": 1.0, "trade_type": "spot"},
+        {"entry_price": 100.0, "exit_price": 110.0, "qty": 1.0, "side": None,
+         "risk": 5.0, "leverage": 1.0, "trade_type": "spot"},
+    ])
+    pnl, rr = calculate_pnl_and_rr_df(df, 0.001, 0.001)
+    assert pnl.tolist() == [0.0, 0.0]
+    assert rr.tolist() == [0.0, 0.0]
+
+@pytest.fixture
+def journal(tmp_path):
+    path = str(tmp_path / "journal.db")
+    conn = connect_db(path)
+    create_tables(conn)
+    trades = [dict(t, profit_or_loss=999.0, rr_calculated=9.0) for t in _trades()]
+    for t in trades:
+        del t["id"]
+    save_trades(conn, trades)
+    yield path, conn
+    conn.close()
+
+def _stored(conn):
+    return {r[0]: (r[1], r[2]) for r in conn.execute(
+        "SELECT id, profit_or_loss, rr_calculated FROM trades ORDER BY id"
+    )}
+
+def test_recompute_rewrites_stale_results(journal):
+    path, conn = journal
+    fees = fee_rates("binance_futures", "maker", "taker")
+    result = recompute_pnl(conn, *fees, 0.0003, batch_size=7)
+
+    trades = _trades()
+    assert result == {"scanned": len(trades), "updated": len(trades)}
+    stored = _stored(conn)
+    for trade in trades:
+        assert stored[trade["id"]] == pytest.approx(_expected(trade, *fees, 0.0003), abs=0.01)
+
+    # اجرای دوباره چیزی برای بازنویسی ندارد
+    assert recompute_pnl(conn, *fees, 0.0003, batch_size=7)["updated"] == 0
+
+def test_recompute_keeps_summaries_in_sync(journal):
+    path, conn = journal
+    recompute_pnl(conn, batch_size=5)
+    stored = _stored(conn)
+    for trade in _trades():
+        assert stored[trade["id"]] == tuple(float(v) for v in calculate_pnl_and_rr(trade))
+
+    total = sum(pnl for pnl, _ in stored.values())
+    wins = sum(pnl > 0 for pnl, _ in stored.values())
+    for summary in (load_trade_summary(conn), load_rollup_summary(conn)):
+        assert summary["total_pnl"] == pytest.approx(total)
+        assert summary["wins"] == wins
+
+def test_recompute_cli(journal, capsys):
+    path, conn = journal
+    main(["--db", path, "--fees", "binance_spot", "--batch-size", "10"])
+    assert f"Recomputed {len(_trades())} trades" in capsys.readouterr().out
+    stored = _stored(conn)
+    for trade in _trades():
+        assert stored[trade["id"]] == pytest.approx(_expected(trade, 0.001, 0.001, 0.0), abs=0.01)
@@ -0,0 +1,93 @@
+# tests/test_reports.py
+"""ساخت گزارش در پس‌زمینه: نسخه قدیمی، خطای ساخت و تلاش دوباره
+
+    python -m pytest -q tests/test_reports.py
+"""
+import logging
+
+import pytest
+
+import reports
+from db import connect_db, create_tables, save_trade
+from reports import ReportWorker
+
+TRADE = {
+    "symbol": "BTCUSDT", "entry_price": 100.0, "exit_price": 110.0, "side": "buy",
+    "qty": 1.0, "risk": 5.0, "trade_type": "spot", "leverage": 1.0,
+    "profit_or_loss": 10.0, "rr_calculated": 2.0, "trade_date": "2024-01-02T10:00:00",
+}
+
+class FlakyBuild:
+    """ساخت گزارشی که با fail=True خطا می‌دهد و تعداد ساخت‌ها را می‌شمارد"""
+
+    def __init__(self):
+        self.fail = False
+        self.calls = 0
+
+    def __call__(self, conn):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("boom")
+        count = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+        return {"count": count}, {"count": 0.0}
+
+@pytest.fixture
+def journal(tmp_path):
+    path = str(tmp_path / "journal.db")
+    conn = connect_db(path)
+    create_tables(conn)
+    yield path, conn
+    conn.close()
+
+def test_failed_refresh_keeps_the_old_report_and_reports_the_error(journal, caplog):
+    path, conn = journal
+    build = FlakyBuild()
+    worker = ReportWorker(path, build)
+    report, stale = worker.get()
+    assert report.data == {"count": 0} and not stale and worker.error is None
+
+    build.fail = True
+    save_trade(conn, TRADE)
+    with caplog.at_level(logging.ERROR, logger="journal.reports"):
+        report, stale = worker.get(wait=5)
+    assert report.data == {"count": 0} and stale
+    assert str(worker.error) == "boom"
+    assert "report build failed" in caplog.text
+
+    # همان نسخه داده تا RETRY_SECONDS دوباره ساخته نمی‌شود
+    for _ in range(3):
+        assert worker.get(wait=0.05)[1]
+    assert build.calls == 2
+
+    # commit تازه یا گذشتن RETRY_SECONDS ساخت را دوباره امتحان می‌کند
+    build.fail = False
+    save_trade(conn, TRADE)
+    report, stale = worker.get(wait=5)
+    assert report.data == {"count": 2} and not stale
+    assert worker.error is None
+
+def test_retry_after_delay_for_the_same_version(journal, monkeypatch):
+    path, conn = journal
+    build = FlakyBuild()
+    worker = ReportWorker(path, build)
+    worker.get()
+    build.fail = True
+    save_trade(conn, TRADE)
+    worker.get(wait=5)
+    assert build.calls == 2
+
+    build.fail = False
+    monkeypatch.setattr(reports, "RETRY_SECONDS", 0)
+    report, stale = worker.get(wait=5)
+    assert report.data == {"count": 1} and not stale and build.calls == 3
+
+def test_first_build_failure_is_raised(journal):
+    path, _ = journal
+    build = FlakyBuild()
+    build.fail = True
+    worker = ReportWorker(path, build)
+    with pytest.raises(RuntimeError):
+        worker.get()
+    with pytest.raises(RuntimeError):
+        worker.get()
+    assert build.calls == 1
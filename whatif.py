@@ -0,0 +1,204 @@
+# whatif.py
+"""بازپخش «اگر...» روی معاملات ثبت‌شده و مقایسه نتیجه با واقعیت
+
+    python whatif.py --preset skip_fomo --preset full_compliance --preset max_leverage_5
+    python whatif.py --scenario '{"name": "BTC, 3x", "symbols": ["BTCUSDT"], "max_leverage": 3}'
+
+هر سناریو یک دیکشنری (قابل نوشتن در JSON) است.
+فیلترها، یعنی کدام معاملات گرفته می‌شدند:
+    skip_tags       معامله با هر کدام از این برچسب‌ها گرفته نمی‌شد
+    require_tags    فقط معاملات با دست‌کم یکی از این برچسب‌ها
+    min_compliance  حداقل strategy_compliance_rate (معاملات بدون ثبت رعایت کنار می‌روند)
+    strategies      شناسه استراتژی‌ها (0 = بدون استراتژی)
+    symbols, sides, trade_types, hours, weekdays
+تغییرها، که PnL و R:R ردیف‌های تغییرکرده را با calculate_pnl_and_rr_df دوباره حساب می‌کنند:
+    max_leverage    سقف لوریج (فقط futures)
+    qty_scale       ضریب اندازه پوزیشن
+    fees            جدول کارمزد از FEE_SCHEDULES (taker در ورود و خروج)
+ردیف‌هایی که تغییری نمی‌کنند PnL ذخیره‌شده خود را نگه می‌دارند. برچسب‌ها بدون
+حساسیت به حروف بزرگ و کوچک مقایسه می‌شوند.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from db import (
+    add_journal_arguments, connect_db, create_tables, decode_tags, journal_path_from_args,
+    load_trades_frame,
+)
+from analytics import FEE_SCHEDULES, calculate_pnl_and_rr_df, fee_rates
+from risk import _state_from_arrays
+
+FILTER_KEYS = (
+    "skip_tags", "require_tags", "min_compliance", "strategies",
+    "symbols", "sides", "trade_types", "hours", "weekdays",
+)
+TRANSFORM_KEYS = ("max_leverage", "qty_scale", "fees")
+
+PRESET_SCENARIOS = {
+    "skip_fomo": {"name": "Skip FOMO trades", "skip_tags": ["fomo"]},
+    "full_compliance": {"name": "Only fully compliant trades", "min_compliance": 1.0},
+    "max_leverage_5": {"name": "Leverage capped at 5x", "max_leverage": 5},
+}
+
+SCENARIO_COLUMNS = [
+    "scenario", "trades", "skipped", "total_pnl", "pnl_change", "win_rate", "avg_rr",
+    "expectancy", "profit_factor", "max_drawdown", "sharpe",
+]
+ACTUAL = "Actual"
+
+def check_scenario(scenario):
+    """کلید ناشناخته یا جدول کارمزد نامعتبر -> ValueError"""
+    unknown = set(scenario) - set(FILTER_KEYS) - set(TRANSFORM_KEYS) - {"name"}
+    if unknown:
+        raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+    if scenario.get("fees") is not None and scenario["fees"] not in FEE_SCHEDULES:
+        raise ValueError(f"Unknown fee schedule: {scenario['fees']}")
+    return scenario
+
+class Replay:
+    """ستون‌های معاملات یک بار به ترتیب زمانی آماده می‌شوند؛ هر سناریو فقط یک
+    ماسک و محاسبه دوباره برداری ردیف‌های تغییرکرده است."""
+
+    def __init__(self, df):
+        df = df.sort_values(["trade_ts", "id"], na_position="last").reset_index(drop=True)
+        self.df = df
+        self.n = len(df)
+        self.ids = df["id"].to_numpy()
+        self.timed = df["trade_ts"].notna().to_numpy()
+        self.ts = df["trade_ts"].to_numpy(dtype="float64", na_value=np.nan)
+        self.day = df["trade_day"].to_numpy(dtype="float64", na_value=np.nan)
+        self.pnl = np.nan_to_num(df["profit_or_loss"].to_numpy(dtype="float64", na_value=np.nan))
+        self.rr = np.nan_to_num(df["rr_calculated"].to_numpy(dtype="float64", na_value=np.nan))
+        self.leverage = df["leverage"].to_numpy(dtype="float64", na_value=np.nan)
+        self.futures = (df["trade_type"] == "futures").to_numpy()
+        self.compliance = df["strategy_compliance_rate"].to_numpy(dtype="float64", na_value=np.nan)
+        self.strategy = df["strategy_id"].fillna(0).to_numpy(dtype="int64")
+        # برچسب‌ها: هر ترکیب یکتا (دسته tags_json) فقط یک بار decode می‌شود
+        tags = df["tags_json"].astype("category")
+        self._tag_sets = [
+            {str(tag).casefold() for tag in decode_tags(raw)} for raw in tags.cat.categories
+        ]
+        self._tag_codes = tags.cat.codes.to_numpy()
+        self.actual = self._metrics(ACTUAL, np.ones(self.n, dtype=bool), self.pnl, self.rr)
+
+    def _has_tag(self, tags):
+        wanted = {str(tag).casefold() for tag in tags}
+        # کد -1 (بدون tags_json) به آخرین خانه، یعنی False، می‌رسد
+        hits = np.array([bool(s & wanted) for s in self._tag_sets] + [False])
+        return hits[self._tag_codes]
+
+    def _isin(self, column, values):
+        return self.df[column].isin(list(values)).to_numpy()
+
+    def _keep(self, scenario):
+        keep = np.ones(self.n, dtype=bool)
+        if scenario.get("skip_tags"):
+            keep &= ~self._has_tag(scenario["skip_tags"])
+        if scenario.get("require_tags"):
+            keep &= self._has_tag(scenario["require_tags"])
+        if scenario.get("min_compliance") is not None:
+            with np.errstate(invalid="ignore"):
+                keep &= self.compliance >= scenario["min_compliance"]
+        if scenario.get("strategies") is not None:
+            keep &= np.isin(self.strategy, list(scenario["strategies"]))
+        for key, column in (("symbols", "symbol"), ("sides", "side"), ("trade_types", "trade_type"),
+                            ("hours", "trade_hour"), ("weekdays", "trade_weekday")):
+            if scenario.get(key) is not None:
+                keep &= self._isin(column, scenario[key])
+        return keep
+
+    def _transform(self, scenario, keep):
+        """(pnl, rr) بعد از تغییرها؛ فقط ردیف‌های نگه‌داشته‌ای که واقعاً عوض می‌شوند حساب می‌شوند"""
+        cap = scenario.get("max_leverage")
+        scale = scenario.get("qty_scale")
+        fees = scenario.get("fees")
+        if cap is None and scale in (None, 1) and fees in (None, "none"):
+            return self.pnl, self.rr
+        changed = np.zeros(self.n, dtype=bool)
+        if cap is not None:
+            changed |= self.futures & (self.leverage > cap)
+        if scale not in (None, 1) or fees not in (None, "none"):
+            changed[:] = True
+        rows = np.flatnonzero(changed & keep)
+        sub = self.df.iloc[rows]
+        if cap is not None:
+            sub = sub.assign(leverage=np.minimum(sub["leverage"].to_numpy(dtype="float64"), cap))
+        if scale not in (None, 1):
+            sub = sub.assign(qty=sub["qty"].to_numpy(dtype="float64") * scale)
+        entry_fee, exit_fee = fee_rates(fees or "none")
+        pnl, rr = self.pnl.copy(), self.rr.copy()
+        pnl[rows], rr[rows] = calculate_pnl_and_rr_df(sub, entry_fee, exit_fee)
+        return pnl, rr
+
+    def _metrics(self, name, keep, pnl, rr):
+        trades = int(keep.sum())
+        kept = pnl[keep]
+        timed = keep & self.timed
+        risk = _state_from_arrays(
+            self.ids[timed], self.ts[timed], self.day[timed], pnl[timed], rr[timed]
+        ).metrics() or {}
+        return {
+            "scenario": name,
+            "trades": trades,
+            "skipped": self.n - trades,
+            "total_pnl": float(kept.sum()),
+            "win_rate": float((kept > 0).mean()) if trades else 0.0,
+            "avg_rr": float(rr[keep].mean()) if trades else 0.0,
+            "expectancy": float(kept.mean()) if trades else 0.0,
+            "profit_factor": risk.get("profit_factor"),
+            "max_drawdown": risk.get("max_drawdown", 0.0),
+            "sharpe": risk.get("sharpe"),
+        }
+
+    def run(self, scenario):
+        """شاخص‌های یک سناریو (همان کلیدهای actual)"""
+        check_scenario(scenario)
+        keep = self._keep(scenario)
+        pnl, rr = self._transform(scenario, keep)
+        return self._metrics(scenario.get("name") or "Scenario", keep, pnl, rr)
+
+    def compare(self, scenarios):
+        """جدول واقعیت و سناریوها کنار هم، با تفاوت PnL هر سناریو با واقعیت"""
+        rows = [self.actual] + [self.run(s) for s in scenarios]
+        table = pd.DataFrame(rows)
+        table["pnl_change"] = table["total_pnl"] - self.actual["total_pnl"]
+        return table[SCENARIO_COLUMNS]
+
+def compare_scenarios(df, scenarios):
+    """Replay(df).compare(scenarios) برای یک بار مقایسه"""
+    return Replay(df).compare(scenarios)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the journal under what-if scenarios.")
+    parser.add_argument("--preset", action="append", default=[], choices=sorted(PRESET_SCENARIOS))
+    parser.add_argument("--scenario", action="append", default=[], metavar="JSON",
+                        help="scenario as a JSON object (see module docstring for keys)")
+    parser.add_argument("--scenarios-file", help="JSON file with a list of scenarios")
+    add_journal_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [PRESET_SCENARIOS[name] for name in args.preset]
+    try:
+        scenarios += [json.loads(raw) for raw in args.scenario]
+        if args.scenarios_file:
+            with open(args.scenarios_file, encoding="utf-8") as f:
+                scenarios += json.load(f)
+        for scenario in scenarios:
+            check_scenario(scenario)
+    except ValueError as e:
+        sys.exit(f"Invalid scenario: {e}")
+    if not scenarios:
+        scenarios = list(PRESET_SCENARIOS.values())
+
+    conn = connect_db(journal_path_from_args(args))
+    create_tables(conn)
+    table = compare_scenarios(load_trades_frame(conn), scenarios)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+if __name__ == "__main__":
+    main()